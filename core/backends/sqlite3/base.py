@@ -0,0 +1,27 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Backend SQLite avec les options « init_command » et « transaction_mode » de Django 5.1."""
+
+    init_command = ''
+    transaction_mode = None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Options propres au backend : sqlite3.connect() les refuserait
+        self.init_command = params.pop('init_command', '')
+        self.transaction_mode = params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for statement in self.init_command.split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # BEGIN IMMEDIATE : le verrou d'écriture est attendu (busy_timeout) dès l'ouverture, au lieu
+        # d'un « database is locked » immédiat quand une transaction de lecture passe en écriture
+        self.cursor().execute(f'BEGIN {self.transaction_mode}' if self.transaction_mode else 'BEGIN')
@@ -0,0 +1,51 @@
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundQueue:
+    """File de tâches en mémoire servie par des threads du processus courant."""
+
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        # Mode synchrone (tests, commandes) : exécution immédiate dans l'appelant
+        if not getattr(settings, 'BACKGROUND_TASKS_ASYNC', True):
+            func(*args, **kwargs)
+            return
+        self._start()
+        self._queue.put((func, args, kwargs))
+
+    def join(self):
+        self._queue.join()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'{self.name}-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            func, args, kwargs = self._queue.get()
+            close_old_connections()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception(f"Background task {func.__name__} failed on queue {self.name}")
+            finally:
+                connections.close_all()
+                self._queue.task_done()
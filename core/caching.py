@@ -0,0 +1,138 @@
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 3600)
+# Marqueur rangé sous la clé d'une page dont le contenu dépend du cookie CSRF
+VARIES_ON_CSRF_COOKIE = 'varies-on-csrf-cookie'
+
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+def record(name, hit):
+    with _metrics_lock:
+        _metrics[(name, 'hits' if hit else 'misses')] += 1
+
+
+def metrics_snapshot():
+    # Compteurs propres au processus courant (un worker gunicorn = un jeu de compteurs)
+    with _metrics_lock:
+        names = sorted({name for name, _ in _metrics})
+        entries = {}
+        for name in names:
+            hits, misses = _metrics[(name, 'hits')], _metrics[(name, 'misses')]
+            entries[name] = {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / (hits + misses), 3)}
+    return {'pid': os.getpid(), 'entries': entries}
+
+
+def _generation_key(namespace):
+    return f'cache_generation:{namespace}'
+
+
+def generations(namespaces):
+    """Numéro de génération de chaque espace ; l'invalidation l'incrémente."""
+    if not namespaces:
+        return []
+    keys = [_generation_key(namespace) for namespace in namespaces]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            # Valeur de départ horodatée : une génération évincée ne ressert jamais d'anciennes entrées
+            cache.add(key, int(time.time() * 1000), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def invalidate(*namespaces):
+    for namespace in namespaces:
+        try:
+            cache.incr(_generation_key(namespace))
+        except ValueError:
+            cache.set(_generation_key(namespace), int(time.time() * 1000), None)
+
+
+def _key(prefix, parts):
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'{prefix}:{digest}'
+
+
+def cached_value(name, namespaces, builder, timeout=PAGE_CACHE_TIMEOUT):
+    key = _key(f'value:{name}', generations(namespaces))
+    value = cache.get(key)
+    record(name, value is not None)
+    if value is None:
+        value = builder()
+        cache.set(key, value, timeout)
+    return value
+
+
+def cached_fragment(name, parts, builder, timeout=FRAGMENT_CACHE_TIMEOUT):
+    key = _key(f'fragment:{name}', parts)
+    html = cache.get(key)
+    record(name, html is not None)
+    if html is None:
+        html = builder()
+        cache.set(key, html, timeout)
+    return html
+
+
+def _has_pending_messages(request):
+    return bool(request.COOKIES.get('messages')) or '_messages' in getattr(request, 'session', {})
+
+
+def _uses_csrf_token(request):
+    # get_token() demande au middleware CSRF de (re)poser le cookie
+    return bool(request.META.get('CSRF_COOKIE_NEEDS_UPDATE'))
+
+
+def cache_anonymous_page(namespaces=(), timeout=PAGE_CACHE_TIMEOUT):
+    """Met en cache la réponse complète pour les visiteurs non connectés.
+
+    Une page qui contient un jeton CSRF varie selon le cookie CSRF du visiteur, comme avec
+    Vary: Cookie : la clé de base ne garde qu'un marqueur, la page est rangée sous une clé
+    qui inclut le cookie, et n'est jamais mise en cache pour un visiteur qui n'en a pas encore.
+    """
+    def decorator(view_func):
+        name = f'page:{view_func.__name__}'
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD') or request.user.is_authenticated
+                    or _has_pending_messages(request)):
+                return view_func(request, *args, **kwargs)
+
+            parts = [request.get_full_path(), *generations(namespaces)]
+            csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+            key = _key(name, parts)
+            response = cache.get(key)
+            if response == VARIES_ON_CSRF_COOKIE:
+                key = _key(name, [*parts, csrf_cookie])
+                response = cache.get(key) if csrf_cookie else None
+            record(name, response is not None)
+            if response is not None:
+                return response
+
+            response = view_func(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+            # Comme le cache de Django : pas de réponse qui pose des cookies
+            if response.status_code != 200 or response.streaming or response.cookies:
+                return response
+            if _uses_csrf_token(request):
+                cache.set(_key(name, parts), VARIES_ON_CSRF_COOKIE, timeout)
+                if not csrf_cookie:
+                    # Le middleware va poser un nouveau cookie : jeton propre à ce visiteur
+                    return response
+                key = _key(name, [*parts, csrf_cookie])
+            cache.set(key, response, timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,56 @@
+from core.models import ClubMessage
+
+CHAT_PAGE_SIZE = 30  # Messages de premier niveau par page de la messagerie d'un club
+
+
+def _attach_replies(messages):
+    # Réponses de toute la page en une requête, rangées dans message.chat_replies
+    by_id = {message.pk: message for message in messages}
+    for message in messages:
+        message.chat_replies = []
+    replies = ClubMessage.objects.filter(parent_id__in=by_id).select_related('sender').order_by('id')
+    for reply in replies:
+        by_id[reply.parent_id].chat_replies.append(reply)
+    return messages
+
+
+def chat_page(club, before_id=None, limit=CHAT_PAGE_SIZE):
+    """(messages, has_more) : les limit derniers messages avant before_id, du plus ancien au plus récent."""
+    queryset = ClubMessage.objects.filter(club=club, parent__isnull=True).select_related('sender')
+    if before_id is not None:
+        queryset = queryset.filter(id__lt=before_id)
+    rows = list(queryset.order_by('-id')[:limit + 1])
+    messages = rows[:limit][::-1]
+    return _attach_replies(messages), len(rows) > limit
+
+
+def chat_delta(club, after_id, limit=CHAT_PAGE_SIZE):
+    """
+    (messages, replies, has_more) : au plus limit messages postés après after_id, réponses comprises.
+    has_more : le client repart du plus grand id reçu pour la suite.
+    """
+    rows = list(
+        ClubMessage.objects.filter(club=club, id__gt=after_id).select_related('sender').order_by('id')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    messages = {row.pk: row for row in rows if row.parent_id is None}
+    replies = []
+    for row in rows:
+        row.chat_replies = []
+        if row.parent_id is None:
+            continue
+        # Réponse à un nouveau message : forcément dans rows, rangée sous son parent
+        parent = messages.get(row.parent_id)
+        if parent is not None:
+            parent.chat_replies.append(row)
+        else:
+            replies.append(row)
+    return list(messages.values()), replies, has_more
+
+
+def last_message_id(messages):
+    # Plus grand id affiché, réponses comprises : point de départ du polling
+    ids = [message.pk for message in messages]
+    ids += [reply.pk for message in messages for reply in message.chat_replies]
+    return max(ids, default=0)
@@ -0,0 +1,171 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, When
+from django.db.models.functions import Coalesce
+
+from core.models import ClubMembership, ClubMessage, Conversation, ConversationParticipant, Message
+
+INBOX_PAGE_SIZE = 30
+
+
+def direct_key(user_id, other_user_id):
+    low, high = sorted([user_id, other_user_id])
+    return f'user:{low}:{high}'
+
+
+def club_key(club_id):
+    return f'club:{club_id}'
+
+
+def _direct_conversation(sender_id, recipient_id):
+    conversation, created = Conversation.objects.get_or_create(
+        key=direct_key(sender_id, recipient_id), defaults={'kind': 'USER'}
+    )
+    if created:
+        ConversationParticipant.objects.bulk_create([
+            ConversationParticipant(conversation=conversation, user_id=sender_id, other_user_id=recipient_id),
+            ConversationParticipant(conversation=conversation, user_id=recipient_id, other_user_id=sender_id),
+        ])
+    return conversation
+
+
+def _club_conversation(club_id):
+    conversation, created = Conversation.objects.get_or_create(
+        key=club_key(club_id), defaults={'kind': 'CLUB', 'club_id': club_id}
+    )
+    if created:
+        _add_participants(conversation, ClubMembership.objects.filter(club_id=club_id).values_list('user_id', flat=True))
+    return conversation
+
+
+def _add_participants(conversation, user_ids):
+    ConversationParticipant.objects.bulk_create(
+        [
+            ConversationParticipant(
+                conversation=conversation, user_id=user_id, last_message_at=conversation.last_message_at
+            )
+            for user_id in user_ids
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def _record(conversation, sender_id, content, created_at):
+    Conversation.objects.filter(pk=conversation.pk).update(
+        last_message=content, last_message_at=created_at, last_sender_id=sender_id
+    )
+    # Un seul UPDATE : +1 non lu pour tous sauf l'expéditeur
+    ConversationParticipant.objects.filter(conversation=conversation).update(
+        last_message_at=created_at,
+        unread_count=Case(
+            When(user_id=sender_id, then=F('unread_count')),
+            default=F('unread_count') + 1,
+        ),
+    )
+
+
+def record_direct_message(message):
+    with transaction.atomic():
+        conversation = _direct_conversation(message.sender_id, message.recipient_id)
+        _record(conversation, message.sender_id, message.content, message.created_at)
+
+
+def record_club_message(message):
+    with transaction.atomic():
+        conversation = _club_conversation(message.club_id)
+        _record(conversation, message.sender_id, message.content, message.created_at)
+
+
+def mark_direct_read(user, other_user):
+    Message.objects.filter(sender=other_user, recipient=user, is_read=False).update(is_read=True)
+    ConversationParticipant.objects.filter(
+        conversation__key=direct_key(user.pk, other_user.pk), user=user
+    ).update(unread_count=0)
+
+
+def mark_club_read(user, club):
+    # Un seul UPDATE : le filigrane avance jusqu'au dernier message du club
+    latest = ClubMessage.objects.filter(club=club).order_by('-id').values('id')[:1]
+    ClubMembership.objects.filter(user=user, club=club).update(last_read_message_id=Coalesce(Subquery(latest), 0))
+    ConversationParticipant.objects.filter(conversation__key=club_key(club.pk), user=user).update(unread_count=0)
+
+
+def add_club_participants(club_id, user_ids):
+    _add_participants(_club_conversation(club_id), user_ids)
+
+
+def remove_club_participants(club_id, user_ids=None):
+    participants = ConversationParticipant.objects.filter(conversation__key=club_key(club_id))
+    if user_ids is not None:
+        participants = participants.filter(user_id__in=user_ids)
+    participants.delete()
+
+
+def inbox_entries(user):
+    return (
+        ConversationParticipant.objects.filter(user=user)
+        .select_related('conversation', 'conversation__club', 'other_user')
+        .order_by(F('last_message_at').desc(nulls_last=True), '-id')
+    )
+
+
+def inbox_item(entry):
+    conversation = entry.conversation
+    if conversation.kind == 'CLUB':
+        return {
+            'type': 'club',
+            'id': conversation.club_id,
+            'name': conversation.club.name,
+            'last_message': conversation.last_message,
+            'last_message_time': conversation.last_message_at,
+            'unread_count': entry.unread_count,
+            'avatar_url': "https://ui-avatars.com/api/?name=C&background=random",
+        }
+    return {
+        'type': 'user',
+        'id': entry.other_user_id,
+        'name': entry.other_user.username,
+        'last_message': conversation.last_message,
+        'last_message_time': conversation.last_message_at,
+        'unread_count': entry.unread_count,
+        'avatar_url': f"https://ui-avatars.com/api/?name={entry.other_user.username}&background=random",
+    }
+
+
+def rebuild_conversations():
+    """Reconstruit l'index des conversations à partir des messages existants."""
+    with transaction.atomic():
+        Conversation.objects.all().delete()
+
+        for message in Message.objects.order_by('created_at', 'id').iterator():
+            conversation = _direct_conversation(message.sender_id, message.recipient_id)
+            _record(conversation, message.sender_id, message.content, message.created_at)
+
+        # Les clubs sans message apparaissent aussi dans la messagerie des membres
+        club_ids = ClubMembership.objects.values_list('club_id', flat=True).distinct()
+        for club_id in club_ids:
+            _club_conversation(club_id)
+        for message in ClubMessage.objects.order_by('created_at', 'id').iterator():
+            conversation = _club_conversation(message.club_id)
+            _record(conversation, message.sender_id, message.content, message.created_at)
+
+        # Non lus des conversations directes : repris des drapeaux is_read, en un UPDATE
+        unread = Message.objects.filter(
+            sender_id=OuterRef('other_user_id'), recipient_id=OuterRef('user_id'), is_read=False
+        ).order_by().values('recipient_id').annotate(total=Count('id')).values('total')
+        ConversationParticipant.objects.filter(other_user__isnull=False).update(
+            unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), 0)
+        )
+
+        # Non lus des clubs : messages des autres membres au-delà du filigrane de lecture
+        watermark = ClubMembership.objects.filter(
+            club_id=OuterRef('club_id'), user_id=OuterRef(OuterRef('user_id'))
+        ).values('last_read_message_id')[:1]
+        club_unread = (
+            ClubMessage.objects.filter(club__conversation=OuterRef('conversation_id'))
+            .exclude(sender_id=OuterRef('user_id'))
+            .filter(id__gt=Coalesce(Subquery(watermark), 0))
+            .order_by().values('club_id').annotate(total=Count('id')).values('total')
+        )
+        ConversationParticipant.objects.filter(other_user__isnull=True).update(
+            unread_count=Coalesce(Subquery(club_unread, output_field=IntegerField()), 0)
+        )
@@ -0,0 +1,129 @@
+import logging
+from collections import defaultdict
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+# (modèle compté, champ compteur, modèle source, clé étrangère de la source vers le modèle compté)
+COUNTERS = [
+    ('core.Club', 'member_count', 'core.ClubMembership', 'club'),
+    ('core.User', 'clubs_joined_count', 'core.ClubMembership', 'user'),
+    ('core.User', 'follower_count', 'core.User_followers', 'from_user'),
+    ('core.User', 'following_count', 'core.User_followers', 'to_user'),
+    ('core.Page', 'subscriber_count', 'core.Page_subscribers', 'page'),
+    ('core.Publication', 'reaction_count', 'core.Reaction', 'publication'),
+    ('core.User', 'pages_followed_count', 'core.Page_subscribers', 'user'),
+    ('core.User', 'publication_count', 'core.Publication', 'user'),
+    ('core.User', 'clubs_created_count', 'core.Club', 'creator'),
+    ('core.User', 'pages_created_count', 'core.Page', 'creator'),
+]
+
+
+def counters_for(source, apps=global_apps):
+    return [
+        (apps.get_model(model), field, fk)
+        for model, field, source_label, fk in COUNTERS
+        if apps.get_model(source_label) is source
+    ]
+
+
+def source_models(apps=global_apps):
+    return {apps.get_model(source_label) for _, _, source_label, _ in COUNTERS}
+
+
+def adjust(model, field, deltas):
+    """deltas : {pk: variation} ; un UPDATE F() par variation distincte."""
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(pk)
+    for delta, pks in by_delta.items():
+        model.objects.filter(pk__in=pks).update(**{field: F(field) + delta})
+
+
+def row_changed(source, instance, delta):
+    for model, field, fk in counters_for(source):
+        adjust(model, field, {getattr(instance, f'{fk}_id'): delta})
+
+
+def _relation_columns(m2m_field, reverse):
+    columns = (m2m_field.m2m_field_name(), m2m_field.m2m_reverse_field_name())
+    return columns[::-1] if reverse else columns
+
+
+def related_ids(m2m_field, instance, reverse, pk_set=None):
+    """Liens réellement présents : remove() reçoit les pk demandés, pas ceux qui existent."""
+    instance_fk, other_fk = _relation_columns(m2m_field, reverse)
+    rows = m2m_field.remote_field.through.objects.filter(**{f'{instance_fk}_id': instance.pk})
+    if pk_set is not None:
+        rows = rows.filter(**{f'{other_fk}_id__in': pk_set})
+    return set(rows.values_list(f'{other_fk}_id', flat=True))
+
+
+def relation_changed(m2m_field, instance, reverse, pk_set, delta):
+    # Côté instance : ±len(pk_set) ; côté pk_set : ±1 chacun
+    if not pk_set:
+        return
+    instance_fk, _ = _relation_columns(m2m_field, reverse)
+    for model, field, fk in counters_for(m2m_field.remote_field.through):
+        if fk == instance_fk:
+            adjust(model, field, {instance.pk: delta * len(pk_set)})
+        else:
+            adjust(model, field, {pk: delta for pk in pk_set})
+
+
+def count_subquery(source, fk):
+    return Coalesce(
+        Subquery(
+            source.objects.filter(**{fk: OuterRef('pk')})
+            .order_by()
+            .values(fk)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reaction_summary_changed(publication_id, reaction_type, delta, apps=global_apps):
+    summaries = apps.get_model('core.ReactionSummary').objects
+    row = summaries.filter(publication_id=publication_id, type=reaction_type)
+    if row.update(count=F('count') + delta) or delta < 0:
+        return
+    try:
+        # Première réaction de ce type : la ligne est créée, sauf si une requête concurrente l'a devancée
+        with transaction.atomic():
+            summaries.create(publication_id=publication_id, type=reaction_type, count=delta)
+    except IntegrityError:
+        row.update(count=F('count') + delta)
+
+
+def rebuild_reaction_summaries(apps=global_apps):
+    ReactionSummary = apps.get_model('core.ReactionSummary')
+    rows = (
+        apps.get_model('core.Reaction').objects.order_by()
+        .values('publication_id', 'type').annotate(total=Count('pk'))
+    )
+    with transaction.atomic():
+        ReactionSummary.objects.all().delete()
+        created = ReactionSummary.objects.bulk_create(
+            [ReactionSummary(publication_id=row['publication_id'], type=row['type'], count=row['total']) for row in rows],
+            batch_size=1000,
+        )
+    return len(created)
+
+
+def rebuild_counters(apps=global_apps):
+    """Recalcule tous les compteurs depuis les tables sources, un UPDATE par compteur."""
+    updated = {}
+    for model_label, field, source_label, fk in COUNTERS:
+        model, source = apps.get_model(model_label), apps.get_model(source_label)
+        updated[f'{model_label}.{field}'] = model.objects.update(**{field: count_subquery(source, fk)})
+    updated['core.ReactionSummary'] = rebuild_reaction_summaries(apps)
+    logger.info(f"Counters rebuilt: {updated}")
+    return updated
@@ -0,0 +1,140 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from core.models import Publication
+from core.queries import publications_for_display, with_media_type
+from core.threads import attach_threads
+
+# Rangs du fil : clubs rejoints, puis utilisateurs suivis, puis le reste
+TIER_CLUBS = 0
+TIER_FOLLOWING = 1
+TIER_OTHER = 2
+
+FEED_PAGE_SIZE = 20
+
+# Tri « les plus discutées » : (reaction_count DESC, id DESC) sur publication_discussed_idx
+SORT_DISCUSSED = 'discussed'
+# Tri « les plus populaires » : score précalculé (core.scoring), (score DESC, id DESC) sur publication_score_idx
+SORT_TOP = 'top'
+FEED_SORTS = (SORT_DISCUSSED, SORT_TOP)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(publication, sort=None):
+    if sort == SORT_DISCUSSED:
+        payload = [publication.reaction_count, publication.pk]
+    elif sort == SORT_TOP:
+        payload = [publication.score, publication.pk]
+    else:
+        payload = [publication.tier, publication.created_at.isoformat(), publication.pk]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor, sort=None):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort == SORT_DISCUSSED:
+            reaction_count, pk = payload
+            return int(reaction_count), int(pk)
+        if sort == SORT_TOP:
+            score, pk = payload
+            return float(score), int(pk)
+        tier, created_at, pk = payload
+        return int(tier), datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+def ranked_publications(user):
+    # Rang calculé en SQL : pratique pour filtrer (timelines), mais le tri sur le CASE n'utilise aucun index.
+    # Les pages du fil passent par tier_publications, une requête indexée par rang
+    joined_club_ids = user.joined_clubs.values('id')
+    following_ids = user.following.values('id')
+    return Publication.objects.annotate(
+        tier=Case(
+            When(club__in=joined_club_ids, then=Value(TIER_CLUBS)),
+            When(user__in=following_ids, then=Value(TIER_FOLLOWING)),
+            default=Value(TIER_OTHER),
+            output_field=IntegerField(),
+        )
+    ).order_by('tier', '-created_at', '-id')
+
+
+def tier_publications(user, tier):
+    """Publications d'un seul rang, annotées de ce rang, du plus récent au plus ancien."""
+    # Pas de CASE sur le rang dans l'ORDER BY : chaque rang est un parcours d'index dans l'ordre
+    joined_club_ids = user.joined_clubs.values('id')
+    following_ids = user.following.values('id')
+    if tier == TIER_CLUBS:
+        # publication_club_recent_idx
+        publications = Publication.objects.filter(club__in=joined_club_ids)
+    elif tier == TIER_FOLLOWING:
+        # publication_user_recent_idx
+        publications = Publication.objects.filter(user__in=following_ids).exclude(club__in=joined_club_ids)
+    else:
+        # publication_recent_idx, les deux premiers rangs écartés au fil du parcours
+        publications = Publication.objects.exclude(club__in=joined_club_ids).exclude(user__in=following_ids)
+    return publications.annotate(tier=Value(tier, output_field=IntegerField())).order_by('-created_at', '-id')
+
+
+def discussed_publications():
+    # Parcours de l'index dans l'ordre : ni COUNT ni tri sur la table des réactions
+    return Publication.objects.order_by('-reaction_count', '-id')
+
+
+def top_publications():
+    # Aucun calcul par requête : le score est lu dans l'index
+    return Publication.objects.order_by('-score', '-id')
+
+
+SORTED_PUBLICATIONS = {SORT_DISCUSSED: discussed_publications, SORT_TOP: top_publications}
+
+
+def after_cursor(queryset, cursor, sort=None):
+    if sort == SORT_DISCUSSED:
+        reaction_count, pk = decode_cursor(cursor, sort)
+        return queryset.filter(Q(reaction_count__lt=reaction_count) | Q(reaction_count=reaction_count, id__lt=pk))
+    if sort == SORT_TOP:
+        score, pk = decode_cursor(cursor, sort)
+        return queryset.filter(Q(score__lt=score) | Q(score=score, id__lt=pk))
+
+    # Keyset : (tier ASC, created_at DESC, id DESC) strictement après le curseur
+    tier, created_at, pk = decode_cursor(cursor)
+    return queryset.filter(
+        Q(tier__gt=tier)
+        | Q(tier=tier, created_at__lt=created_at)
+        | Q(tier=tier, created_at=created_at, id__lt=pk)
+    )
+
+
+def _page_rows(publications, user, cursor, limit, media_type=None, sort=None):
+    queryset = publications_for_display(publications, user)
+    if media_type:
+        queryset = with_media_type(queryset, media_type)
+    if cursor:
+        queryset = after_cursor(queryset, cursor, sort)
+    return list(queryset[:limit])
+
+
+def feed_page(user, cursor=None, page_size=FEED_PAGE_SIZE, media_type=None, sort=None):
+    """Retourne (publications, next_cursor) pour une page du fil."""
+    # Une ligne de plus pour savoir s'il existe une page suivante
+    limit = page_size + 1
+    if sort in SORTED_PUBLICATIONS:
+        rows = _page_rows(SORTED_PUBLICATIONS[sort](), user, cursor, limit, media_type, sort)
+    else:
+        # Une requête keyset par rang, à partir du rang du curseur, jusqu'à remplir la page
+        first_tier = decode_cursor(cursor)[0] if cursor else TIER_CLUBS
+        rows = []
+        for tier in (TIER_CLUBS, TIER_FOLLOWING, TIER_OTHER):
+            if tier >= first_tier and len(rows) < limit:
+                rows += _page_rows(tier_publications(user, tier), user, cursor, limit - len(rows), media_type)
+    publications = attach_threads(rows[:page_size])
+    next_cursor = encode_cursor(publications[-1], sort) if len(rows) > page_size else None
+    return publications, next_cursor
@@ -0,0 +1,115 @@
+import mimetypes
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+MEDIA_MAX_AGE = getattr(settings, 'MEDIA_MAX_AGE', 86400)
+# 'X-Accel-Redirect' (nginx) ou 'X-Sendfile' (Apache) : le serveur frontal envoie le fichier lui-même
+MEDIA_SENDFILE_HEADER = getattr(settings, 'MEDIA_SENDFILE_HEADER', '')
+MEDIA_SENDFILE_PREFIX = getattr(settings, 'MEDIA_SENDFILE_PREFIX', '/protected-media/')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """Fichier borné à [start, start + length) ; fileno() garde l'envoi zéro copie de gunicorn."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def parse_range(header, size):
+    """(start, end) inclus pour un en-tête Range à une seule plage, None pour tout le fichier."""
+    match = RANGE_RE.match(header or '')
+    if not match or not any(match.groups()):
+        # Plages multiples ou syntaxe inconnue : on renvoie tout le fichier (RFC 9110)
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-N : les N derniers octets
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def file_response(request, path, max_age=MEDIA_MAX_AGE, sendfile_name=None):
+    """Réponse pour un fichier local : ETag, Last-Modified, Range et envoi délégué si configuré."""
+    try:
+        stat = path.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not path.is_file():
+        raise Http404
+
+    etag = file_etag(stat)
+    headers = {'ETag': etag, 'Last-Modified': http_date(stat.st_mtime), 'Accept-Ranges': 'bytes'}
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+    elif MEDIA_SENDFILE_HEADER and sendfile_name is not None:
+        # Le frontal gère lui-même Range ; Django ne lit pas le fichier
+        response = HttpResponse(content_type=mimetypes.guess_type(path.name)[0] or 'application/octet-stream')
+        value = str(path) if MEDIA_SENDFILE_HEADER == 'X-Sendfile' else MEDIA_SENDFILE_PREFIX + sendfile_name
+        response[MEDIA_SENDFILE_HEADER] = value
+    else:
+        response = _range_or_full_response(request, path, stat.st_size, etag)
+    for name, value in headers.items():
+        response[name] = value
+    patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+def _range_or_full_response(request, path, size, etag):
+    content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+    byte_range = None
+    # If-Range : la plage n'est valable que si le fichier n'a pas changé entre-temps
+    if 'Range' in request.headers and request.headers.get('If-Range', etag) == etag:
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        return FileResponse(path.open('rb'), content_type=content_type)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = FileResponse(RangeFile(path.open('rb'), start, length), status=206, content_type=content_type)
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
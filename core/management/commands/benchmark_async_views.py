@@ -0,0 +1,291 @@
+import http.client
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.test import Client
+from django.utils.crypto import get_random_string
+
+from core.conversations import record_direct_message
+from core.models import Club, ClubMessage, Message, Publication, User
+
+# Même application, même nombre de processus : seul le serveur change
+SERVERS = {
+    'wsgi': ['zevaba.wsgi:application'],
+    'asgi': ['zevaba.asgi:application', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+BATCH_SIZE = 10
+
+# Configuration gunicorn des serveurs : --db-latency ajoute l'aller-retour d'une base distante à chaque requête SQL
+GUNICORN_CONFIG = """
+import time
+
+
+def post_worker_init(worker):
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        time.sleep({latency})
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    if {latency}:
+        connection_created.connect(install, weak=False)
+"""
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _database_url(settings_dict):
+    if connection.vendor == 'sqlite':
+        return f"sqlite:///{settings_dict['NAME']}"
+    credentials = quote(settings_dict['USER'] or '', safe='')
+    if settings_dict['PASSWORD']:
+        credentials += ':' + quote(settings_dict['PASSWORD'], safe='')
+    host = f"{settings_dict['HOST'] or 'localhost'}:{settings_dict['PORT'] or 5432}"
+    return f"postgres://{credentials}@{host}/{settings_dict['NAME']}"
+
+
+def _seed(clients):
+    author = User.objects.create_user('bench_author', password='bench')
+    chat = Club.objects.create(name='Bench chat', description='bench', creator=author)
+    joinable = Club.objects.create(name='Bench join', description='bench', creator=author)
+    publications = [Publication.objects.create(user=author, content=f'bench {n}') for n in range(200)]
+    parent = ClubMessage.objects.create(sender=author, club=chat, content='bench')
+
+    sessions = []
+    for number in range(clients):
+        user = User.objects.create_user(f'bench_client_{number}', password='bench')
+        chat.members.add(user)
+        message = Message.objects.create(sender=author, recipient=user, content=f'bonjour bench {number}')
+        record_direct_message(message)
+        client = Client()
+        client.force_login(user)
+        sessions.append(client.cookies[settings.SESSION_COOKIE_NAME].value)
+
+    return {
+        'publications': [publication.pk for publication in publications],
+        'chat': chat.pk,
+        'joinable': joinable.pk,
+        'parent': parent.pk,
+        'sessions': sessions,
+    }
+
+
+def _scenarios(fixture):
+    """{nom: (publications par requête, fabrique (rng, pas) -> (méthode, chemin, corps))}"""
+    publications = fixture['publications']
+
+    def batch(rng):
+        return [('publication', pk) for pk in rng.sample(publications, BATCH_SIZE)]
+
+    return {
+        'search_suggestions': (1, lambda rng, step: (
+            'GET', '/search_suggestions/?' + urlencode({'query': rng.choice(['ben', 'bench', 'bench_c', 'b'])}), None,
+        )),
+        'search_messages': (1, lambda rng, step: ('GET', '/search_messages/?query=bonjour', None)),
+        'like_dislike': (1, lambda rng, step: (
+            'POST', f'/like_dislike/{rng.choice(publications)}/', [('action', 'like')],
+        )),
+        'like_dislike_batch': (BATCH_SIZE, lambda rng, step: (
+            'POST', '/like_dislike/batch/', [('action', 'like'), *batch(rng)],
+        )),
+        'react': (1, lambda rng, step: (
+            'POST', f'/react/{rng.choice(publications)}/', [('type', 'THOUGHT'), ('comment', f'bench {step}')],
+        )),
+        'react_batch': (BATCH_SIZE, lambda rng, step: (
+            'POST', '/react/batch/', [('type', 'THOUGHT'), ('comment', f'bench {step}'), *batch(rng)],
+        )),
+        # Chaque client rejoint puis quitte le club : toujours une réponse 200
+        'club_subscribe': (1, lambda rng, step: (
+            'POST', f"/club/{fixture['joinable']}/{'subscribe' if step % 2 == 0 else 'unsubscribe'}/", [],
+        )),
+        'reply_to_club_message': (1, lambda rng, step: (
+            'POST', f"/club/{fixture['chat']}/message/reply/",
+            [('parent_id', fixture['parent']), ('content', f'bench {step}')],
+        )),
+    }
+
+
+def _client(port, session, build, deadline, seed, results):
+    rng = random.Random(seed)
+    csrf_token = get_random_string(CSRF_SECRET_LENGTH, CSRF_ALLOWED_CHARS)
+    headers = {
+        'Cookie': f'{settings.SESSION_COOKIE_NAME}={session}; {settings.CSRF_COOKIE_NAME}={csrf_token}',
+        'X-CSRFToken': csrf_token,
+        'Content-Type': 'application/x-www-form-urlencoded',
+    }
+    # Connexion gardée ouverte quand le serveur le permet (uvicorn) ; rouverte sinon (gunicorn sync)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies, errors, step = [], Counter(), 0
+    while time.perf_counter() < deadline:
+        method, path, data = build(rng, step)
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=urlencode(data) if data is not None else None, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors[response.status] += 1
+        except (OSError, http.client.HTTPException) as error:
+            errors[type(error).__name__] += 1
+            conn.close()
+        step += 1
+    conn.close()
+    results.append((latencies, errors))
+
+
+def _load_process(port, sessions, scenario, fixture, duration, seed):
+    # Générateur de charge : un thread par session, réparti sur plusieurs processus (le GIL ne borne pas le débit)
+    _, build = _scenarios(fixture)[scenario]
+    deadline = time.perf_counter() + duration
+    results = []
+    threads = [
+        threading.Thread(target=_client, args=(port, session, build, deadline, seed + number, results))
+        for number, session in enumerate(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [latency for latencies, _ in results for latency in latencies], sum((errors for _, errors in results), Counter())
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/s and p99 latency of the JSON endpoints under gunicorn sync (WSGI) and uvicorn (ASGI) workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Server processes, identical for both servers')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients, one session each')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per endpoint and server')
+        parser.add_argument('--load-processes', type=int, default=4)
+        parser.add_argument('--scenario', action='append', help='Only run these endpoints (repeatable)')
+        parser.add_argument(
+            '--db-latency', type=float, default=0,
+            help='Milliseconds added to every SQL query in the servers, to simulate a database over the network',
+        )
+
+    def handle(self, *args, **options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('This benchmark needs the fork start method')
+        settings_dict = connection.settings_dict
+        saved_test_name = settings_dict['TEST'].get('NAME')
+
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # Base fichier partagée avec les serveurs (la base de test SQLite est en mémoire)
+                settings_dict['TEST']['NAME'] = str(Path(directory) / 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                fixture = _seed(options['concurrency'])
+                database_url = _database_url(settings_dict)
+                # Aucune connexion ouverte ne doit être héritée par les processus fils
+                connections.close_all()
+                self.run_servers(fixture, database_url, Path(directory), options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                settings_dict['TEST']['NAME'] = saved_test_name
+
+    def run_servers(self, fixture, database_url, directory, options):
+        scenarios = _scenarios(fixture)
+        names = options['scenario'] or list(scenarios)
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+        config_path = directory / 'gunicorn_bench.py'
+        config_path.write_text(GUNICORN_CONFIG.format(latency=options['db_latency'] / 1000))
+
+        results = {}
+        for server, arguments in SERVERS.items():
+            # Chaque serveur part des mêmes adhésions : les clients commencent par rejoindre le club
+            Club.objects.get(pk=fixture['joinable']).members.clear()
+            connections.close_all()
+            port = _free_port()
+            log_path = directory / f'{server}.log'
+            with open(log_path, 'w') as log:
+                process = subprocess.Popen(
+                    [sys.executable, '-m', 'gunicorn', *arguments, '--workers', str(options['workers']),
+                     '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', '--config', str(config_path)],
+                    cwd=settings.BASE_DIR, stdout=log, stderr=subprocess.STDOUT,
+                    env={**os.environ, 'DATABASE_URL': database_url, 'DEBUG': 'False'},
+                )
+                try:
+                    self.wait_for(port, process, log_path)
+                    for name in names:
+                        results[server, name] = self.run_load(port, fixture, name, options)
+                        self.stdout.write(f'{server} {name}: ' + self.describe(scenarios[name][0], *results[server, name]))
+                finally:
+                    process.terminate()
+                    process.wait(timeout=30)
+
+        self.stdout.write('')
+        for name in names:
+            wsgi, asgi = results['wsgi', name], results['asgi', name]
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: ASGI/WSGI throughput x{asgi[1] / wsgi[1]:.2f}, p99 {wsgi[3]:.1f} -> {asgi[3]:.1f} ms'
+                if wsgi[1] and asgi[1] else f'{name}: no successful request on one of the servers'
+            ))
+
+    def wait_for(self, port, process, log_path, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'Server exited early:\n{log_path.read_text()[-2000:]}')
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'Server did not start within {timeout}s:\n{log_path.read_text()[-2000:]}')
+
+    def run_load(self, port, fixture, scenario, options):
+        sessions = fixture['sessions']
+        processes = max(1, min(options['load_processes'], len(sessions)))
+        context = multiprocessing.get_context('fork')
+        started = time.perf_counter()
+        with context.Pool(processes) as pool:
+            outcomes = pool.starmap(_load_process, [
+                (port, sessions[number::processes], scenario, fixture, options['duration'], number * 1000)
+                for number in range(processes)
+            ])
+        elapsed = time.perf_counter() - started
+        latencies = sorted(latency * 1000 for process_latencies, _ in outcomes for latency in process_latencies)
+        errors = sum((process_errors for _, process_errors in outcomes), Counter())
+        if not latencies:
+            return 0, 0, 0, 0, errors
+        return (
+            len(latencies),
+            len(latencies) / elapsed,
+            latencies[len(latencies) // 2],
+            latencies[int(len(latencies) * 0.99)],
+            errors,
+        )
+
+    def describe(self, items, requests, rate, p50, p99, errors):
+        per_item = f', {rate * items:.0f} publications/s' if items > 1 else ''
+        return (
+            f'{requests} requests, {rate:.0f} req/s{per_item}, p50 {p50:.1f} ms, p99 {p99:.1f} ms, '
+            f'{sum(errors.values())} errors {dict(errors) if errors else ""}'
+        ).rstrip()
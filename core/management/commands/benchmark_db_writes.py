@@ -0,0 +1,129 @@
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import DatabaseError, connection, connections
+from django.test import override_settings
+
+from core.conversations import record_direct_message
+from core.models import Club, Message, Publication, Reaction, User
+from core.votes import toggle_vote
+
+
+# Options de réglage fin SQLite (core.backends.sqlite3), retirées du mode de référence
+TUNING_OPTIONS = ('init_command', 'transaction_mode')
+
+
+def _modes(settings_dict):
+    """{nom: (OPTIONS, CONN_MAX_AGE)} : connexion par requête sans réglage, puis configuration du projet."""
+    options = settings_dict['OPTIONS']
+    baseline = {name: value for name, value in options.items() if name not in TUNING_OPTIONS}
+    return {
+        f'{connection.vendor}-baseline': (baseline, 0),
+        f'{connection.vendor}-configured': (options, settings_dict['CONN_MAX_AGE']),
+    }
+
+
+def _seed(workers):
+    users = [User.objects.create_user(f'bench_writer_{number}', password='bench') for number in range(workers + 1)]
+    club = Club.objects.create(name='Bench', description='bench', creator=users[0])
+    publications = [Publication.objects.create(user=users[0], club=club, content=f'bench {n}') for n in range(10)]
+    return [user.pk for user in users], [publication.pk for publication in publications]
+
+
+def _write(step, user, other, publication):
+    # Une « requête » : like, réaction ou message, en autocommit comme dans les vues
+    kind = step % 3
+    if kind == 0:
+        toggle_vote(publication, user, 'like')
+    elif kind == 1:
+        Reaction.objects.create(user=user, publication=publication, comment=f'bench {step}')
+    else:
+        message = Message.objects.create(sender=user, recipient=other, content=f'bench {step}')
+        record_direct_message(message)
+
+
+def _worker(worker, writes, user_ids, publication_ids):
+    user = User.objects.get(pk=user_ids[worker + 1])
+    other = User.objects.get(pk=user_ids[0])
+    publications = list(Publication.objects.filter(pk__in=publication_ids))
+    connections.close_all()
+
+    latencies, errors = [], 0
+    for step in range(writes):
+        # Début et fin de requête : CONN_MAX_AGE décide si la connexion survit
+        request_started.send(sender=None)
+        started = time.perf_counter()
+        try:
+            _write(step, user, other, publications[step % len(publications)])
+            latencies.append(time.perf_counter() - started)
+        except DatabaseError:
+            errors += 1
+        finally:
+            request_finished.send(sender=None)
+    connections.close_all()
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = 'Measure write throughput of concurrent worker processes on a throwaway database, per connection mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--writes', type=int, default=200, help='Writes per worker')
+
+    def handle(self, *args, **options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('This benchmark needs the fork start method')
+        workers, writes = options['workers'], options['writes']
+        settings_dict = connection.settings_dict
+        if connection.vendor == 'sqlite' and 'init_command' not in settings_dict['OPTIONS']:
+            self.stdout.write(self.style.WARNING(
+                'SQLite tuning is off: the configured mode only differs by CONN_MAX_AGE. '
+                'Run with SQLITE_TUNED=1 to measure it.'
+            ))
+        saved = {key: settings_dict[key] for key in ('OPTIONS', 'CONN_MAX_AGE')}
+
+        for mode, (db_options, conn_max_age) in _modes(settings_dict).items():
+            with tempfile.TemporaryDirectory() as directory:
+                if connection.vendor == 'sqlite':
+                    # Base fichier partagée par les processus (la base de test SQLite est en mémoire)
+                    settings_dict['TEST']['NAME'] = str(Path(directory) / 'bench.sqlite3')
+                settings_dict.update(OPTIONS=db_options, CONN_MAX_AGE=conn_max_age)
+                try:
+                    with override_settings(BACKGROUND_TASKS_ASYNC=False):
+                        self.run_mode(mode, workers, writes)
+                finally:
+                    settings_dict.update(saved)
+
+    def run_mode(self, mode, workers, writes):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            user_ids, publication_ids = _seed(workers)
+            # Aucune connexion ouverte ne doit être héritée par les processus fils
+            connections.close_all()
+
+            context = multiprocessing.get_context('fork')
+            started = time.perf_counter()
+            with context.Pool(workers) as pool:
+                results = pool.starmap(
+                    _worker, [(worker, writes, user_ids, publication_ids) for worker in range(workers)]
+                )
+            elapsed = time.perf_counter() - started
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        latencies = sorted(latency * 1000 for worker_latencies, _ in results for latency in worker_latencies)
+        errors = sum(worker_errors for _, worker_errors in results)
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f'{mode}: every write failed ({errors} errors)'))
+            return
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(len(latencies) * 0.99)]
+        self.stdout.write(self.style.SUCCESS(
+            f'{mode}: {len(latencies)} writes by {workers} workers in {elapsed:.2f}s '
+            f'({len(latencies) / elapsed:.0f} writes/s), p50 {p50:.2f} ms, p99 {p99:.2f} ms, {errors} errors'
+        ))
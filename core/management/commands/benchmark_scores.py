@@ -0,0 +1,124 @@
+import math
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.feed import SORT_TOP, feed_page
+from core.models import Publication, ReactionSummary, User
+from core.scoring import (
+    REACTION_TYPES, REACTION_WEIGHTS, SCORE_DISLIKE_WEIGHT, SCORE_HALF_LIFE, SCORE_LIKE_WEIGHT, compute_scores,
+    update_scores,
+)
+
+
+def synthetic_arrays(count, rng):
+    now = timezone.now().timestamp()
+    created_at = now - rng.uniform(0, 365 * 86400, count)
+    likes = rng.poisson(3, count).astype(np.float64)
+    dislikes = rng.poisson(1, count).astype(np.float64)
+    reactions = rng.poisson(0.5, (count, len(REACTION_TYPES))).astype(np.float64)
+    return created_at, likes, dislikes, reactions
+
+
+def python_scores(created_at, likes, dislikes, reactions):
+    # Référence : même formule, une publication à la fois
+    decay = math.log(2) / SCORE_HALF_LIFE
+    weights = REACTION_WEIGHTS.tolist()
+    scores = []
+    for created, like, dislike, row in zip(created_at.tolist(), likes.tolist(), dislikes.tolist(), reactions.tolist()):
+        engagement = SCORE_LIKE_WEIGHT * like - SCORE_DISLIKE_WEIGHT * dislike + sum(map(float.__mul__, weights, row))
+        scores.append(math.log1p(max(engagement, 0)) + created / 3600 * decay)
+    return scores
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the vectorised publication scoring, in memory and as a full job on a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--publications', type=int, default=1_000_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skip-database', action='store_true', help='Only time the in-memory scoring')
+
+    def handle(self, *args, **options):
+        count = options['publications']
+        rng = np.random.default_rng(options['seed'])
+        arrays = synthetic_arrays(count, rng)
+
+        started = time.perf_counter()
+        scores = compute_scores(*arrays)
+        vectorised = time.perf_counter() - started
+        started = time.perf_counter()
+        reference = python_scores(*arrays)
+        looped = time.perf_counter() - started
+        assert np.allclose(scores, reference)
+        self.stdout.write(
+            f'{count} scores in memory: NumPy {vectorised * 1000:.0f} ms, Python loop {looped * 1000:.0f} ms '
+            f'({looped / vectorised:.0f}x)'
+        )
+
+        if not options['skip_database']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                self.benchmark_job(count, arrays, rng)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def benchmark_job(self, count, arrays, rng):
+        created_at, likes, dislikes, reactions = arrays
+        author = User.objects.create_user('bench_scores', password='bench')
+
+        started = time.perf_counter()
+        self.insert_rows(author, created_at, likes, dislikes, reactions)
+        self.stdout.write(f'Inserted {count} publications in {time.perf_counter() - started:.1f}s')
+
+        for label in ('first run', 'unchanged run'):
+            started = time.perf_counter()
+            scanned, written = update_scores()
+            self.stdout.write(f'update_scores, {label}: {scanned} scanned, {written} written '
+                              f'in {time.perf_counter() - started:.1f}s')
+
+        # 1 % des publications reçoivent des likes entre deux passages
+        first_id = Publication.objects.order_by('pk').values_list('pk', flat=True).first()
+        changed = rng.choice(count, count // 100, replace=False) + first_id
+        for start in range(0, len(changed), 900):
+            Publication.objects.filter(pk__in=changed[start:start + 900].tolist()).update(likes=1000)
+        started = time.perf_counter()
+        scanned, written = update_scores()
+        self.stdout.write(f'update_scores, after new likes: {scanned} scanned, {written} written '
+                          f'in {time.perf_counter() - started:.1f}s')
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            feed_page(author, sort=SORT_TOP)
+            elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Top feed page: {elapsed * 1000:.1f} ms, {len(queries)} queries, no scoring at request time'
+        ))
+
+    def insert_rows(self, author, created_at, likes, dislikes, reactions):
+        publications = Publication._meta.db_table
+        summaries = ReactionSummary._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            dates = [datetime.fromtimestamp(value, dt_timezone.utc) for value in created_at.tolist()]
+            cursor.executemany(
+                f'INSERT INTO {publications} (user_id, content, likes, dislikes, created_at, updated_at, '
+                f'reaction_count, score) VALUES (%s, %s, %s, %s, %s, %s, %s, 0)',
+                [
+                    (author.pk, 'bench', int(like), int(dislike), date, date, int(total))
+                    for like, dislike, date, total in zip(likes, dislikes, dates, reactions.sum(axis=1))
+                ],
+            )
+            first_id = Publication.objects.order_by('pk').values_list('pk', flat=True).first()
+            rows, columns = np.nonzero(reactions)
+            cursor.executemany(
+                f'INSERT INTO {summaries} (publication_id, type, count) VALUES (%s, %s, %s)',
+                [
+                    (first_id + int(row), REACTION_TYPES[column], int(reactions[row, column]))
+                    for row, column in zip(rows.tolist(), columns.tolist())
+                ],
+            )
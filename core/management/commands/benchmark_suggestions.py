@@ -0,0 +1,82 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core.models import Club, User
+from core.suggestions import SUGGESTIONS_LIMIT, suggestion_service
+
+# Cache local au processus : les résultats synthétiques ne doivent pas atteindre le cache partagé
+BENCHMARK_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}}
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.99)], timings[-1]
+
+
+class Command(BaseCommand):
+    help = 'Measure the search_suggestions endpoint on a synthetic dataset (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--clubs', type=int, default=10000)
+        parser.add_argument('--queries', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with override_settings(CACHES=BENCHMARK_CACHES), transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+        # L'index du processus contient les lignes annulées
+        suggestion_service.loaded_at = None
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        letters = string.ascii_lowercase
+
+        def random_name(pk):
+            return ''.join(rng.choice(letters) for _ in range(rng.randint(4, 12))) + f'_{pk}'
+
+        started = time.perf_counter()
+        User.objects.bulk_create(
+            (User(username=f'bench_{random_name(pk)}', password='!') for pk in range(options['users'])),
+            batch_size=5000,
+        )
+        viewer = User.objects.create_user('bench_viewer', password='bench')
+        Club.objects.bulk_create(
+            (Club(name=random_name(pk), description='bench', creator=viewer) for pk in range(options['clubs'])),
+            batch_size=5000,
+        )
+        suggestion_service.loaded_at = None
+        suggestion_service.suggest('a')
+        self.stdout.write(
+            f"{options['users']} users and {options['clubs']} clubs loaded in {time.perf_counter() - started:.2f}s"
+        )
+
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(viewer)
+        url = reverse('search_suggestions')
+        endpoint, lookups = [], []
+        for _ in range(options['queries']):
+            query = 'bench_' + ''.join(rng.choice(letters) for _ in range(rng.randint(0, 3)))
+            if rng.random() < 0.5:
+                query = query[len('bench_'):] or 'a'
+            started = time.perf_counter()
+            response = client.get(url, {'query': query})
+            endpoint.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+
+            started = time.perf_counter()
+            suggestion_service.indexes['user'].lookup(query, SUGGESTIONS_LIMIT)
+            lookups.append((time.perf_counter() - started) * 1000)
+
+        for label, timings in (('endpoint', endpoint), ('index lookup', lookups)):
+            p50, p99, slowest = percentiles(timings)
+            self.stdout.write(self.style.SUCCESS(
+                f"{options['queries']} {label} calls: p50 {p50:.3f} ms, p99 {p99:.3f} ms, max {slowest:.3f} ms"
+            ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.replicas import replica_reads
+from core.sitemaps import build_sitemaps
+
+
+class Command(BaseCommand):
+    help = 'Pre-generate the gzipped sitemap index and sections, re-rendering only the sections that changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Re-render every section')
+
+    def handle(self, *args, **options):
+        with replica_reads():
+            manifest = build_sitemaps(full=options['full'])
+        if manifest is None:
+            self.stdout.write(self.style.WARNING('Another sitemap build is running'))
+            return
+        for name, sections in manifest['sections'].items():
+            self.stdout.write(f"{name}: {len(sections)} section(s), {sum(s['count'] for s in sections)} URL(s)")
+        self.stdout.write(self.style.SUCCESS('Sitemaps built'))
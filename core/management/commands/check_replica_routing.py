@@ -0,0 +1,116 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from core.models import Publication, User
+from core.replicas import STICKY_COOKIE
+
+REPLICA = 'replica_check'
+STICKY_SECONDS = 60
+
+
+def replicate(primary, replica):
+    # « Réplication » : copie du fichier primaire, connexions fermées pour que le WAL y soit reporté
+    connections.close_all()
+    shutil.copyfile(primary, replica)
+
+
+def _reads(queries):
+    return sum(query['sql'].startswith('SELECT') for query in queries)
+
+
+class Command(BaseCommand):
+    help = 'Prove read-replica routing and read-your-writes stickiness on two throwaway SQLite files'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('This check copies database files to simulate replication and needs SQLite')
+
+        self.failures = 0
+        with tempfile.TemporaryDirectory() as directory:
+            primary, replica = Path(directory) / 'primary.sqlite3', Path(directory) / 'replica.sqlite3'
+            connection.settings_dict['TEST']['NAME'] = str(primary)
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            connections.settings[REPLICA] = {**connection.settings_dict, 'NAME': str(replica)}
+            try:
+                with override_settings(
+                    ALLOWED_HOSTS=['testserver'], BACKGROUND_TASKS_ASYNC=False,
+                    DATABASE_REPLICAS=[REPLICA], REPLICA_STICKY_SECONDS=STICKY_SECONDS,
+                ):
+                    self.check_routing(primary, replica)
+            finally:
+                connections[REPLICA].close()
+                del connections[REPLICA]
+                del connections.settings[REPLICA]
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        if self.failures:
+            raise CommandError(f'{self.failures} routing check(s) failed')
+        self.stdout.write(self.style.SUCCESS('Replica routing and stickiness behave as expected'))
+
+    def request(self, client, method, url, data=None):
+        """(réponse, lectures sur le primaire, lectures sur le réplica)."""
+        with CaptureQueriesContext(connections['default']) as on_primary, \
+                CaptureQueriesContext(connections[REPLICA]) as on_replica:
+            response = getattr(client, method)(url, data)
+        return response, _reads(on_primary), _reads(on_replica)
+
+    def expect(self, label, condition, detail):
+        if condition:
+            self.stdout.write(f'ok    {label} ({detail})')
+        else:
+            self.failures += 1
+            self.stderr.write(f'FAIL  {label} ({detail})')
+
+    def expect_reads(self, label, client, url, database, content=None, visible=None):
+        response, primary_reads, replica_reads = self.request(client, 'get', url)
+        detail = f'{primary_reads} reads on primary, {replica_reads} on replica'
+        routed = replica_reads and not primary_reads if database == REPLICA else primary_reads and not replica_reads
+        self.expect(f'{label} reads from {database}', response.status_code == 200 and routed, detail)
+        if content is not None:
+            shown = content in response.content.decode()
+            self.expect(f'{label} {"shows" if visible else "hides"} {content!r}', shown == visible, detail)
+
+    def check_routing(self, primary, replica):
+        author = User.objects.create_user('replica_author', password='replica')
+        reader = User.objects.create_user('replica_reader', password='replica')
+        author.followers.add(reader)
+        Publication.objects.create(user=author, content='before replication')
+        author_client, reader_client = Client(), Client()
+        author_client.force_login(author)
+        reader_client.force_login(reader)
+        replicate(primary, replica)
+
+        author_profile = reverse('profile', args=[author.username])
+        self.expect_reads('feed', reader_client, reverse('feed'), REPLICA)
+        self.expect_reads('search', reader_client, reverse('search') + '?query=replica', REPLICA)
+        self.expect_reads('clubs', reader_client, reverse('clubs'), REPLICA)
+        self.expect_reads('messages (not a replica view)', reader_client, reverse('messages'), 'default')
+
+        response, _, replica_reads = self.request(
+            author_client, 'post', reverse('publication_create'), {'content': 'after replication'}
+        )
+        cookie = author_client.cookies.get(STICKY_COOKIE)
+        self.expect(
+            'publication_create sets the sticky cookie',
+            response.status_code == 302 and cookie is not None and cookie['max-age'] == STICKY_SECONDS,
+            f'{replica_reads} reads on replica',
+        )
+
+        self.expect_reads('author profile, sticky', author_client, author_profile, 'default', 'after replication', True)
+        self.expect_reads('reader profile, replica lag', reader_client, author_profile, REPLICA, 'after replication', False)
+
+        # Fenêtre écoulée : le navigateur a supprimé le cookie
+        del author_client.cookies[STICKY_COOKIE]
+        self.expect_reads('author profile, window over', author_client, author_profile, REPLICA, 'after replication', False)
+
+        replicate(primary, replica)
+        self.expect_reads('reader profile, caught up', reader_client, author_profile, REPLICA, 'after replication', True)
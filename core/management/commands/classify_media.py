@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from core.media import classify_media
+from core.models import Media
+
+
+class Command(BaseCommand):
+    help = 'Fill Media.media_type and mime_type by sniffing the content of existing files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help='Reclassify media that already have a type')
+
+    def handle(self, *args, **options):
+        media = Media.objects.all() if options['all'] else Media.objects.filter(media_type='')
+        media = media.exclude(file='').exclude(file__isnull=True).only('id', 'file').order_by('pk')
+        total = 0
+        last_id = 0
+        while True:
+            # Parcours par clé primaire ; un UPDATE groupé par lot
+            batch = list(media.filter(pk__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            for item in batch:
+                classify_media(item)
+            Media.objects.bulk_update(batch, ['media_type', 'mime_type'])
+            total += len(batch)
+            last_id = batch[-1].pk
+        self.stdout.write(self.style.SUCCESS(f'Classified {total} media'))
@@ -0,0 +1,126 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from core.models import Club, ClubMessage, Message, Notification, Publication, Reaction, Report, User
+
+# SQLite : « SCAN t » sans « USING ... INDEX »
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\S+)(?!.* USING (COVERING )?INDEX)')
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (\S+)')
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+
+
+def hot_requests(data):
+    """(nom, méthode, url, données POST) des vues les plus sollicitées."""
+    author, other, club = data['author'], data['other'], data['club']
+    return [
+        ('feed', 'get', reverse('feed'), None),
+        ('club_detail', 'get', reverse('club_detail', args=[club.pk]), None),
+        ('profile', 'get', reverse('profile', args=[other.username]), None),
+        ('history', 'get', reverse('history'), None),
+        ('publication_thread', 'get', reverse('publication_thread', args=[data['publication'].pk]), None),
+        ('messages', 'get', reverse('messages'), None),
+        ('send_message', 'get', reverse('send_message', args=[other.pk]), None),
+        ('club_messages', 'get', reverse('club_messages', args=[club.pk]), None),
+        ('club_messages_poll', 'get', reverse('club_messages_poll', args=[club.pk]) + '?after_id=0', None),
+        ('notifications', 'get', reverse('notifications'), None),
+        ('report_user', 'post', reverse('report_user', args=[other.pk]), {'reason': 'explain'}),
+    ]
+
+
+def create_fixture():
+    author = User.objects.create_user('explain_author', password='explain')
+    other = User.objects.create_user('explain_other', password='explain')
+    club = Club.objects.create(name='Explain', description='explain', creator=author)
+    club.members.add(author, other)
+    other.followers.add(author)
+    publication = None
+    for number in range(5):
+        publication = Publication.objects.create(user=other, club=club, content=f'explain {number}')
+        reaction = Reaction.objects.create(user=author, publication=publication, comment='explain')
+        Reaction.objects.create(user=other, publication=publication, comment='explain', parent=reaction)
+    for number in range(5):
+        Message.objects.create(sender=other, recipient=author, content=f'explain {number}')
+        Message.objects.create(sender=author, recipient=other, content=f'explain {number}')
+        top = ClubMessage.objects.create(sender=other, club=club, content=f'explain {number}')
+        ClubMessage.objects.create(sender=author, club=club, content='explain', parent=top)
+        Notification.objects.create(user=author, message=f'explain {number}')
+    Report.objects.create(reporter=author, reported_user=other, reason='explain')
+    return {'author': author, 'other': other, 'club': club, 'publication': publication}
+
+
+def start_test_environment():
+    """False si l'environnement de test est déjà en place (commande lancée depuis la suite de tests)."""
+    try:
+        setup_test_environment()
+    except RuntimeError:
+        return False
+    return True
+
+
+def explain(sql):
+    """Tables parcourues intégralement par la requête."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            scans = [match.group(1) for *_, detail in cursor.fetchall() if (match := SQLITE_FULL_SCAN.match(detail))]
+        elif connection.vendor == 'postgresql':
+            # Tables de test minuscules : sans ce réglage le planificateur préfère toujours Seq Scan
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            scans = [match.group(1) for (line,) in cursor.fetchall() if (match := POSTGRES_FULL_SCAN.search(line))]
+        else:
+            raise CommandError(f'EXPLAIN is not supported for the {connection.vendor} backend')
+    # Sous-requêtes matérialisées (ROW_NUMBER du fil, IN (...)) : déjà bornées par leurs propres index
+    tables = set(connection.introspection.table_names())
+    return [table.strip('"') for table in scans if table.strip('"') in tables]
+
+
+class Command(BaseCommand):
+    help = 'Run the hot views against a test database and fail if any of their queries does a full table scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every explained query')
+
+    def handle(self, *args, **options):
+        own_environment = start_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            failures = self.check_views(options['verbose_plans'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if own_environment:
+                teardown_test_environment()
+
+        if failures:
+            for view, table, sql in failures:
+                self.stderr.write(f'{view}: full scan of {table}\n    {sql}')
+            raise CommandError(f'{len(failures)} quer{"y" if len(failures) == 1 else "ies"} fell back to a full scan')
+        self.stdout.write(self.style.SUCCESS('No full table scan in the hot views'))
+
+    @override_settings(ALLOWED_HOSTS=['testserver'], BACKGROUND_TASKS_ASYNC=False)
+    def check_views(self, verbose):
+        failures = []
+        with transaction.atomic():
+            data = create_fixture()
+            client = Client()
+            client.force_login(data['author'])
+            for view, method, url, payload in hot_requests(data):
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(client, method)(url, payload)
+                if response.status_code >= 400:
+                    raise CommandError(f'{view} answered {response.status_code}')
+
+                statements = [query['sql'] for query in queries if query['sql'].startswith(EXPLAINED_STATEMENTS)]
+                for sql in statements:
+                    scans = explain(sql)
+                    failures += [(view, table, sql) for table in scans]
+                    if verbose:
+                        self.stdout.write(f'{view}: {"FULL SCAN " + ", ".join(scans) if scans else "ok"}\n    {sql}')
+                self.stdout.write(f'{view}: {len(statements)} queries explained')
+            transaction.set_rollback(True)
+        return failures
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.media import process_media
+from core.models import Media
+
+
+class Command(BaseCommand):
+    help = 'Generate variants and strip metadata for media that have not been processed yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess every media, including ready ones')
+
+    def handle(self, *args, **options):
+        media = Media.objects.all() if options['all'] else Media.objects.exclude(status='READY')
+        media_ids = list(media.order_by('pk').values_list('pk', flat=True))
+        for media_id in media_ids:
+            process_media(media_id)
+        failed = Media.objects.filter(pk__in=media_ids, status='FAILED').count()
+        self.stdout.write(self.style.SUCCESS(f'Processed {len(media_ids)} media ({failed} failed)'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.uploads import UPLOAD_EXPIRY_HOURS, purge_expired_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked uploads left unfinished, together with their partial files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=UPLOAD_EXPIRY_HOURS,
+                            help='Inactivity delay after which an upload is abandoned')
+
+    def handle(self, *args, **options):
+        purged = purge_expired_uploads(options['hours'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} abandoned upload(s)'))
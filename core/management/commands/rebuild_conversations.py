@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.conversations import rebuild_conversations
+from core.models import Conversation, ConversationParticipant
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the conversation inbox index from existing messages'
+
+    def handle(self, *args, **options):
+        rebuild_conversations()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {Conversation.objects.count()} conversations '
+            f'({ConversationParticipant.objects.count()} inbox entries)'
+        ))
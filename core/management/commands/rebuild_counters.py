@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.caching import invalidate
+from core.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalised member, follower, subscriber and publication counters'
+
+    def handle(self, *args, **options):
+        updated = rebuild_counters()
+        invalidate('clubs', 'pages')
+        for counter, rows in updated.items():
+            self.stdout.write(f'{counter}: {rows} rows')
+        self.stdout.write(self.style.SUCCESS('Counters rebuilt'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import TimelineEntry, User
+from core.timelines import rebuild_user_timeline
+
+
+class Command(BaseCommand):
+    help = 'Regenerate the materialised home timelines from clubs, follows and publications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild the timeline of this username')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"Unknown user {options['user']}")
+
+        rebuilt = 0
+        for user in users.iterator():
+            rebuild_user_timeline(user)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {rebuilt} timeline(s) ({TimelineEntry.objects.count()} entries)'
+        ))
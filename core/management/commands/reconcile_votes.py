@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.votes import drifted_publications, reconcile_vote_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute publication likes/dislikes counters from the vote tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted publications')
+
+    def handle(self, *args, **options):
+        drifted = drifted_publications().count()
+        if options['dry_run']:
+            self.stdout.write(f'{drifted} publication(s) with drifted counters')
+            return
+
+        updated = reconcile_vote_counters()
+        self.stdout.write(self.style.SUCCESS(f'Reconciled counters on {updated} publication(s)'))
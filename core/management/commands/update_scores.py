@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.scoring import SCORE_BATCH_SIZE, update_scores
+
+
+class Command(BaseCommand):
+    help = 'Recompute the engagement score of every publication (run periodically, e.g. every 10 minutes from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SCORE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        scanned, written = update_scores(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Scored {scanned} publications, {written} score(s) changed'))
@@ -0,0 +1,200 @@
+import logging
+import mimetypes
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from core.background import BackgroundQueue
+from core.models import Media
+
+logger = logging.getLogger(__name__)
+
+MEDIA_VARIANT_WIDTHS = getattr(settings, 'MEDIA_VARIANT_WIDTHS', (320, 640, 1280))
+MEDIA_VARIANT_QUALITY = 80
+MEDIA_VARIANT_DIR = 'medias/variants'
+MEDIA_UPLOAD_DIR = 'medias'
+# Formats réencodés sans métadonnées ; les GIF animés sont laissés tels quels
+STRIPPED_FORMATS = {'JPEG': {'quality': 95}, 'PNG': {'optimize': True}, 'WEBP': {'quality': 95}}
+# Profils ICC décrivant des couleurs RGB : valables aussi pour les variantes converties en RGB
+RGB_MODES = ('RGB', 'RGBA', 'P', 'PA')
+
+# Zone de transit hors MEDIA_ROOT : jamais servie, vidée par le worker une fois l'original écrit
+staging_storage = FileSystemStorage(
+    location=getattr(settings, 'MEDIA_STAGING_ROOT', settings.BASE_DIR / 'media_staging')
+)
+
+media_queue = BackgroundQueue('media', workers=getattr(settings, 'MEDIA_WORKERS', 2))
+
+SNIFF_BYTES = 16
+MIME_MEDIA_TYPES = {'image': 'IMAGE', 'video': 'VIDEO', 'application/pdf': 'PDF'}
+
+
+def sniff_mime_type(head):
+    """Type MIME d'après les premiers octets du fichier, None si non reconnu."""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head.startswith(b'%PDF-'):
+        return 'application/pdf'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head.startswith(b'RIFF') and head[8:12] == b'AVI ':
+        return 'video/x-msvideo'
+    if head[4:8] == b'ftyp':
+        # Boîte ftyp ISO : la marque « qt » désigne un .mov
+        return 'video/quicktime' if head[8:10] == b'qt' else 'video/mp4'
+    return None
+
+
+def _read_head(field_file):
+    committed = field_file._committed
+    field_file.open('rb')
+    try:
+        head = field_file.read(SNIFF_BYTES)
+        field_file.seek(0)
+    finally:
+        # Un fichier pas encore enregistré doit rester ouvert pour save()
+        if committed:
+            field_file.close()
+    return head
+
+
+def classify_media(media, source=None):
+    """Renseigne media_type et mime_type à partir du contenu, pas de l'extension."""
+    name = media.file.name or media.staged_name
+    try:
+        if source is None:
+            head = _read_head(media.file)
+        else:
+            # Fichier en transit, déjà ouvert par process_media
+            head = source.read(SNIFF_BYTES)
+            source.seek(0)
+        # Contenu non reconnu : jamais affiché comme image ou vidéo, quelle que soit l'extension
+        mime_type = sniff_mime_type(head) or 'application/octet-stream'
+    except OSError:
+        logger.warning(f"Media {media.pk} file {name} unreadable, classified from its name")
+        mime_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    media.media_type = MIME_MEDIA_TYPES.get(mime_type) or MIME_MEDIA_TYPES.get(mime_type.split('/')[0], 'OTHER')
+    media.mime_type = mime_type
+
+
+def stage_media(publication, uploaded_file):
+    """Crée le média sans fichier public : le téléversement est seulement déposé en transit."""
+    # Un fichier temporaire est déplacé, pas recopié ; seuls les petits fichiers sont écrits depuis la mémoire
+    staged_name = staging_storage.save(os.path.basename(uploaded_file.name), uploaded_file)
+    media = Media.objects.create(publication=publication, staged_name=staged_name)
+    schedule_media_processing(media)
+    return media
+
+
+def _save_options(image, icc_profile):
+    options = dict(STRIPPED_FORMATS[image.format])
+    if icc_profile:
+        # Le profil couleur n'est pas une métadonnée privée : sans lui les couleurs changent
+        options['icc_profile'] = icc_profile
+    return options
+
+
+def _stripped_original(image):
+    # Orientation EXIF appliquée puis image réécrite sans EXIF/GPS/commentaires
+    buffer = BytesIO()
+    ImageOps.exif_transpose(image).save(
+        buffer, format=image.format, **_save_options(image, image.info.get('icc_profile'))
+    )
+    return ContentFile(buffer.getvalue())
+
+
+def _write_original(media, name, content):
+    # Nouveau fichier d'abord : l'ancien n'est supprimé qu'une fois le média enregistré
+    previous = media.file.name
+    media.file.name = media.file.storage.save(name, content)
+    return previous
+
+
+def _render_variants(media, image, icc_profile):
+    storage = media.file.storage
+    for variant in media.variants:
+        storage.delete(variant['name'])
+
+    stem = os.path.splitext(os.path.basename(media.file.name))[0]
+    variants = []
+    for width in MEDIA_VARIANT_WIDTHS:
+        # Pas d'agrandissement : la dernière variante est bornée à la largeur d'origine
+        width = min(width, image.width)
+        if variants and width <= variants[-1]['width']:
+            break
+        resized = image.copy()
+        resized.thumbnail((width, image.height), Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, format='WEBP', quality=MEDIA_VARIANT_QUALITY, icc_profile=icc_profile)
+        name = storage.save(f'{MEDIA_VARIANT_DIR}/{stem}_{resized.width}.webp', ContentFile(buffer.getvalue()))
+        variants.append({'width': resized.width, 'height': resized.height, 'name': name})
+    return variants
+
+
+def process_media(media_id):
+    """Publie un média téléversé : métadonnées retirées, dimensions, variantes WebP."""
+    try:
+        media = Media.objects.get(pk=media_id)
+    except Media.DoesNotExist:
+        return
+    staged_name = media.staged_name
+    if not media.file and not staged_name:
+        return
+
+    storage, name = (staging_storage, staged_name) if staged_name else (media.file.storage, media.file.name)
+    target = f'{MEDIA_UPLOAD_DIR}/{os.path.basename(name)}' if staged_name else name
+    replaced = None
+    try:
+        with storage.open(name, 'rb') as source:
+            if not media.media_type:
+                classify_media(media, source)
+            image = None
+            # Type détecté sur le contenu : un PDF renommé en .jpg n'est pas ouvert par Pillow
+            if media.media_type == 'IMAGE':
+                image = Image.open(source)
+                image.load()
+                icc_profile = image.info.get('icc_profile') if image.mode in RGB_MODES else None
+            if image is not None and image.format in STRIPPED_FORMATS:
+                replaced = _write_original(media, target, _stripped_original(image))
+                image = ImageOps.exif_transpose(image)
+            elif staged_name:
+                # Autres fichiers (PDF, vidéos, GIF) : publiés tels quels
+                source.seek(0)
+                replaced = _write_original(media, target, source)
+        if image is not None:
+            if not getattr(image, 'is_animated', False):
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+                media.variants = _render_variants(media, image, icc_profile)
+            media.width, media.height = image.size
+        media.size = media.file.size
+        media.staged_name = ''
+        media.status = 'READY'
+    except Exception:
+        # En cas d'échec le fichier en transit est gardé : process_media pourra réessayer
+        logger.exception(f"Media {media_id} processing failed")
+        media.status = 'FAILED'
+
+    # save() plutôt qu'update() : post_save renouvelle le fragment de la publication
+    media.save(update_fields=[
+        'file', 'staged_name', 'media_type', 'mime_type', 'status', 'width', 'height', 'size', 'variants',
+    ])
+    if replaced and replaced != media.file.name:
+        media.file.storage.delete(replaced)
+    if staged_name and not media.staged_name:
+        staging_storage.delete(staged_name)
+    logger.info(f"Media {media_id} processed: {media.status}, {len(media.variants)} variant(s)")
+
+
+def schedule_media_processing(media):
+    # Le traitement part après le COMMIT : la requête de publication rend la main aussitôt
+    transaction.on_commit(lambda: media_queue.submit(process_media, media.pk))
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.3 on 2026-10-17 22:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_remove_publication_image_remove_publication_media_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(fields=['-created_at', '-id'], name='publication_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,125 @@
+# Generated by Django 5.0.3 on 2026-10-17 22:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_conversations(apps, schema_editor):
+    Conversation = apps.get_model('core', 'Conversation')
+    ConversationParticipant = apps.get_model('core', 'ConversationParticipant')
+    Message = apps.get_model('core', 'Message')
+    ClubMessage = apps.get_model('core', 'ClubMessage')
+    ClubMembership = apps.get_model('core', 'ClubMembership')
+
+    # Conversations directes : une par paire d'utilisateurs, dernier message de la paire
+    latest = {}
+    for sender_id, recipient_id, content, created_at in (
+        Message.objects.order_by('created_at', 'id').values_list('sender_id', 'recipient_id', 'content', 'created_at')
+        .iterator()
+    ):
+        low, high = sorted([sender_id, recipient_id])
+        latest[f'user:{low}:{high}'] = (low, high, sender_id, content, created_at)
+    Conversation.objects.bulk_create([
+        Conversation(key=key, kind='USER', last_message=content, last_message_at=created_at, last_sender_id=sender_id)
+        for key, (_, _, sender_id, content, created_at) in latest.items()
+    ])
+    unread = {
+        (row['recipient_id'], row['sender_id']): row['total']
+        for row in Message.objects.filter(is_read=False).values('sender_id', 'recipient_id').annotate(total=Count('id'))
+    }
+    participants = []
+    for conversation_id, key, last_message_at in Conversation.objects.filter(kind='USER').values_list(
+        'pk', 'key', 'last_message_at'
+    ):
+        low, high = latest[key][:2]
+        for user_id, other_user_id in ((low, high), (high, low)):
+            participants.append(ConversationParticipant(
+                conversation_id=conversation_id, user_id=user_id, other_user_id=other_user_id,
+                last_message_at=last_message_at, unread_count=unread.get((user_id, other_user_id), 0),
+            ))
+    # Message à soi-même : une seule entrée
+    ConversationParticipant.objects.bulk_create(participants, ignore_conflicts=True)
+
+    # Conversations de club : tout club qui a des membres ou des messages
+    club_ids = set(ClubMembership.objects.values_list('club_id', flat=True)) | set(
+        ClubMessage.objects.values_list('club_id', flat=True)
+    )
+    last_messages = {}
+    for club_id, sender_id, content, created_at in (
+        ClubMessage.objects.order_by('created_at', 'id').values_list('club_id', 'sender_id', 'content', 'created_at')
+        .iterator()
+    ):
+        last_messages[club_id] = {'last_sender_id': sender_id, 'last_message': content, 'last_message_at': created_at}
+    Conversation.objects.bulk_create([
+        Conversation(key=f'club:{club_id}', kind='CLUB', club_id=club_id, **last_messages.get(club_id, {}))
+        for club_id in club_ids
+    ])
+    ConversationParticipant.objects.bulk_create(
+        [
+            ConversationParticipant(
+                conversation_id=conversation_id, user_id=user_id, last_message_at=last_message_at,
+            )
+            for conversation_id, user_id, last_message_at in ClubMembership.objects.filter(
+                club__conversation__isnull=False
+            ).values_list('club__conversation', 'user_id', 'club__conversation__last_message_at')
+        ],
+        ignore_conflicts=True,
+    )
+
+    # Non lus des clubs : messages des autres membres absents de ClubMessage.is_read
+    read_by_participant = ClubMessage.is_read.through.objects.filter(
+        clubmessage_id=OuterRef('pk'), user_id=OuterRef(OuterRef('user_id'))
+    )
+    club_unread = (
+        ClubMessage.objects.filter(club__conversation=OuterRef('conversation_id'))
+        .exclude(sender_id=OuterRef('user_id'))
+        .exclude(Exists(read_by_participant))
+        .order_by().values('club_id').annotate(total=Count('id')).values('total')
+    )
+    ConversationParticipant.objects.filter(other_user__isnull=True).update(
+        unread_count=Coalesce(Subquery(club_unread, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_notification_group_key_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('kind', models.CharField(choices=[('USER', 'Utilisateur'), ('CLUB', 'Club')], max_length=10)),
+                ('last_message', models.TextField(blank=True)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('club', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conversation', to='core.club')),
+                ('last_sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ConversationParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='core.conversation')),
+                ('other_user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_message_at'], name='participant_inbox_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='conversationparticipant',
+            constraint=models.UniqueConstraint(fields=('conversation', 'user'), name='unique_conversation_participant'),
+        ),
+        migrations.RunPython(fill_conversations, migrations.RunPython.noop),
+    ]
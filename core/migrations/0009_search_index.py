@@ -0,0 +1,95 @@
+from django.db import migrations
+
+# Copie figée de core.search au moment de cette migration : elle ne doit pas suivre le code vivant
+SQLITE_TABLE = 'core_search_index'
+POSTGRES_TABLE = 'core_search_document'
+SEARCH_DOCUMENTS = {
+    'user': ('User', ['username']),
+    'club': ('Club', ['name', 'description']),
+    'publication': ('Publication', ['content']),
+    'message': ('Message', ['content']),
+    'club_message': ('ClubMessage', ['content']),
+}
+KIND_CODES = {kind: code for code, kind in enumerate(SEARCH_DOCUMENTS)}
+BATCH_SIZE = 1000
+
+
+def install_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5('
+                f"body, kind UNINDEXED, object_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ('
+                'kind varchar(20) NOT NULL, '
+                'object_id bigint NOT NULL, '
+                'body text NOT NULL, '
+                "document tsvector GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED, "
+                'PRIMARY KEY (kind, object_id))'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_gin ON {POSTGRES_TABLE} USING gin (document)'
+            )
+
+
+def _insert_documents(connection, kind, documents):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # rowid = (object_id, kind) encodé, comme SQLiteFTSBackend
+            cursor.executemany(
+                f'INSERT INTO {SQLITE_TABLE} (rowid, body, kind, object_id) VALUES (%s, %s, %s, %s)',
+                [
+                    (object_id * len(SEARCH_DOCUMENTS) + KIND_CODES[kind], text, kind, object_id)
+                    for object_id, text in documents
+                ],
+            )
+        else:
+            cursor.executemany(
+                f'INSERT INTO {POSTGRES_TABLE} (kind, object_id, body) VALUES (%s, %s, %s) '
+                'ON CONFLICT (kind, object_id) DO UPDATE SET body = EXCLUDED.body',
+                [(kind, object_id, text) for object_id, text in documents],
+            )
+
+
+def fill_search_index(apps, schema_editor):
+    # Index rempli au déploiement : sans cela la recherche reste vide jusqu'à rebuild_search_index
+    connection = schema_editor.connection
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    for kind, (model_name, fields) in SEARCH_DOCUMENTS.items():
+        model = apps.get_model('core', model_name)
+        last_id = 0
+        while True:
+            batch = list(
+                model.objects.using(connection.alias).filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', *fields)[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+            _insert_documents(
+                connection, kind, [(row[0], ' '.join(str(value or '') for value in row[1:])) for row in batch]
+            )
+            last_id = batch[-1][0]
+
+
+def uninstall_search_index(apps, schema_editor):
+    table = {'sqlite': SQLITE_TABLE, 'postgresql': POSTGRES_TABLE}.get(schema_editor.connection.vendor)
+    if table:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_conversation_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
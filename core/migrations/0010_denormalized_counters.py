@@ -0,0 +1,85 @@
+# Generated by Django 5.0.3 on 2026-10-17 22:38
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Copie figée de core.counters.COUNTERS au moment de cette migration
+COUNTERS = [
+    ('Club', 'member_count', 'ClubMembership', 'club'),
+    ('User', 'clubs_joined_count', 'ClubMembership', 'user'),
+    ('User', 'follower_count', 'User_followers', 'from_user'),
+    ('User', 'following_count', 'User_followers', 'to_user'),
+    ('Page', 'subscriber_count', 'Page_subscribers', 'page'),
+    ('User', 'pages_followed_count', 'Page_subscribers', 'user'),
+    ('User', 'publication_count', 'Publication', 'user'),
+    ('User', 'clubs_created_count', 'Club', 'creator'),
+    ('User', 'pages_created_count', 'Page', 'creator'),
+]
+
+
+def fill_counters(apps, schema_editor):
+    # Un UPDATE par compteur, depuis les tables sources
+    for model_name, field, source_name, fk in COUNTERS:
+        model, source = apps.get_model('core', model_name), apps.get_model('core', source_name)
+        total = (
+            source.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+            .annotate(total=Count('pk')).values('total')
+        )
+        model.objects.update(**{field: Coalesce(Subquery(total, output_field=IntegerField()), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='club',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='subscriber_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='clubs_created_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='clubs_joined_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='pages_created_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='pages_followed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='publication_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-17 22:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='publication',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
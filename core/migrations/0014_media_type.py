@@ -0,0 +1,27 @@
+# Generated by Django 5.0.3 on 2026-10-17 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='media_type',
+            field=models.CharField(blank=True, choices=[('IMAGE', 'Image'), ('VIDEO', 'Vidéo'), ('PDF', 'PDF'), ('OTHER', 'Autre')], default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='mime_type',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['media_type', 'publication'], name='media_type_publication_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.3 on 2026-10-17 22:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_reaction_summaries(apps, schema_editor):
+    Publication = apps.get_model('core', 'Publication')
+    Reaction = apps.get_model('core', 'Reaction')
+    ReactionSummary = apps.get_model('core', 'ReactionSummary')
+    total = (
+        Reaction.objects.filter(publication=OuterRef('pk')).order_by().values('publication')
+        .annotate(total=Count('pk')).values('total')
+    )
+    Publication.objects.update(reaction_count=Coalesce(Subquery(total, output_field=IntegerField()), 0))
+    rows = Reaction.objects.order_by().values('publication_id', 'type').annotate(total=Count('pk'))
+    ReactionSummary.objects.bulk_create(
+        [ReactionSummary(publication_id=row['publication_id'], type=row['type'], count=row['total']) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_media_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReactionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('THOUGHT', 'Ma pensée'), ('ADHERE', "J'adhère"), ('SUPPORT', 'Je soutiens'), ('ALTERNATIVE', 'Je propose une alternative'), ('CLARIFY', 'Je demande des précisions')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='publication',
+            name='reaction_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(fields=['-reaction_count', '-id'], name='publication_discussed_idx'),
+        ),
+        migrations.AddField(
+            model_name='reactionsummary',
+            name='publication',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reaction_summaries', to='core.publication'),
+        ),
+        migrations.AddConstraint(
+            model_name='reactionsummary',
+            constraint=models.UniqueConstraint(fields=('publication', 'type'), name='unique_reaction_summary'),
+        ),
+        migrations.RunPython(fill_reaction_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.3 on 2026-10-17 22:57
+
+from django.db import migrations, models
+from django.db.models import Exists, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def convert_read_receipts(apps, schema_editor):
+    ClubMembership = apps.get_model('core', 'ClubMembership')
+    ClubMessage = apps.get_model('core', 'ClubMessage')
+    ConversationParticipant = apps.get_model('core', 'ConversationParticipant')
+
+    # Filigrane = plus grand message du club marqué lu par le membre
+    last_read = (
+        ClubMessage.is_read.through.objects
+        .filter(user_id=OuterRef('user_id'), clubmessage__club_id=OuterRef('club_id'))
+        .order_by().values('user_id').annotate(last=Max('clubmessage_id')).values('last')
+    )
+    ClubMembership.objects.update(last_read_message_id=Coalesce(Subquery(last_read), 0))
+
+    # Conversation sans non-lu dans l'index : tout le club est lu
+    latest = ClubMessage.objects.filter(club_id=OuterRef('club_id')).order_by('-id').values('id')[:1]
+    all_read = ConversationParticipant.objects.filter(
+        user_id=OuterRef('user_id'), conversation__club_id=OuterRef('club_id'), unread_count=0
+    )
+    ClubMembership.objects.filter(Exists(all_read)).update(last_read_message_id=Coalesce(Subquery(latest), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_reaction_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clubmembership',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='clubmessage',
+            index=models.Index(fields=['club', 'id'], name='club_message_range_idx'),
+        ),
+        migrations.RunPython(convert_read_receipts, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='clubmessage',
+            name='is_read',
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.3 on 2026-10-17 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_club_read_watermark'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clubmessage',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['club', '-id'], name='club_message_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'recipient', 'created_at'], name='message_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['recipient', 'sender'], name='message_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at'], name='notification_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(fields=['club', '-created_at'], name='publication_club_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(fields=['user', '-created_at'], name='publication_user_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.0.3 on 2026-10-17 23:10
+
+import math
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Copie figée de core.scoring au moment de cette migration : elle ne doit pas suivre le code vivant
+SCORE_HALF_LIFE = getattr(settings, 'SCORE_HALF_LIFE_HOURS', 24)
+SCORE_REACTION_WEIGHTS = {
+    'THOUGHT': 2.0,
+    'ADHERE': 1.5,
+    'SUPPORT': 1.5,
+    'ALTERNATIVE': 3.0,
+    'CLARIFY': 1.0,
+}
+BATCH_SIZE = 1000
+
+
+def fill_scores(apps, schema_editor):
+    # Scores initiaux au déploiement : sans cela le tri « top » reste arbitraire jusqu'à update_scores
+    Publication = apps.get_model('core', 'Publication')
+    ReactionSummary = apps.get_model('core', 'ReactionSummary')
+    alias = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        batch = list(
+            Publication.objects.using(alias).filter(pk__gt=last_id).order_by('pk')
+            .only('pk', 'created_at', 'likes', 'dislikes')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        engagement = {publication.pk: publication.likes - publication.dislikes for publication in batch}
+        summaries = ReactionSummary.objects.using(alias).filter(publication_id__in=engagement, count__gt=0)
+        for publication_id, kind, count in summaries.values_list('publication_id', 'type', 'count'):
+            engagement[publication_id] += SCORE_REACTION_WEIGHTS.get(kind, 1.0) * count
+        for publication in batch:
+            publication.score = (
+                math.log1p(max(engagement[publication.pk], 0))
+                + publication.created_at.timestamp() / 3600 * (math.log(2) / SCORE_HALF_LIFE)
+            )
+        Publication.objects.using(alias).bulk_update(batch, ['score'])
+        last_id = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_timeline_entries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publication',
+            name='score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(fields=['-score', '-id'], name='publication_score_idx'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,6 @@
+import os
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
@@ -32,6 +35,15 @@ class User(AbstractUser):
     )
     schools = models.JSONField(default=list, blank=True)  # Pour stocker plusieurs écoles
     hobbies = models.JSONField(default=list, blank=True)  # Pour stocker plusieurs hobbies
+
+    # Compteurs dénormalisés, tenus à jour par core.counters
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    publication_count = models.PositiveIntegerField(default=0)
+    clubs_created_count = models.PositiveIntegerField(default=0)
+    clubs_joined_count = models.PositiveIntegerField(default=0)
+    pages_created_count = models.PositiveIntegerField(default=0)
+    pages_followed_count = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return self.username
@@ -42,6 +54,7 @@ class Club(models.Model):
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_clubs')
     members = models.ManyToManyField(User, through='ClubMembership', related_name='joined_clubs', blank=True)
     created_at = models.DateTimeField(default=timezone.now)
+    member_count = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return self.name
@@ -54,6 +67,8 @@ class ClubMembership(models.Model):
     club = models.ForeignKey('Club', on_delete=models.CASCADE)
     join_date = models.DateTimeField(default=timezone.now)
     date = models.DateTimeField(default=timezone.now)
+    # Filigrane de lecture : tout message du club d'id <= à celui-ci est lu par ce membre
+    last_read_message_id = models.BigIntegerField(default=0)
 
     class Meta:
         db_table = 'core_club_membership'  # Corrigé pour correspondre à la base de données
@@ -75,9 +90,24 @@ class Publication(models.Model):
     liked_by = models.ManyToManyField(User, related_name='liked_publications')
     disliked_by = models.ManyToManyField(User, related_name='disliked_publications')
     created_at = models.DateTimeField(default=timezone.now)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     type = models.CharField(max_length=50, choices=[('NEWS', 'News'), ('EVENT', 'Event')], null=True, blank=True)
     domain = models.CharField(max_length=50, null=True, blank=True)
+    # Compteur dénormalisé (core.counters) : le tri « les plus discutées » lit un index
+    reaction_count = models.PositiveIntegerField(default=0)
+    # Score d'engagement avec décroissance dans le temps (core.scoring, recalculé par update_scores)
+    score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            # Fil : rang « le reste », parcouru du plus récent au plus ancien (core.feed.tier_publications)
+            models.Index(fields=['-created_at', '-id'], name='publication_recent_idx'),
+            models.Index(fields=['-reaction_count', '-id'], name='publication_discussed_idx'),
+            models.Index(fields=['-score', '-id'], name='publication_score_idx'),
+            # Page d'un club, profil et historique : filtre puis tri du plus récent au plus ancien
+            models.Index(fields=['club', '-created_at'], name='publication_club_recent_idx'),
+            models.Index(fields=['user', '-created_at'], name='publication_user_recent_idx'),
+        ]
 
     def __str__(self):
         return f"Publication by {self.user.username}"
@@ -85,29 +115,79 @@ class Publication(models.Model):
     def get_absolute_url(self):
         return reverse('publication_detail', kwargs={'pk': self.pk})
 
+    def reaction_breakdown(self):
+        # [(libellé, nombre)] d'après les résumés préchargés par publications_for_display
+        counts = {summary.type: summary.count for summary in self.reaction_summaries.all()}
+        return [(label, counts[type]) for type, label in Reaction.REACTION_CHOICES if counts.get(type)]
+
 # Nouveau modèle pour les médias
 class Media(models.Model):
+    STATUS_CHOICES = [
+        ('PENDING', 'En attente'),
+        ('READY', 'Prêt'),
+        ('FAILED', 'Échec'),
+    ]
+    MEDIA_TYPE_CHOICES = [
+        ('IMAGE', 'Image'),
+        ('VIDEO', 'Vidéo'),
+        ('PDF', 'PDF'),
+        ('OTHER', 'Autre'),
+    ]
+    EXTENSION_TYPES = {
+        '.jpg': 'IMAGE', '.jpeg': 'IMAGE', '.png': 'IMAGE', '.gif': 'IMAGE', '.webp': 'IMAGE',
+        '.mp4': 'VIDEO', '.mov': 'VIDEO', '.avi': 'VIDEO',
+        '.pdf': 'PDF',
+    }
+
     publication = models.ForeignKey(Publication, on_delete=models.CASCADE, related_name='medias')
     file = models.FileField(upload_to='medias/', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Téléversement déposé dans MEDIA_STAGING_ROOT ; file reste vide jusqu'au traitement
+    staged_name = models.CharField(max_length=255, blank=True)
+    # Type détecté sur le contenu au téléversement (core.media.classify_media)
+    media_type = models.CharField(max_length=10, choices=MEDIA_TYPE_CHOICES, blank=True, default='')
+    mime_type = models.CharField(max_length=100, blank=True, default='')
+    # Renseignés par core.media après le traitement en tâche de fond
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=list, blank=True)  # [{'width', 'height', 'name'}] par largeur croissante
+
+    class Meta:
+        indexes = [
+            # « Publications avec vidéo », « images du club X » : filtre par type puis jointure
+            models.Index(fields=['media_type', 'publication'], name='media_type_publication_idx'),
+        ]
 
     def __str__(self):
         return f"Média pour publication {self.publication.id}"
 
+    def display_url(self):
+        # Plus grande variante disponible, l'original pour les images sans variante (GIF animés)
+        if self.variants:
+            return self.file.storage.url(self.variants[-1]['name'])
+        return self.file.url
+
+    def srcset(self):
+        return ', '.join(f"{self.file.storage.url(variant['name'])} {variant['width']}w" for variant in self.variants)
+
+    def guess_media_type(self):
+        # Repli sur l'extension tant que media_type n'est pas renseigné
+        extension = os.path.splitext(self.file.name or '')[1].lower()
+        return self.EXTENSION_TYPES.get(extension, 'OTHER')
+
+    def get_media_type(self):
+        return self.media_type or self.guess_media_type()
+
     def is_pdf(self):
-        return self.file.name.lower().endswith('.pdf') if self.file.name else False
+        return self.get_media_type() == 'PDF'
 
     def is_image(self):
-        if self.file.name:
-            lower_name = self.file.name.lower()
-            return any(lower_name.endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.gif'])
-        return False
+        return self.get_media_type() == 'IMAGE'
 
     def is_video(self):
-        if self.file.name:
-            lower_name = self.file.name.lower()
-            return any(lower_name.endswith(ext) for ext in ['.mp4', '.mov', '.avi'])
-        return False
+        return self.get_media_type() == 'VIDEO'
     
     
 class Challenge(models.Model):
@@ -129,6 +209,7 @@ class Page(models.Model):
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_pages')
     followers = models.ManyToManyField(User, related_name='followed_pages')
     created_at = models.DateTimeField(auto_now_add=True)
+    subscriber_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.title
@@ -155,7 +236,36 @@ class Reaction(models.Model):
 
     def get_type_display(self):
         return dict(self.REACTION_CHOICES).get(self.type, self.type)
-    
+
+
+class ReactionSummary(models.Model):
+    # Nombre de réactions par publication et par type, tenu à jour par les signaux de Reaction
+    publication = models.ForeignKey(Publication, on_delete=models.CASCADE, related_name='reaction_summaries')
+    type = models.CharField(max_length=20, choices=Reaction.REACTION_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['publication', 'type'], name='unique_reaction_summary'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    # Fil matérialisé (core.timelines) : publication poussée dans le fil d'un utilisateur à l'écriture
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    publication = models.ForeignKey(Publication, on_delete=models.CASCADE, related_name='timeline_entries')
+    tier = models.PositiveSmallIntegerField()
+    # Copie de publication.created_at : la page se lit dans l'index, sans jointure
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'publication'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'tier', '-created_at', '-publication'], name='timeline_user_rank_idx'),
+        ]
+
 
 class Project(models.Model):
     title = models.CharField(max_length=100)
@@ -171,7 +281,23 @@ class Notification(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
     read = models.BooleanField(default=False)
-    
+    # Regroupement des notifications répétitives (ex. messages d'un même club)
+    group_key = models.CharField(max_length=100, blank=True, default='')
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            # Un seul résumé non lu par destinataire et par groupe, même entre workers concurrents.
+            # Son index partiel sert aussi la recherche du résumé non lu (core.notifications)
+            models.UniqueConstraint(
+                fields=['user', 'group_key'], condition=models.Q(read=False) & ~models.Q(group_key=''),
+                name='notification_unread_summary_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='notification_user_recent_idx'),
+        ]
+
     def __str__(self):
         return f"Notification for {self.user.username}"
 
@@ -190,7 +316,15 @@ class Message(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
     is_read = models.BooleanField(default=False)
-    
+
+    class Meta:
+        indexes = [
+            # Fil d'une conversation : (expéditeur, destinataire) dans les deux sens, trié par date
+            models.Index(fields=['sender', 'recipient', 'created_at'], name='message_thread_idx'),
+            # Index partiel : seuls les messages non lus, marqués lus à l'ouverture de la conversation
+            models.Index(fields=['recipient', 'sender'], condition=models.Q(is_read=False), name='message_unread_idx'),
+        ]
+
     def __str__(self):
         return f"Message from {self.sender.username} to {self.recipient.username}"
 
@@ -200,12 +334,81 @@ class ClubMessage(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies')
-    is_read = models.ManyToManyField(User, related_name='read_club_messages', blank=True)
+
+    class Meta:
+        indexes = [
+            # Non lus = messages du club d'id > filigrane du membre : un parcours de plage
+            models.Index(fields=['club', 'id'], name='club_message_range_idx'),
+            # Page de messagerie : derniers messages de premier niveau (core.club_chat)
+            models.Index(fields=['club', '-id'], condition=models.Q(parent__isnull=True), name='club_message_top_idx'),
+        ]
 
     def __str__(self):
         return f"Club message by {self.sender.username} in {self.club.name}"
     
     
+class Conversation(models.Model):
+    KIND_CHOICES = [
+        ('USER', 'Utilisateur'),
+        ('CLUB', 'Club'),
+    ]
+
+    # 'user:<id>:<id>' pour un échange direct, 'club:<id>' pour la messagerie d'un club
+    key = models.CharField(max_length=50, unique=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    club = models.OneToOneField('Club', on_delete=models.CASCADE, null=True, blank=True, related_name='conversation')
+    last_message = models.TextField(blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    def __str__(self):
+        return self.key
+
+
+class ConversationParticipant(models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='participants')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_entries')
+    # Interlocuteur d'une conversation directe (vide pour un club)
+    other_user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    unread_count = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='unique_conversation_participant'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_message_at'], name='participant_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} in {self.conversation.key}"
+
+
+class Upload(models.Model):
+    STATUS_CHOICES = [
+        ('ACTIVE', 'En cours'),
+        ('COMPLETE', 'Terminé'),
+    ]
+
+    # Téléversement par morceaux : reprise possible à partir de offset
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    publication = models.ForeignKey(Publication, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    path = models.CharField(max_length=255)  # Fichier en cours d'assemblage dans la zone de transit
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    checksum = models.CharField(max_length=64)  # SHA-256 attendu, en hexadécimal
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ACTIVE')
+    media = models.OneToOneField(Media, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.filename} ({self.offset}/{self.size})"
+
+
 class Reply(models.Model):
     reaction = models.ForeignKey(Reaction, related_name='reply_set', on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
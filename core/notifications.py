@@ -0,0 +1,72 @@
+import logging
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.background import BackgroundQueue
+from core.models import ClubMembership, ClubMessage, Notification
+from core.realtime import publish, user_channel
+
+logger = logging.getLogger(__name__)
+
+FANOUT_BATCH_SIZE = 500
+
+fanout_queue = BackgroundQueue('notification-fanout')
+
+
+def club_message_group_key(club_id):
+    return f'club_message:{club_id}'
+
+
+def club_member_batches(club_id, exclude_user_id, batch_size=FANOUT_BATCH_SIZE):
+    # Parcours par clé (user_id) : mémoire bornée par la taille du lot
+    last_id = 0
+    while True:
+        batch = list(
+            ClubMembership.objects.filter(club_id=club_id, user_id__gt=last_id)
+            .exclude(user_id=exclude_user_id)
+            .order_by('user_id')
+            .values_list('user_id', flat=True)[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1]
+
+
+def fan_out_club_message(message_id, batch_size=FANOUT_BATCH_SIZE):
+    """Notifie les membres du club ; une seule notification non lue par membre et par club."""
+    message = ClubMessage.objects.select_related('club').get(pk=message_id)
+    club = message.club
+    group_key = club_message_group_key(club.pk)
+    text = f"Nouveau message dans {club.name}: {message.content[:50]}..."
+    now = timezone.now()
+    total = 0
+
+    for user_ids in club_member_batches(club.pk, message.sender_id, batch_size):
+        with transaction.atomic():
+            # get_or_create par lot : les résumés manquants sont créés à 0, ceux qui existent déjà
+            # (ou qu'un autre worker vient de créer) sont ignorés grâce à la contrainte d'unicité
+            Notification.objects.bulk_create(
+                [
+                    Notification(user_id=user_id, message=text, group_key=group_key, count=0, created_at=now)
+                    for user_id in user_ids
+                ],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            # Puis un seul UPDATE incrémente chaque résumé du lot
+            Notification.objects.filter(user_id__in=user_ids, read=False, group_key=group_key).update(
+                message=text, count=F('count') + 1, created_at=now,
+            )
+        # bulk_create et update() n'émettent pas post_save : diffusion explicite du lot
+        publish([user_channel(user_id) for user_id in user_ids], 'notification', {'message': text})
+        total += len(user_ids)
+
+    logger.info(f"Club message {message_id} fanned out to {total} members of club {club.pk}")
+
+
+def notify_club_message(message):
+    # La diffusion part après le COMMIT du message, hors de la requête
+    transaction.on_commit(lambda: fanout_queue.submit(fan_out_club_message, message.pk))
@@ -0,0 +1,43 @@
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
+
+from core.models import Media, Publication, User
+
+
+def viewer_annotations(viewer):
+    # Drapeaux propres au lecteur, calculés par EXISTS sur les tables de liaison
+    if viewer is None or not viewer.is_authenticated:
+        false = Value(False, output_field=BooleanField())
+        return {'viewer_liked': false, 'viewer_disliked': false, 'viewer_follows_author': false}
+
+    return {
+        'viewer_liked': Exists(Publication.liked_by.through.objects.filter(
+            publication_id=OuterRef('pk'), user_id=viewer.pk,
+        )),
+        'viewer_disliked': Exists(Publication.disliked_by.through.objects.filter(
+            publication_id=OuterRef('pk'), user_id=viewer.pk,
+        )),
+        # from_user = l'auteur suivi, to_user = l'abonné
+        'viewer_follows_author': Exists(User.followers.through.objects.filter(
+            from_user_id=OuterRef('user_id'), to_user_id=viewer.pk,
+        )),
+    }
+
+
+def publications_for_display(queryset, viewer):
+    """Charge tout ce qu'une carte de publication affiche, en un nombre fixe de requêtes."""
+    # Réactions et réponses : arbre chargé par lot avec core.threads.attach_threads
+    return (
+        queryset.select_related('user', 'club')
+        # reaction_count est dénormalisé ; le détail par type vient de ReactionSummary
+        .prefetch_related(
+            # Médias encore en transit : rien à afficher avant la fin du traitement
+            Prefetch('medias', queryset=Media.objects.exclude(file__isnull=True).exclude(file='').order_by('id')),
+            'reaction_summaries',
+        )
+        .annotate(**viewer_annotations(viewer))
+    )
+
+
+def with_media_type(queryset, media_type):
+    # EXISTS sur l'index (media_type, publication) : « publications avec vidéo » filtré en SQL
+    return queryset.filter(Exists(Media.objects.filter(publication_id=OuterRef('pk'), media_type=media_type)))
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# 'core.realtime.InProcessBroker' pour un seul processus, 'core.realtime.PostgresBroker' sinon
+REALTIME_BROKER = getattr(settings, 'REALTIME_BROKER', 'core.realtime.InProcessBroker')
+REALTIME_KEEPALIVE = getattr(settings, 'REALTIME_KEEPALIVE', 25)
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def club_channel(club_id):
+    return f'club:{club_id}'
+
+
+class Subscription:
+    """File d'événements d'une connexion, alimentée depuis n'importe quel thread."""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = set(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(SUBSCRIPTION_QUEUE_SIZE)
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Client qui ne lit plus : l'événement est perdu, pas la mémoire du processus
+            logger.warning(f"Realtime subscription {self.channels} full, event {event['type']} dropped")
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Diffusion entre les connexions ouvertes sur ce processus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def publish(self, channels, event):
+        self.dispatch(channels, event)
+
+    def dispatch(self, channels, event):
+        with self._lock:
+            targets = {subscription for channel in channels for subscription in self._subscriptions.get(channel, ())}
+        for subscription in targets:
+            subscription.deliver(event)
+
+
+class PostgresBroker(InProcessBroker):
+    """Plusieurs workers : NOTIFY PostgreSQL, chaque processus relaie via LISTEN à ses connexions."""
+
+    PG_CHANNEL = 'zevaba_realtime'
+    # Charge utile NOTIFY limitée à 8000 octets : les canaux sont envoyés par paquets
+    CHANNELS_PER_NOTIFY = 100
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def subscribe(self, channels):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='realtime-listen', daemon=True)
+                self._listener.start()
+        return super().subscribe(channels)
+
+    def publish(self, channels, event):
+        channels = list(channels)
+        with connection.cursor() as cursor:
+            for start in range(0, len(channels), self.CHANNELS_PER_NOTIFY):
+                payload = {'channels': channels[start:start + self.CHANNELS_PER_NOTIFY], 'event': event}
+                cursor.execute('SELECT pg_notify(%s, %s)', [self.PG_CHANNEL, json.dumps(payload, cls=DjangoJSONEncoder)])
+
+    def _listen(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        while True:
+            try:
+                pg = psycopg2.connect(**connection.get_connection_params())
+                pg.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with pg.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.PG_CHANNEL}')
+                while True:
+                    if select.select([pg], [], [], REALTIME_KEEPALIVE) == ([], [], []):
+                        continue
+                    pg.poll()
+                    while pg.notifies:
+                        payload = json.loads(pg.notifies.pop(0).payload)
+                        self.dispatch(payload['channels'], payload['event'])
+            except Exception:
+                logger.exception("Realtime listener lost its PostgreSQL connection, reconnecting")
+                time.sleep(1)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(REALTIME_BROKER)()
+
+
+def publish(channels, event_type, data):
+    # Envoi après le COMMIT : le client qui réagit à l'événement trouve la ligne en base
+    event = {'type': event_type, 'data': data}
+    transaction.on_commit(lambda: get_broker().publish(list(channels), event))
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'], cls=DjangoJSONEncoder)}\n\n"
+
+
+async def event_stream(subscription, keepalive=REALTIME_KEEPALIVE):
+    """Flux Server-Sent Events ; l'abonnement est libéré à la déconnexion du client."""
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                event = await subscription.get(keepalive)
+            except asyncio.TimeoutError:
+                # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event)
+    finally:
+        subscription.close()
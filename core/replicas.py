@@ -0,0 +1,115 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Vues en lecture seule servies par un réplica (noms d'URL)
+REPLICA_VIEWS = {
+    'feed', 'feed_page', 'personalized_feed', 'profile', 'search', 'search_suggestions', 'clubs',
+    'sitemap_index', 'sitemap_section',
+}
+# Après une écriture, les lectures de l'utilisateur restent sur le primaire le temps que le réplica rattrape
+STICKY_COOKIE = 'zevaba_primary'
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_alias = ContextVar('replica_read_alias', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+
+def choose_replica():
+    aliases = replica_aliases()
+    return random.choice(aliases) if aliases else None
+
+
+@contextmanager
+def replica_reads(alias=None):
+    """Lectures du bloc envoyées à un réplica (tiré au hasard) ; sans réplica configuré, rien ne change."""
+    token = _read_alias.set(alias or choose_replica())
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """Écritures sur default ; lectures sur le réplica choisi pour la requête en cours, s'il y en a un."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplicas et primaire portent les mêmes données
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Le schéma arrive sur les réplicas par la réplication
+        return db not in replica_aliases()
+
+
+class ReplicaReadsMiddleware:
+    """Vues de REPLICA_VIEWS sur un réplica, sauf pendant REPLICA_STICKY_SECONDS après une écriture de l'utilisateur."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Rien de bloquant à choisir l'alias : pas de passage par un thread en mode async
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.replica_alias = None
+        try:
+            response = self.get_response(request)
+        finally:
+            token = getattr(request, '_replica_token', None)
+            if token is not None:
+                _read_alias.reset(token)
+        return self._stick(request, response)
+
+    async def __acall__(self, request):
+        # Sous ASGI chaque requête tourne dans sa propre tâche : l'alias choisi ne lui survit pas
+        request.replica_alias = None
+        response = await self.get_response(request)
+        return self._stick(request, response)
+
+    def _stick(self, request, response):
+        if request.method not in READ_METHODS and replica_aliases() and sticky_seconds():
+            # Requête d'écriture (publication, like, message...) : lire ses propres écritures
+            response.set_cookie(
+                STICKY_COOKIE, int(time.time()), max_age=sticky_seconds(), httponly=True, samesite='Lax'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self._choose_replica(request)
+        return None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self._choose_replica(request)
+        return None
+
+    def _choose_replica(self, request):
+        if request.method not in READ_METHODS or STICKY_COOKIE in request.COOKIES:
+            return
+        if replica_aliases() and request.resolver_match.url_name in REPLICA_VIEWS:
+            # Remis à zéro dans __call__, après le rendu de la réponse (sous ASGI, fin de la tâche)
+            request.replica_alias = choose_replica()
+            request._replica_token = _read_alias.set(request.replica_alias)
@@ -0,0 +1,116 @@
+import logging
+import math
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from core.models import Publication, Reaction, ReactionSummary
+
+logger = logging.getLogger(__name__)
+
+# Demi-vie en heures : à engagement double, une publication vaut une autre de SCORE_HALF_LIFE heures plus récente
+SCORE_HALF_LIFE = getattr(settings, 'SCORE_HALF_LIFE_HOURS', 24)
+SCORE_LIKE_WEIGHT = 1.0
+SCORE_DISLIKE_WEIGHT = 1.0
+# Une réaction écrite pèse plus qu'un like ; une alternative argumentée plus qu'une adhésion
+SCORE_REACTION_WEIGHTS = {
+    'THOUGHT': 2.0,
+    'ADHERE': 1.5,
+    'SUPPORT': 1.5,
+    'ALTERNATIVE': 3.0,
+    'CLARIFY': 1.0,
+}
+SCORE_BATCH_SIZE = 50000
+
+REACTION_TYPES = [reaction_type for reaction_type, _ in Reaction.REACTION_CHOICES]
+REACTION_WEIGHTS = np.array([SCORE_REACTION_WEIGHTS.get(reaction_type, 1.0) for reaction_type in REACTION_TYPES])
+
+
+def compute_scores(created_at, likes, dislikes, reactions, half_life=SCORE_HALF_LIFE):
+    """
+    Scores d'un lot : created_at en secondes epoch, reactions de forme (n, len(REACTION_TYPES)).
+
+    engagement × 2^(-âge / demi-vie) se classe comme ln(1 + engagement) + t × ln2 / demi-vie :
+    le score ne dépend pas de l'heure du calcul et une publication nouvelle n'attend pas le job.
+    """
+    engagement = SCORE_LIKE_WEIGHT * likes - SCORE_DISLIKE_WEIGHT * dislikes + reactions @ REACTION_WEIGHTS
+    return np.log1p(np.maximum(engagement, 0)) + created_at / 3600 * (math.log(2) / half_life)
+
+
+def initial_score(publication):
+    # Publication sans engagement : le score ne dépend que de sa date
+    return float(compute_scores(
+        np.array([publication.created_at.timestamp()]), np.zeros(1), np.zeros(1),
+        np.zeros((1, len(REACTION_TYPES))),
+    )[0])
+
+
+def _load_batch(last_id, batch_size):
+    rows = list(
+        Publication.objects.filter(pk__gt=last_id).order_by('pk')
+        .values_list('pk', 'created_at', 'likes', 'dislikes', 'score')[:batch_size]
+    )
+    if not rows:
+        return None
+    ids, created_at, likes, dislikes, scores = zip(*rows)
+    ids = np.array(ids, dtype=np.int64)
+
+    # Réactions par type depuis les résumés dénormalisés, rangées par position dans le lot
+    reactions = np.zeros((len(ids), len(REACTION_TYPES)))
+    summaries = ReactionSummary.objects.filter(
+        publication_id__gte=ids[0], publication_id__lte=ids[-1], count__gt=0,
+    ).values_list('publication_id', 'type', 'count')
+    type_index = {reaction_type: column for column, reaction_type in enumerate(REACTION_TYPES)}
+    summary_rows = [(pk, type_index[kind], count) for pk, kind, count in summaries if kind in type_index]
+    if summary_rows:
+        publication_ids, columns, counts = (np.array(values) for values in zip(*summary_rows))
+        np.add.at(reactions, (np.searchsorted(ids, publication_ids), columns), counts)
+
+    return (
+        ids,
+        np.array([value.timestamp() for value in created_at]),
+        np.array(likes, dtype=np.float64),
+        np.array(dislikes, dtype=np.float64),
+        reactions,
+        np.array(scores, dtype=np.float64),
+    )
+
+
+def _write_scores(ids, scores):
+    table = Publication._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Une seule instruction par lot : UPDATE ... FROM unnest(ids, scores)
+            cursor.execute(
+                f'UPDATE {table} SET score = batch.score '
+                f'FROM unnest(%s::bigint[], %s::double precision[]) AS batch(id, score) WHERE {table}.id = batch.id',
+                [ids.tolist(), scores.tolist()],
+            )
+        else:
+            cursor.executemany(
+                f'UPDATE {table} SET score = %s WHERE id = %s', list(zip(scores.tolist(), ids.tolist()))
+            )
+
+
+def update_scores(batch_size=SCORE_BATCH_SIZE):
+    """Recalcule le score de toutes les publications par lots d'ids ; seuls les scores changés sont écrits."""
+    started = time.perf_counter()
+    last_id, scanned, written = 0, 0, 0
+    while True:
+        batch = _load_batch(last_id, batch_size)
+        if batch is None:
+            break
+        ids, created_at, likes, dislikes, reactions, old_scores = batch
+        scores = compute_scores(created_at, likes, dislikes, reactions)
+        changed = ~np.isclose(scores, old_scores, rtol=0, atol=1e-9)
+        if changed.any():
+            with transaction.atomic():
+                _write_scores(ids[changed], scores[changed])
+        scanned += len(ids)
+        written += int(changed.sum())
+        last_id = int(ids[-1])
+
+    logger.info(f"Scored {scanned} publications, {written} changed, in {time.perf_counter() - started:.1f}s")
+    return scanned, written
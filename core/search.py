@@ -0,0 +1,279 @@
+import logging
+import re
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection as default_connection, connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from core.models import Club, ClubMessage, Message, Publication, User
+
+logger = logging.getLogger(__name__)
+
+# kind -> (modèle, champs indexés) ; l'ordre fixe aussi le code numérique du kind
+SEARCH_DOCUMENTS = {
+    'user': (User, ['username']),
+    'club': (Club, ['name', 'description']),
+    'publication': (Publication, ['content']),
+    'message': (Message, ['content']),
+    'club_message': (ClubMessage, ['content']),
+}
+KIND_CODES = {kind: code for code, kind in enumerate(SEARCH_DOCUMENTS)}
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def tokenize(text):
+    # Même découpage que le tokenizer de l'index : lettres et chiffres uniquement
+    return re.findall(r'[^\W_]+', text.lower())
+
+
+def document_text(kind, instance):
+    _, fields = SEARCH_DOCUMENTS[kind]
+    return ' '.join(str(getattr(instance, field) or '') for field in fields)
+
+
+def kind_for_model(model):
+    for kind, (document_model, _) in SEARCH_DOCUMENTS.items():
+        if model is document_model:
+            return kind
+    return None
+
+
+class BaseSearchBackend:
+    def __init__(self, connection, routed=False):
+        # Écritures sur connection ; avec routed, les lectures suivent le router (réplica des vues en lecture)
+        self.connection = connection
+        self.routed = routed
+
+    def read_connection(self, kind):
+        if not self.routed:
+            return self.connection
+        return connections[router.db_for_read(SEARCH_DOCUMENTS[kind][0])]
+
+    def install(self):
+        pass
+
+    def uninstall(self):
+        pass
+
+    def index(self, kind, object_id, text):
+        pass
+
+    def index_many(self, kind, documents):
+        for object_id, text in documents:
+            self.index(kind, object_id, text)
+
+    def remove(self, kind, object_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def match_sql(self, kind, query, prefix=False):
+        """(sql, params) d'un SELECT object_id classé par pertinence, ou None si rien à chercher."""
+        raise NotImplementedError
+
+    def filter(self, queryset, kind, query, prefix=False):
+        match = self.match_sql(kind, query, prefix)
+        if match is None:
+            return queryset.none()
+        sql, params = match
+        return queryset.filter(pk__in=RawSQL(f'SELECT object_id FROM ({sql}) AS matches', params))
+
+    def search(self, kind, query, limit=20, prefix=False):
+        match = self.match_sql(kind, query, prefix)
+        if match is None:
+            return []
+        sql, params = match
+        with self.read_connection(kind).cursor() as cursor:
+            cursor.execute(f'{sql} LIMIT %s', [*params, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    def search_objects(self, kind, query, limit=20, prefix=False, queryset=None):
+        # Objets dans l'ordre de pertinence renvoyé par l'index
+        ids = self.search(kind, query, limit, prefix)
+        if queryset is None:
+            queryset = SEARCH_DOCUMENTS[kind][0].objects.all()
+        objects = queryset.in_bulk(ids)
+        return [objects[pk] for pk in ids if pk in objects]
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Table virtuelle FTS5 ; le rowid encode (kind, object_id) pour des mises à jour indexées."""
+
+    table = 'core_search_index'
+
+    def _rowid(self, kind, object_id):
+        return object_id * len(SEARCH_DOCUMENTS) + KIND_CODES[kind]
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5('
+                f"body, kind UNINDEXED, object_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def index(self, kind, object_id, text):
+        self.index_many(kind, [(object_id, text)])
+
+    def index_many(self, kind, documents):
+        rows = [(self._rowid(kind, object_id), text, kind, object_id) for object_id, text in documents]
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, body, kind, object_id) VALUES (%s, %s, %s, %s)', rows
+            )
+
+    def remove(self, kind, object_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [self._rowid(kind, object_id)])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def match_sql(self, kind, query, prefix=False):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        expression = ' '.join(f'"{token}"*' if prefix else f'"{token}"' for token in tokens)
+        sql = (
+            f'SELECT object_id FROM {self.table} WHERE {self.table} MATCH %s AND kind = %s '
+            f'ORDER BY bm25({self.table})'
+        )
+        return sql, [expression, kind]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector généré + index GIN ; classement par ts_rank."""
+
+    table = 'core_search_document'
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                'kind varchar(20) NOT NULL, '
+                'object_id bigint NOT NULL, '
+                'body text NOT NULL, '
+                "document tsvector GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED, "
+                'PRIMARY KEY (kind, object_id))'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {self.table}_document_gin ON {self.table} USING gin (document)'
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def index(self, kind, object_id, text):
+        self.index_many(kind, [(object_id, text)])
+
+    def index_many(self, kind, documents):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (kind, object_id, body) VALUES (%s, %s, %s) '
+                'ON CONFLICT (kind, object_id) DO UPDATE SET body = EXCLUDED.body',
+                [(kind, object_id, text) for object_id, text in documents],
+            )
+
+    def remove(self, kind, object_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE kind = %s AND object_id = %s', [kind, object_id])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {self.table}')
+
+    def match_sql(self, kind, query, prefix=False):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        expression = ' & '.join(f'{token}:*' if prefix else token for token in tokens)
+        sql = (
+            f"SELECT object_id FROM {self.table} WHERE kind = %s AND document @@ to_tsquery('simple', %s) "
+            f"ORDER BY ts_rank(document, to_tsquery('simple', %s)) DESC"
+        )
+        return sql, [kind, expression, expression]
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """Repli sans index plein texte : icontains sur les champs indexés."""
+
+    def _queryset(self, kind, query):
+        model, fields = SEARCH_DOCUMENTS[kind]
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        queryset = model.objects.all()
+        for token in tokens:
+            queryset = queryset.filter(reduce(or_, [Q(**{f'{field}__icontains': token}) for field in fields]))
+        return queryset
+
+    def filter(self, queryset, kind, query, prefix=False):
+        matches = self._queryset(kind, query)
+        return queryset.none() if matches is None else queryset.filter(pk__in=matches.values('pk'))
+
+    def search(self, kind, query, limit=20, prefix=False):
+        matches = self._queryset(kind, query)
+        return [] if matches is None else list(matches.values_list('pk', flat=True)[:limit])
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(connection=None):
+    # Sans connexion explicite (vues, signaux) : lectures routées, écritures sur le primaire
+    routed = connection is None
+    connection = connection or default_connection
+    backend_path = getattr(settings, 'SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)(connection, routed=routed)
+    return BACKENDS.get(connection.vendor, LikeSearchBackend)(connection, routed=routed)
+
+
+def index_object(instance):
+    kind = kind_for_model(type(instance))
+    if kind is not None:
+        get_search_backend().index(kind, instance.pk, document_text(kind, instance))
+
+
+def remove_object(instance):
+    kind = kind_for_model(type(instance))
+    if kind is not None:
+        get_search_backend().remove(kind, instance.pk)
+
+
+def rebuild_search_index(batch_size=REBUILD_BATCH_SIZE):
+    backend = get_search_backend()
+    backend.install()
+    backend.clear()
+    counts = {}
+    for kind, (model, fields) in SEARCH_DOCUMENTS.items():
+        total = 0
+        last_id = 0
+        while True:
+            # Parcours par clé primaire pour ne garder qu'un lot en mémoire
+            batch = list(
+                model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', *fields)[:batch_size]
+            )
+            if not batch:
+                break
+            backend.index_many(kind, [(row[0], ' '.join(str(value or '') for value in row[1:])) for row in batch])
+            total += len(batch)
+            last_id = batch[-1][0]
+        counts[kind] = total
+    logger.info(f"Search index rebuilt: {counts}")
+    return counts
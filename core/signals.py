@@ -0,0 +1,247 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.conversations import add_club_participants, remove_club_participants
+from core.caching import invalidate
+from core.counters import reaction_summary_changed, related_ids, relation_changed, row_changed, source_models
+from core.media import classify_media
+from core.models import (
+    Challenge, Club, ClubMembership, ClubMessage, Media, Message, Notification, Page, Publication, Reaction, User,
+)
+from core.realtime import club_channel, publish, user_channel
+from core.scoring import initial_score
+from core.search import SEARCH_DOCUMENTS, index_object, remove_object
+from core.suggestions import suggestion_service
+from core.timelines import schedule_fan_out, schedule_rebuild, timeline_enabled
+
+
+@receiver(m2m_changed, sender=Club.members.through)
+def sync_club_conversation_participants(sender, instance, action, reverse, pk_set, **kwargs):
+    # club.members.add(...) ou user.joined_clubs.add(...) : instance change de rôle selon reverse
+    if action == 'post_add':
+        if reverse:
+            for club_id in pk_set:
+                add_club_participants(club_id, [instance.pk])
+        else:
+            add_club_participants(instance.pk, pk_set)
+    elif action == 'post_remove':
+        if reverse:
+            for club_id in pk_set:
+                remove_club_participants(club_id, [instance.pk])
+        else:
+            remove_club_participants(instance.pk, pk_set)
+    elif action == 'post_clear' and not reverse:
+        remove_club_participants(instance.pk)
+
+
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    # Ex. la connexion ne touche que last_login : inutile de réindexer
+    fields = next(fields for model, fields in SEARCH_DOCUMENTS.values() if model is sender)
+    if update_fields and not set(update_fields) & set(fields):
+        return
+    index_object(instance)
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_object(instance)
+
+
+for kind, (model, fields) in SEARCH_DOCUMENTS.items():
+    post_save.connect(update_search_index, sender=model, dispatch_uid=f'search_index_{kind}')
+    post_delete.connect(remove_from_search_index, sender=model, dispatch_uid=f'search_remove_{kind}')
+
+
+# Champs de User dont dépendent les receivers post_save : comparés à la ligne enregistrée
+TRACKED_USER_FIELDS = ('username', 'is_active', 'is_mentor')
+
+
+@receiver(pre_save, sender=User)
+def track_user_changes(sender, instance, raw=False, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(TRACKED_USER_FIELDS):
+        # Ex. la connexion ne touche que last_login : aucune requête
+        instance._changed_fields = set()
+        return
+    saved = None
+    if not raw and not instance._state.adding:
+        saved = sender.objects.filter(pk=instance.pk).values(*TRACKED_USER_FIELDS).first()
+    if saved is None:
+        instance._changed_fields = set(TRACKED_USER_FIELDS)
+    else:
+        instance._changed_fields = {field for field, value in saved.items() if getattr(instance, field) != value}
+
+
+@receiver(post_save, sender=User)
+def update_user_suggestions(sender, instance, **kwargs):
+    if {'username', 'is_active'} & instance._changed_fields:
+        suggestion_service.update('user', instance.pk, instance.username if instance.is_active else None)
+
+
+@receiver(post_save, sender=Club)
+def update_club_suggestions(sender, instance, **kwargs):
+    suggestion_service.update('club', instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Club)
+def remove_suggestion(sender, instance, **kwargs):
+    suggestion_service.update('user' if sender is User else 'club', instance.pk, None)
+
+
+# Invalidation du cache : chaque modèle incrémente la génération des pages qui l'affichent.
+# Les publications n'en ont pas : leurs fragments sont indexés sur updated_at
+CACHE_NAMESPACES = {
+    Club: ['clubs'],
+    ClubMembership: ['clubs'],
+    Challenge: ['challenges'],
+}
+
+
+def invalidate_cached_pages(sender, instance, **kwargs):
+    invalidate(*CACHE_NAMESPACES[sender])
+
+
+for model in CACHE_NAMESPACES:
+    post_save.connect(invalidate_cached_pages, sender=model, dispatch_uid=f'cache_{model.__name__}_save')
+    post_delete.connect(invalidate_cached_pages, sender=model, dispatch_uid=f'cache_{model.__name__}_delete')
+
+
+@receiver(pre_save, sender=Publication)
+def score_new_publication(sender, instance, raw=False, **kwargs):
+    # Classée dès sa création dans le tri par score, sans attendre update_scores
+    if instance._state.adding and not raw:
+        instance.score = initial_score(instance)
+
+
+@receiver(pre_save, sender=Media)
+def classify_uploaded_media(sender, instance, raw=False, **kwargs):
+    # Détection une seule fois, au premier enregistrement du fichier ; les téléversements en transit
+    # sont classés par process_media, les anciens médias par la commande classify_media
+    if instance.file and not instance.media_type and not raw:
+        classify_media(instance)
+
+
+@receiver(post_save, sender=Reaction)
+def summarize_created_reaction(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        reaction_summary_changed(instance.publication_id, instance.type, 1)
+
+
+@receiver(post_delete, sender=Reaction)
+def summarize_deleted_reaction(sender, instance, **kwargs):
+    reaction_summary_changed(instance.publication_id, instance.type, -1)
+
+
+@receiver(post_save, sender=Media)
+@receiver(post_delete, sender=Media)
+def touch_publication(sender, instance, **kwargs):
+    # Le fragment de carte est indexé sur updated_at : un média modifié doit le renouveler
+    Publication.objects.filter(pk=instance.publication_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def invalidate_mentors(sender, instance, **kwargs):
+    # Devenu mentor ou ne l'étant plus ; la liste affiche aussi le nom des mentors
+    if 'is_mentor' in instance._changed_fields or (instance.is_mentor and 'username' in instance._changed_fields):
+        invalidate('mentors')
+
+
+@receiver(m2m_changed, sender=Club.members.through)
+def invalidate_club_members(sender, **kwargs):
+    if kwargs['action'] in ('post_add', 'post_remove', 'post_clear'):
+        invalidate('clubs')
+
+
+# Compteurs dénormalisés. add() passe par bulk_create : seul m2m_changed le voit.
+# Les suppressions sur ClubMembership émettent post_delete ligne par ligne ; les tables
+# de liaison auto-créées n'émettent rien, d'où pre_remove/pre_clear et pre_delete ci-dessous
+def count_created_row(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        row_changed(sender, instance, 1)
+
+
+def count_deleted_row(sender, instance, **kwargs):
+    row_changed(sender, instance, -1)
+
+
+for model in source_models():
+    if not model._meta.auto_created:
+        post_save.connect(count_created_row, sender=model, dispatch_uid=f'counters_{model.__name__}_save')
+        post_delete.connect(count_deleted_row, sender=model, dispatch_uid=f'counters_{model.__name__}_delete')
+
+
+COUNTED_RELATIONS = {
+    field.remote_field.through: field
+    for field in (Club._meta.get_field('members'), User._meta.get_field('followers'),
+                  Page._meta.get_field('subscribers'))
+}
+
+
+def count_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    field = COUNTED_RELATIONS[sender]
+    if action == 'post_add':
+        relation_changed(field, instance, reverse, pk_set, 1)
+    elif sender._meta.auto_created and action in ('pre_remove', 'pre_clear'):
+        relation_changed(field, instance, reverse, related_ids(field, instance, reverse, pk_set), -1)
+
+
+for through in COUNTED_RELATIONS:
+    m2m_changed.connect(count_relations, sender=through, dispatch_uid=f'counters_{through.__name__}')
+
+
+@receiver(pre_delete, sender=User)
+@receiver(pre_delete, sender=Page)
+def count_cascaded_relations(sender, instance, **kwargs):
+    # Cascade sur une table auto-créée : on retire les liens de chaque côté où figure l'instance
+    for through, field in COUNTED_RELATIONS.items():
+        if not through._meta.auto_created:
+            continue
+        for reverse, model in ((False, field.model), (True, field.related_model)):
+            if model is sender:
+                relation_changed(field, instance, reverse, related_ids(field, instance, reverse), -1)
+
+
+# Temps réel (core.realtime) : les clients connectés sont prévenus dès le COMMIT
+@receiver(post_save, sender=Message)
+def push_direct_message(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        publish([user_channel(instance.recipient_id)], 'direct_message', {
+            'id': instance.pk,
+            'sender_id': instance.sender_id,
+            'sender': instance.sender.username,
+            'content': instance.content,
+            'created_at': instance.created_at.strftime('%d/%m/%Y %H:%M'),
+        })
+
+
+@receiver(post_save, sender=ClubMessage)
+def push_club_message(sender, instance, created, raw=False, **kwargs):
+    # Simple signal : le client va chercher le rendu via le polling par id (core.club_chat)
+    if created and not raw:
+        publish([club_channel(instance.club_id)], 'club_message', {'id': instance.pk, 'parent_id': instance.parent_id})
+
+
+@receiver(post_save, sender=Notification)
+def push_notification(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        publish([user_channel(instance.user_id)], 'notification', {'message': instance.message})
+
+
+# Fil matérialisé (FEED_TIMELINE) : fan-out à la création ou à la modification d'une publication ;
+# un club rejoint/quitté ou un abonnement change recalcule le fil des utilisateurs concernés
+@receiver(post_save, sender=Publication)
+def push_publication_to_timelines(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or not timeline_enabled():
+        return
+    # Sauvegardes partielles (likes, compteurs) : le club et l'auteur n'ont pas changé
+    if created or update_fields is None:
+        schedule_fan_out(instance)
+
+
+@receiver(m2m_changed, sender=Club.members.through)
+@receiver(m2m_changed, sender=User.followers.through)
+def rebuild_changed_timelines(sender, instance, action, reverse, pk_set, **kwargs):
+    if not timeline_enabled() or action not in ('post_add', 'post_remove'):
+        return
+    # club.members.add(u) / author.followers.add(u) : pk_set ; u.joined_clubs / u.following : instance
+    schedule_rebuild([instance.pk] if reverse else pk_set)
@@ -1,12 +1,50 @@
+import gzip
+import json
+import logging
+import os
+from bisect import bisect_right
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.core.cache import cache
+from django.db.models import Count
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from core.background import BackgroundQueue
 from .models import Publication, Club, Challenge, Page
 
+logger = logging.getLogger(__name__)
+
+# Limite du protocole sitemaps : 50 000 URL par fichier
+SITEMAP_LIMIT = 50000
+SITEMAP_ROOT = Path(getattr(settings, 'SITEMAP_ROOT', settings.BASE_DIR / 'sitemaps'))
+SITEMAP_MAX_AGE = getattr(settings, 'SITEMAP_MAX_AGE', 3600)
+# Aucun sitemap encore construit : délai suggéré aux robots avant de revenir
+SITEMAP_RETRY_AFTER = getattr(settings, 'SITEMAP_RETRY_AFTER', 120)
+SITE_URL = getattr(settings, 'SITE_URL', 'http://localhost:8000').rstrip('/')
+INDEX_FILE = 'sitemap.xml.gz'
+MANIFEST_FILE = 'manifest.json'
+BUILD_LOCK = 'sitemaps:building'
+STREAM_CHUNK_SIZE = 64 * 1024
+
+sitemap_queue = BackgroundQueue('sitemaps')
+
+
 class PublicationSitemap(Sitemap):
     changefreq = "daily"
     priority = 0.9
+    limit = SITEMAP_LIMIT
+    lastmod_field = 'updated_at'
 
     def items(self):
-        return Publication.objects.all()
+        return Publication.objects.only('id', 'updated_at').order_by('id')
 
     def lastmod(self, obj):
         return obj.updated_at  # or obj.created_at
@@ -14,20 +52,221 @@ class PublicationSitemap(Sitemap):
 class ClubSitemap(Sitemap):
     changefreq = "weekly"
     priority = 0.7
+    limit = SITEMAP_LIMIT
+    lastmod_field = None
 
     def items(self):
-        return Club.objects.all()
+        return Club.objects.only('id').order_by('id')
 
 class ChallengeSitemap(Sitemap):
     changefreq = "monthly"
     priority = 0.6
+    limit = SITEMAP_LIMIT
+    lastmod_field = None
 
     def items(self):
-        return Challenge.objects.all()
+        return Challenge.objects.only('id').order_by('id')
 
 class PageSitemap(Sitemap):
     changefreq = "yearly"
     priority = 0.5
+    limit = SITEMAP_LIMIT
+    lastmod_field = None
 
     def items(self):
-        return Page.objects.all()
+        return Page.objects.only('id').order_by('id')
+
+
+SITEMAPS = {
+    'publications': PublicationSitemap,
+    'clubs': ClubSitemap,
+    'challenges': ChallengeSitemap,
+    'pages': PageSitemap,
+}
+
+
+def section_filename(name, number):
+    return f'sitemap-{name}-{number}.xml.gz'
+
+
+def _section_queryset(queryset, section):
+    # Sections = plages d'id figées : un nouvel objet ne décale jamais les sections existantes
+    queryset = queryset.filter(pk__gte=section['first_id'])
+    if section['last_id'] is not None:
+        queryset = queryset.filter(pk__lte=section['last_id'])
+    return queryset
+
+
+def _split_full_tail(queryset, sections):
+    # La dernière section reste ouverte jusqu'à SITEMAP_LIMIT URL, puis on la ferme
+    while True:
+        tail = sections[-1]
+        boundary = list(
+            _section_queryset(queryset, tail).values_list('pk', flat=True)[SITEMAP_LIMIT - 1:SITEMAP_LIMIT + 1]
+        )
+        if len(boundary) < 2:
+            return
+        tail['last_id'] = boundary[0]
+        sections.append({'first_id': boundary[1], 'last_id': None, 'count': None, 'lastmod': None})
+
+
+def _write_gzip(path, chunks):
+    # Écriture atomique : un robot ne lit jamais un fichier à moitié écrit
+    tmp = path.with_name(path.name + '.tmp')
+    with gzip.open(tmp, 'wt', encoding='utf-8') as out:
+        for chunk in chunks:
+            out.write(chunk)
+    os.replace(tmp, path)
+
+
+def _render_section(path, sitemap, queryset):
+    state = {'lastmod': None}
+
+    def urls():
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        for obj in queryset.iterator(chunk_size=2000):
+            entry = f'<url><loc>{escape(SITE_URL + sitemap.location(obj))}</loc>'
+            if sitemap.lastmod_field:
+                lastmod = getattr(obj, sitemap.lastmod_field)
+                state['lastmod'] = max(state['lastmod'] or lastmod, lastmod)
+                entry += f'<lastmod>{lastmod.date().isoformat()}</lastmod>'
+            yield f'{entry}<changefreq>{sitemap.changefreq}</changefreq><priority>{sitemap.priority}</priority></url>\n'
+        yield '</urlset>\n'
+
+    _write_gzip(path, urls())
+    return state['lastmod']
+
+
+def _render_index(manifest):
+    def entries():
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        for name, sections in manifest['sections'].items():
+            for number, section in enumerate(sections, start=1):
+                loc = escape(SITE_URL + reverse('sitemap_section', args=[name, number]))
+                lastmod = f"<lastmod>{section['lastmod'][:10]}</lastmod>" if section['lastmod'] else ''
+                yield f'<sitemap><loc>{loc}</loc>{lastmod}</sitemap>\n'
+        yield '</sitemapindex>\n'
+
+    _write_gzip(SITEMAP_ROOT / INDEX_FILE, entries())
+
+
+def load_manifest():
+    try:
+        return json.loads((SITEMAP_ROOT / MANIFEST_FILE).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def build_sitemaps(full=False):
+    """Régénère les sections modifiées depuis le dernier passage (toutes si full)."""
+    if not cache.add(BUILD_LOCK, True, 600):
+        logger.info("Sitemap build already running, skipped")
+        return None
+    try:
+        SITEMAP_ROOT.mkdir(parents=True, exist_ok=True)
+        previous = None if full else load_manifest()
+        started_at = timezone.now()
+        manifest = {'built_at': started_at.isoformat(), 'sections': {}}
+        rendered = 0
+
+        for name, sitemap_class in SITEMAPS.items():
+            sitemap = sitemap_class()
+            queryset = sitemap.items()
+            sections = (previous or {}).get('sections', {}).get(name) or [
+                {'first_id': 0, 'last_id': None, 'count': None, 'lastmod': None}
+            ]
+            _split_full_tail(queryset, sections)
+
+            # Sections touchées par des mises à jour depuis le dernier passage (index sur updated_at)
+            touched = set()
+            if previous and sitemap.lastmod_field:
+                since = parse_datetime(previous['built_at'])
+                changed_ids = queryset.filter(**{f'{sitemap.lastmod_field}__gte': since}).values_list('pk', flat=True)
+                first_ids = [section['first_id'] for section in sections]
+                touched = {bisect_right(first_ids, pk) - 1 for pk in changed_ids.iterator()}
+
+            for number, section in enumerate(sections):
+                section_queryset = _section_queryset(queryset, section)
+                # Un objet supprimé change le compte ; comptage sur l'index de clé primaire
+                count = section_queryset.aggregate(total=Count('pk'))['total']
+                path = SITEMAP_ROOT / section_filename(name, number + 1)
+                if number in touched or count != section['count'] or not path.exists():
+                    lastmod = _render_section(path, sitemap, section_queryset)
+                    section.update(count=count, lastmod=lastmod.isoformat() if lastmod else None)
+                    rendered += 1
+            manifest['sections'][name] = sections
+
+        _render_index(manifest)
+        tmp = SITEMAP_ROOT / (MANIFEST_FILE + '.tmp')
+        tmp.write_text(json.dumps(manifest))
+        os.replace(tmp, SITEMAP_ROOT / MANIFEST_FILE)
+        logger.info(f"Sitemaps built: {rendered} section(s) rendered in {timezone.now() - started_at}")
+        return manifest
+    finally:
+        cache.delete(BUILD_LOCK)
+
+
+def _schedule_build():
+    # Jamais dans la requête : la construction parcourt toutes les tables
+    if cache.get(BUILD_LOCK) is None:
+        sitemap_queue.submit(build_sitemaps)
+
+
+def _refresh_if_stale():
+    manifest = load_manifest()
+    if manifest is None or not (SITEMAP_ROOT / INDEX_FILE).exists():
+        _schedule_build()
+    elif (timezone.now() - parse_datetime(manifest['built_at'])).total_seconds() > SITEMAP_MAX_AGE:
+        # La copie existante reste servie pendant la reconstruction
+        _schedule_build()
+
+
+def accepts_gzip(header):
+    """Accept-Encoding avec ses q-values : « gzip;q=0 » refuse gzip."""
+    qualities = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get('gzip', qualities.get('x-gzip', qualities.get('*', 0))) > 0
+
+
+def _gunzip_chunks(path):
+    with gzip.open(path, 'rb') as source:
+        while chunk := source.read(STREAM_CHUNK_SIZE):
+            yield chunk
+
+
+def sitemap_response(request, filename):
+    """Sert un fichier pré-généré, compressé tel quel si le client accepte gzip."""
+    if filename == INDEX_FILE:
+        _refresh_if_stale()
+    path = SITEMAP_ROOT / filename
+    if not path.exists():
+        if load_manifest() is None:
+            # Premier passage en cours en tâche de fond
+            response = HttpResponse('Sitemap en cours de génération', status=503, content_type='text/plain')
+            response['Retry-After'] = str(SITEMAP_RETRY_AFTER)
+            return response
+        raise Http404
+    mtime = path.stat().st_mtime
+    if not was_modified_since(request.headers.get('If-Modified-Since'), mtime):
+        return HttpResponseNotModified()
+
+    if accepts_gzip(request.headers.get('Accept-Encoding', '')):
+        response = HttpResponse(path.read_bytes(), content_type='application/xml')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(_gunzip_chunks(path), content_type='application/xml')
+    response['Last-Modified'] = http_date(mtime)
+    response['Vary'] = 'Accept-Encoding'
+    return response
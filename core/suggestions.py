@@ -0,0 +1,260 @@
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.models import Club, User
+
+logger = logging.getLogger(__name__)
+
+SUGGESTIONS_LIMIT = 5
+# Préfixes très courts : on borne le balayage, le classement reste approché
+SUGGESTIONS_MAX_SCAN = 1000
+SUGGESTIONS_CACHE_TTL = getattr(settings, 'SUGGESTIONS_CACHE_TTL', 30)
+# Reconstruction complète périodique : rattrape les écritures faites par les autres workers
+SUGGESTIONS_INDEX_MAX_AGE = getattr(settings, 'SUGGESTIONS_INDEX_MAX_AGE', 300)
+# Index en retard sur la génération partagée : rechargé au plus une fois par intervalle
+SUGGESTIONS_RELOAD_INTERVAL = getattr(settings, 'SUGGESTIONS_RELOAD_INTERVAL', 5)
+GENERATION_KEY = 'suggestions:generation'
+
+KINDS = ('user', 'club')
+
+
+def normalize(text):
+    # Minuscules sans accents : « Écologie » et « ecolo » doivent se rencontrer
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def name_tokens(name):
+    normalized = normalize(name)
+    tokens = {normalized}
+    tokens.update(token for token in normalized.replace('_', ' ').replace('-', ' ').split() if token)
+    return tokens
+
+
+def shared_generation():
+    """Génération des suggestions commune à tous les workers, conservée dans le cache partagé."""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+async def ashared_generation():
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        # Clé expulsée du cache : nouvelle valeur, différente de celles déjà vues
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        return cache.get(GENERATION_KEY)
+
+
+class PrefixIndex:
+    """Tableau trié de (token, id) : une recherche par préfixe est une bissection + un balayage.
+
+    L'état (keys, names) n'est jamais modifié en place : les écritures en construisent une
+    copie et la publient d'une seule affectation, les lectures n'en voient qu'une version.
+    """
+
+    def __init__(self):
+        self.state = ([], {})
+
+    @property
+    def keys(self):
+        return self.state[0]
+
+    @property
+    def names(self):
+        return self.state[1]
+
+    @staticmethod
+    def _without(keys, names, object_id):
+        name = names.pop(object_id, None)
+        if name is None:
+            return keys
+        removed = {(token, object_id) for token in name_tokens(name)}
+        return [key for key in keys if key not in removed]
+
+    def add(self, object_id, name):
+        keys, names = self.state
+        names = dict(names)
+        keys = self._without(keys, names, object_id)
+        names[object_id] = name
+        new_keys = sorted((token, object_id) for token in name_tokens(name))
+        merged = list(keys)
+        for key in new_keys:
+            merged.insert(bisect_left(merged, key), key)
+        self.state = (merged, names)
+
+    def remove(self, object_id):
+        keys, names = self.state
+        if object_id not in names:
+            return
+        names = dict(names)
+        self.state = (self._without(keys, names, object_id), names)
+
+    def load(self, rows):
+        names = dict(rows)
+        keys = sorted((token, object_id) for object_id, name in names.items() for token in name_tokens(name))
+        self.state = (keys, names)
+
+    def lookup(self, query, limit):
+        full_query = normalize(query)
+        tokens = sorted(name_tokens(query) - {full_query}, key=len, reverse=True) or [full_query]
+        if not tokens[0]:
+            return []
+
+        # Une seule lecture de l'état : keys et names restent cohérents pendant tout le calcul
+        keys, names = self.state
+
+        # Balayage sur le token le plus long, puis filtre sur les autres
+        matches = set()
+        position = bisect_left(keys, (tokens[0],))
+        end = min(len(keys), position + SUGGESTIONS_MAX_SCAN)
+        while position < end and keys[position][0].startswith(tokens[0]):
+            matches.add(keys[position][1])
+            position += 1
+
+        results = []
+        for object_id in matches:
+            name = names.get(object_id)
+            if name is None:
+                continue
+            name_parts = name_tokens(name)
+            if all(any(part.startswith(token) for part in name_parts) for token in tokens[1:]):
+                normalized = normalize(name)
+                results.append((not normalized.startswith(full_query), len(normalized), object_id, name))
+        results.sort()
+        return [(object_id, name) for _, _, object_id, name in results[:limit]]
+
+
+class SuggestionService:
+    def __init__(self):
+        self.indexes = {kind: PrefixIndex() for kind in KINDS}
+        # Génération partagée dont l'index local reflète toutes les écritures
+        self.generation = None
+        self.loaded_at = None
+        self._lock = threading.Lock()
+
+    def _needs_reload(self, generation):
+        if self.loaded_at is None:
+            return True
+        age = time.monotonic() - self.loaded_at
+        if age >= SUGGESTIONS_INDEX_MAX_AGE:
+            return True
+        return generation != self.generation and age >= SUGGESTIONS_RELOAD_INTERVAL
+
+    def _ensure_loaded(self, generation):
+        if not self._needs_reload(generation):
+            return
+        with self._lock:
+            if not self._needs_reload(generation):
+                return
+            started = time.monotonic()
+            # Génération lue avant le chargement : une écriture concurrente laissera l'index en retard
+            self.indexes['user'].load(User.objects.filter(is_active=True).values_list('id', 'username').iterator())
+            self.indexes['club'].load(Club.objects.values_list('id', 'name').iterator())
+            self.generation = generation
+            self.loaded_at = time.monotonic()
+            logger.info(
+                f"Suggestion index loaded: {len(self.indexes['user'].names)} users, "
+                f"{len(self.indexes['club'].names)} clubs in {self.loaded_at - started:.2f}s"
+            )
+
+    def update(self, kind, object_id, name):
+        # Après le COMMIT : un worker qui recharge à la nouvelle génération doit voir la ligne
+        transaction.on_commit(partial(self._apply, kind, object_id, name))
+
+    def _apply(self, kind, object_id, name):
+        with self._lock:
+            # Génération partagée : les suggestions en cache sont périmées pour tous les workers
+            generation = bump_generation()
+            if self.loaded_at is None:
+                return
+            if name is None:
+                self.indexes[kind].remove(object_id)
+            else:
+                self.indexes[kind].add(object_id, name)
+            # À jour seulement si aucun autre worker n'a écrit depuis notre dernière synchronisation
+            if self.generation is not None and generation == self.generation + 1:
+                self.generation = generation
+            else:
+                self.generation = None
+
+    def _cache_key(self, generation, prefix):
+        return f'suggestions:{generation}:{hashlib.md5(prefix.encode()).hexdigest()}'
+
+    def _lookup(self, prefix, limit):
+        return {
+            'users': [{'id': pk, 'username': name} for pk, name in self.indexes['user'].lookup(prefix, limit)],
+            'clubs': [{'id': pk, 'name': name} for pk, name in self.indexes['club'].lookup(prefix, limit)],
+        }
+
+    def suggest(self, query, limit=SUGGESTIONS_LIMIT):
+        """Suggestions indépendantes du lecteur, mises en cache par préfixe."""
+        generation = shared_generation()
+        self._ensure_loaded(generation)
+        prefix = normalize(query.strip())[:50]
+        if not prefix:
+            return {'users': [], 'clubs': []}
+
+        cache_key = self._cache_key(generation, prefix)
+        data = cache.get(cache_key)
+        if data is None:
+            data = self._lookup(prefix, limit)
+            # Index en retard : résultat servi mais pas partagé sous une génération qu'il ne reflète pas
+            if generation == self.generation:
+                cache.set(cache_key, data, SUGGESTIONS_CACHE_TTL)
+        return data
+
+    async def asuggest(self, query, limit=SUGGESTIONS_LIMIT):
+        """suggest() pour les vues async : cache lu sans thread, index rechargé hors de la boucle."""
+        generation = await ashared_generation()
+        if self._needs_reload(generation):
+            # Seul le (re)chargement de l'index lit la base ; la recherche reste sur la boucle
+            await sync_to_async(self._ensure_loaded)(generation)
+        prefix = normalize(query.strip())[:50]
+        if not prefix:
+            return {'users': [], 'clubs': []}
+
+        cache_key = self._cache_key(generation, prefix)
+        data = await cache.aget(cache_key)
+        if data is None:
+            data = self._lookup(prefix, limit)
+            if generation == self.generation:
+                await cache.aset(cache_key, data, SUGGESTIONS_CACHE_TTL)
+        return data
+
+
+suggestion_service = SuggestionService()
+
+
+async def asuggestions_for(user, query):
+    data = await suggestion_service.asuggest(query)
+    club_ids = [club['id'] for club in data['clubs']]
+    # Appartenance : une seule requête bornée aux clubs proposés
+    member_of = {
+        club_id async for club_id in user.joined_clubs.filter(id__in=club_ids).values_list('id', flat=True)
+    } if club_ids else set()
+    return {
+        'users': data['users'],
+        'clubs': [{**club, 'is_member': club['id'] in member_of} for club in data['clubs']],
+    }
@@ -0,0 +1,17 @@
+from django import template
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core.caching import cached_fragment
+
+register = template.Library()
+
+
+@register.simple_tag
+def publication_body(publication):
+    # En-tête + médias : identiques pour tous les lecteurs, clé sur updated_at
+    return mark_safe(cached_fragment(
+        'publication_body',
+        [publication.pk, publication.updated_at.isoformat()],
+        lambda: render_to_string('publications/publication_body.html', {'publication': publication}),
+    ))
@@ -1,3 +1,1335 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+import gzip
+import hashlib
+import importlib
+import subprocess
+import sys
+import tempfile
+import threading
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.apps import apps
+from django.db import IntegrityError, connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.template import Context, Template
+from django.urls import reverse
+from PIL import Image, ImageCms
+from django.utils import timezone
+
+from core.feed import SORT_DISCUSSED, SORT_TOP, TIER_CLUBS, TIER_FOLLOWING, TIER_OTHER, InvalidCursor, feed_page
+from core import sitemaps, threads, views
+from core.backends.sqlite3.base import DatabaseWrapper as TunedSQLiteWrapper
+from core.club_chat import CHAT_PAGE_SIZE
+from core.conversations import (
+    club_key, mark_club_read, rebuild_conversations, record_club_message, record_direct_message,
+)
+from core.suggestions import PrefixIndex, bump_generation, suggestion_service
+from core.threads import THREAD_MAX_DEPTH, attach_threads, load_thread
+from core.timelines import timeline_page
+from core.models import (
+    Challenge, Club, ClubMembership, ClubMessage, ConversationParticipant, Media, Message, Notification, Page, Publication, Reaction, ReactionSummary, Reply,
+    TimelineEntry, Upload, User,
+)
+from core.notifications import fan_out_club_message
+from core.queries import publications_for_display
+from core.realtime import InProcessBroker, club_channel, event_stream, user_channel
+from core.scoring import update_scores
+from core.votes import toggle_vote
+
+
+def create_feed(reader):
+    """Publications réparties sur les trois rangs du fil de reader, à des dates entremêlées."""
+    author = User.objects.create_user('feed_author', password='x')
+    followed = User.objects.create_user('feed_followed', password='x')
+    joined = Club.objects.create(name='Joined', description='feed', creator=author)
+    other = Club.objects.create(name='Other', description='feed', creator=author)
+    joined.members.add(reader)
+    followed.followers.add(reader)
+    now = timezone.now()
+    for number in range(30):
+        Publication.objects.create(
+            user=(author, followed)[number % 2], club=(joined, other, None)[number % 3],
+            content=f'feed {number}', created_at=now - timedelta(minutes=number % 7),
+        )
+
+
+def expected_feed(reader):
+    joined = set(reader.joined_clubs.values_list('id', flat=True))
+    following = set(reader.following.values_list('id', flat=True))
+
+    def tier(publication):
+        if publication.club_id in joined:
+            return TIER_CLUBS
+        return TIER_FOLLOWING if publication.user_id in following else TIER_OTHER
+
+    publications = Publication.objects.all()
+    return [p.pk for p in sorted(publications, key=lambda p: (tier(p), -p.created_at.timestamp(), -p.pk))]
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader', password='x')
+        create_feed(self.reader)
+
+    def test_pages_follow_the_ranked_order(self):
+        seen, cursor = [], None
+        while True:
+            publications, cursor = feed_page(self.reader, cursor=cursor, page_size=7)
+            seen += [publication.pk for publication in publications]
+            if not cursor:
+                break
+        self.assertEqual(seen, expected_feed(self.reader))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            feed_page(self.reader, cursor='not-a-cursor')
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('feed_page'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_feed_page_endpoint(self):
+        self.client.force_login(self.reader)
+        data = self.client.get(reverse('feed_page')).json()
+        self.assertTrue(data['success'])
+        self.assertTrue(data['next_cursor'])
+        data = self.client.get(reverse('feed_page'), {'cursor': data['next_cursor']}).json()
+        self.assertTrue(data['html'])
+
+
+class PublicationQueriesTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader', password='x')
+        self.author = User.objects.create_user('author', password='x')
+
+    def publish(self, count):
+        for number in range(count):
+            publication = Publication.objects.create(user=self.author, content=f'card {number}')
+            reaction = Reaction.objects.create(user=self.reader, publication=publication, comment='card')
+            Reply.objects.create(reaction=reaction, user=self.author, comment='card')
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(publications_for_display(Publication.objects.all(), self.reader))
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        self.publish(2)
+        small = self.count_queries()
+        self.publish(10)
+        self.assertEqual(self.count_queries(), small)
+
+    def test_viewer_annotations(self):
+        self.publish(1)
+        publication = Publication.objects.get()
+        publication.liked_by.add(self.reader)
+        self.author.followers.add(self.reader)
+        shown = publications_for_display(Publication.objects.all(), self.reader).get()
+        self.assertEqual(shown.reaction_count, 1)
+        self.assertTrue(shown.viewer_liked)
+        self.assertFalse(shown.viewer_disliked)
+        self.assertTrue(shown.viewer_follows_author)
+
+
+class VoteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('voter', password='x')
+        self.publication = Publication.objects.create(user=self.user, content='vote')
+
+    def test_like_twice_removes_the_like(self):
+        self.assertEqual(toggle_vote(self.publication, self.user, 'like')['likes'], 1)
+        result = toggle_vote(self.publication, self.user, 'like')
+        self.assertEqual((result['likes'], result['user_liked']), (0, False))
+        self.assertFalse(self.publication.liked_by.exists())
+
+    def test_dislike_replaces_like(self):
+        toggle_vote(self.publication, self.user, 'like')
+        result = toggle_vote(self.publication, self.user, 'dislike')
+        self.assertEqual((result['likes'], result['dislikes'], result['user_disliked']), (0, 1, True))
+        self.publication.refresh_from_db()
+        self.assertEqual((self.publication.likes, self.publication.dislikes), (0, 1))
+
+    def test_unknown_action(self):
+        with self.assertRaises(ValueError):
+            toggle_vote(self.publication, self.user, 'love')
+
+    def test_like_dislike_view(self):
+        self.client.force_login(self.user)
+        url = reverse('like_dislike', args=[self.publication.pk])
+        self.assertEqual(self.client.post(url, {'action': 'like'}).json()['likes'], 1)
+        self.assertEqual(self.client.post(url, {'action': 'love'}).status_code, 400)
+
+    def test_reconcile_votes(self):
+        self.publication.liked_by.add(self.user)
+        out = StringIO()
+        call_command('reconcile_votes', stdout=out)
+        self.publication.refresh_from_db()
+        self.assertEqual(self.publication.likes, 1)
+        self.assertIn('1 publication', out.getvalue())
+
+
+@override_settings(BACKGROUND_TASKS_ASYNC=False)
+class NotificationFanOutTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user('sender', password='x')
+        self.members = [User.objects.create_user(f'member{number}', password='x') for number in range(5)]
+        self.club = Club.objects.create(name='Fan-out', description='fan-out', creator=self.sender)
+        self.club.members.add(self.sender, *self.members)
+
+    def post(self, content):
+        self.client.force_login(self.sender)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('club_messages', args=[self.club.pk]), {'content': content})
+        self.assertTrue(response.json()['success'])
+
+    def test_one_unread_summary_per_member(self):
+        self.post('premier')
+        self.post('second')
+        summaries = Notification.objects.filter(read=False)
+        self.assertEqual(summaries.count(), len(self.members))
+        self.assertEqual(set(summaries.values_list('count', flat=True)), {2})
+        self.assertFalse(summaries.filter(user=self.sender).exists())
+
+    def test_small_batches_and_repeated_fan_out(self):
+        message = ClubMessage.objects.create(sender=self.sender, club=self.club, content='lots')
+        fan_out_club_message(message.pk, batch_size=2)
+        # Un second worker sur le même message : aucun doublon, le compteur avance
+        fan_out_club_message(message.pk, batch_size=2)
+        self.assertEqual(Notification.objects.count(), len(self.members))
+        self.assertEqual(set(Notification.objects.values_list('count', flat=True)), {2})
+
+    def test_read_summary_starts_a_new_one(self):
+        self.post('premier')
+        self.client.force_login(self.members[0])
+        self.client.get(reverse('notifications'))
+        self.post('second')
+        self.assertEqual(Notification.objects.filter(user=self.members[0]).count(), 2)
+        self.assertEqual(Notification.objects.get(user=self.members[0], read=False).count, 1)
+
+    def test_unread_summary_is_unique(self):
+        self.post('premier')
+        with self.assertRaises(IntegrityError):
+            Notification.objects.create(user=self.members[0], message='doublon', group_key=f'club_message:{self.club.pk}')
+
+
+class InboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='x')
+        self.friends = [User.objects.create_user(f'friend{number}', password='x') for number in range(3)]
+        self.club = Club.objects.create(name='Inbox', description='inbox', creator=self.user)
+        self.club.members.add(self.user, *self.friends)
+
+    def send(self, sender, recipient, content):
+        self.client.force_login(sender)
+        self.client.post(reverse('send_message', args=[recipient.pk]), {'content': content})
+
+    def inbox(self):
+        self.client.force_login(self.user)
+        return self.client.get(reverse('messages')).context['conversations']
+
+    def test_inbox_lists_latest_message_and_unread_counts(self):
+        self.send(self.friends[0], self.user, 'un')
+        self.send(self.friends[0], self.user, 'deux')
+        self.send(self.user, self.friends[1], 'trois')
+        self.client.force_login(self.friends[2])
+        self.client.post(reverse('club_messages', args=[self.club.pk]), {'content': 'club'})
+        items = {(item['type'], item['id']): item for item in self.inbox()}
+        self.assertEqual(items[('user', self.friends[0].pk)]['last_message'], 'deux')
+        self.assertEqual(items[('user', self.friends[0].pk)]['unread_count'], 2)
+        self.assertEqual(items[('user', self.friends[1].pk)]['unread_count'], 0)
+        self.assertEqual(items[('club', self.club.pk)]['unread_count'], 1)
+
+    def test_opening_a_conversation_resets_unread(self):
+        self.send(self.friends[0], self.user, 'un')
+        self.client.force_login(self.user)
+        self.client.get(reverse('send_message', args=[self.friends[0].pk]))
+        item = next(item for item in self.inbox() if item['type'] == 'user')
+        self.assertEqual(item['unread_count'], 0)
+
+    def test_query_count_does_not_grow_with_conversations(self):
+        self.send(self.friends[0], self.user, 'un')
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('messages'))
+        for friend in self.friends[1:]:
+            self.send(friend, self.user, 'encore')
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as more:
+            self.client.get(reverse('messages'))
+        self.assertEqual(len(few.captured_queries), len(more.captured_queries))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('searcher', password='x')
+        self.other = User.objects.create_user('stranger', password='x')
+        self.club = Club.objects.create(name='Jardinage urbain', description='potagers', creator=self.user)
+        self.club.members.add(self.user)
+        User.objects.create_user('jardinier', password='x')
+        self.client.force_login(self.user)
+
+    def search(self, query):
+        context = self.client.get(reverse('search'), {'query': query}).context
+        return [user.username for user in context['users']], [club.name for club in context['clubs']]
+
+    def test_prefix_search_on_users_and_clubs(self):
+        self.assertEqual(self.search('jard'), (['jardinier'], ['Jardinage urbain']))
+        self.assertEqual(self.search('potagers'), ([], ['Jardinage urbain']))
+
+    def test_index_follows_saves_and_deletes(self):
+        self.club.name = 'Cuisine'
+        self.club.description = 'recettes'
+        self.club.save()
+        self.assertEqual(self.search('jard'), (['jardinier'], []))
+        User.objects.get(username='jardinier').delete()
+        self.assertEqual(self.search('jard'), ([], []))
+
+    def test_search_messages_only_in_own_conversations(self):
+        Message.objects.create(sender=self.other, recipient=self.user, content='rendez-vous demain')
+        Message.objects.create(sender=self.other, recipient=self.club.creator, content='autre chose')
+        third = User.objects.create_user('third', password='x')
+        Message.objects.create(sender=self.other, recipient=third, content='rendez-vous privé')
+        for message in Message.objects.all():
+            record_direct_message(message)
+        response = self.client.get(reverse('search_messages'), {'query': 'rendez'})
+        conversations = response.json()['conversations']
+        self.assertEqual([(conv['type'], conv['id']) for conv in conversations], [('user', self.other.pk)])
+
+    @override_settings(SEARCH_BACKEND='core.search.LikeSearchBackend')
+    def test_icontains_fallback(self):
+        self.assertEqual(self.search('ARDIN'), (['jardinier'], ['Jardinage urbain']))
+        self.assertEqual(self.search('  '), ([], []))
+
+
+class SuggestionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        suggestion_service.loaded_at = None
+        self.user = User.objects.create_user('suggested', password='x')
+        User.objects.create_user('Élodie_martin', password='x')
+        self.club = Club.objects.create(name='Écologie urbaine', description='ville', creator=self.user)
+        self.club.members.add(self.user)
+        Club.objects.create(name='Échecs', description='jeux', creator=self.user)
+        self.client.force_login(self.user)
+
+    def suggest(self, query):
+        return self.client.get(reverse('search_suggestions'), {'query': query}).json()
+
+    def test_accent_folded_prefixes_and_membership(self):
+        data = self.suggest('eco')
+        self.assertEqual(data['clubs'], [{'id': self.club.pk, 'name': 'Écologie urbaine', 'is_member': True}])
+        self.assertEqual([user['username'] for user in self.suggest('elo MAR')['users']], ['Élodie_martin'])
+        self.assertEqual(self.suggest('  '), {'users': [], 'clubs': []})
+
+    def test_updates_apply_after_commit(self):
+        self.suggest('eco')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.club.name = 'Jardins partagés'
+            self.club.save()
+        self.assertEqual(self.suggest('eco')['clubs'], [])
+        self.assertEqual([club['name'] for club in self.suggest('jard')['clubs']], ['Jardins partagés'])
+
+    def test_login_does_not_touch_the_index(self):
+        self.suggest('eco')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.force_login(User.objects.get(username='Élodie_martin'))
+        self.assertEqual(callbacks, [])
+
+    def test_stale_index_does_not_fill_the_shared_cache(self):
+        self.suggest('eco')
+        # Écriture faite par un autre worker : l'index local est en retard
+        generation = bump_generation()
+        data = self.suggest('ech')
+        self.assertEqual([club['name'] for club in data['clubs']], ['Échecs'])
+        self.assertFalse([key for key in cache._cache if f'suggestions:{generation}:' in key])
+
+    def test_stale_index_reloads_after_the_interval(self):
+        self.suggest('eco')
+        Club.objects.filter(pk=self.club.pk).update(name='Renommé ailleurs')
+        bump_generation()
+        suggestion_service.loaded_at -= 10
+        self.assertEqual([club['name'] for club in self.suggest('renom')['clubs']], ['Renommé ailleurs'])
+        self.assertEqual(suggestion_service.generation, cache.get('suggestions:generation'))
+
+
+class PrefixIndexTests(TestCase):
+    def test_lookup_during_concurrent_writes(self):
+        index = PrefixIndex()
+        index.load((pk, f'name_{pk}') for pk in range(500))
+        errors = []
+
+        def write():
+            for pk in range(500):
+                index.remove(pk)
+                index.add(pk, f'name_{pk}')
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            while writer.is_alive():
+                index.lookup('name', 5)
+        except Exception as error:
+            errors.append(error)
+        writer.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(index.lookup('name_499', 5), [(499, 'name_499')])
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cached', password='x')
+
+    def test_anonymous_page_is_cached_until_invalidated(self):
+        self.client.get(reverse('help'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('help'))
+
+    def test_pages_with_a_csrf_token_vary_on_the_csrf_cookie(self):
+        first = self.client.get(reverse('home'))
+        self.assertIn('csrftoken', first.cookies)
+        # Visiteur avec cookie : sa page est mise en cache sous son cookie
+        self.client.get(reverse('home'))
+        second = self.client.get(reverse('home'))
+        third = self.client.get(reverse('home'))
+        self.assertEqual(second.content, third.content)
+        # Autre visiteur : jamais la page (et le jeton) d'un autre
+        other = self.client_class()
+        self.assertNotEqual(other.get(reverse('home')).content, third.content)
+        self.assertNotEqual(other.get(reverse('home')).content, third.content)
+
+    def test_club_save_invalidates_cached_home(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('home'))
+        Club.objects.create(name='Nouveau club', description='cache', creator=self.user)
+        self.assertContains(self.client.get(reverse('home')), 'Nouveau club')
+
+    def test_authenticated_pages_are_not_cached(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('help'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('help'))
+        self.assertTrue(queries.captured_queries)
+
+    def test_cached_lists_follow_their_namespace(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('challenges'))
+        Challenge.objects.create(title='Défi du mois', description='cache')
+        self.assertContains(self.client.get(reverse('challenges')), 'Défi du mois')
+        self.user.is_mentor = True
+        self.user.save()
+        self.assertContains(self.client.get(reverse('mentorship')), 'cached')
+
+    def test_publication_fragment_follows_updated_at(self):
+        publication = Publication.objects.create(user=self.user, content='Premier texte')
+        template = Template('{% load publication_tags %}{% publication_body publication %}')
+        self.assertIn('Premier texte', template.render(Context({'publication': publication})))
+        Publication.objects.filter(pk=publication.pk).update(content='Texte modifié')
+        publication.refresh_from_db()
+        self.assertIn('Premier texte', template.render(Context({'publication': publication})))
+        Media.objects.create(publication=publication)
+        publication.refresh_from_db()
+        self.assertIn('Texte modifié', template.render(Context({'publication': publication})))
+
+
+class CounterSignalTests(TestCase):
+    def setUp(self):
+        self.creator = User.objects.create_user('creator', password='x')
+        self.member = User.objects.create_user('member', password='x')
+        self.club = Club.objects.create(name='Counted', description='counters', creator=self.creator)
+
+    def assertCount(self, obj, field, expected):
+        obj.refresh_from_db(fields=[field])
+        self.assertEqual(getattr(obj, field), expected)
+
+    def test_club_membership(self):
+        self.club.members.add(self.member)
+        self.assertCount(self.club, 'member_count', 1)
+        self.assertCount(self.member, 'clubs_joined_count', 1)
+        self.member.joined_clubs.remove(self.club)
+        self.assertCount(self.club, 'member_count', 0)
+        self.assertCount(self.member, 'clubs_joined_count', 0)
+
+    def test_followers(self):
+        self.creator.followers.add(self.member)
+        self.assertCount(self.creator, 'follower_count', 1)
+        self.assertCount(self.member, 'following_count', 1)
+        # Retirer un lien absent ne décompte rien
+        self.creator.followers.remove(self.club.creator)
+        self.assertCount(self.creator, 'follower_count', 1)
+        self.creator.followers.clear()
+        self.assertCount(self.creator, 'follower_count', 0)
+        self.assertCount(self.member, 'following_count', 0)
+
+    def test_created_rows_and_cascades(self):
+        Publication.objects.create(user=self.member, content='counted')
+        page = Page.objects.create(name='page', description='page', title='page', creator=self.creator)
+        page.subscribers.add(self.member)
+        self.assertCount(self.member, 'publication_count', 1)
+        self.assertCount(self.member, 'pages_followed_count', 1)
+        self.assertCount(self.creator, 'clubs_created_count', 1)
+        self.assertCount(self.creator, 'pages_created_count', 1)
+        page.delete()
+        self.assertCount(self.member, 'pages_followed_count', 0)
+
+    def test_rebuild_counters(self):
+        self.club.members.add(self.member)
+        Club.objects.update(member_count=42)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertCount(self.club, 'member_count', 1)
+
+
+class SitemapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        for patcher in (mock.patch.object(sitemaps, 'SITEMAP_ROOT', self.root),
+                        mock.patch.object(sitemaps, 'SITEMAP_LIMIT', 2)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('mapped', password='x')
+        self.clubs = [Club.objects.create(name=f'club {number}', description='map', creator=self.user) for number in range(3)]
+
+    def read(self, name):
+        with gzip.open(self.root / name, 'rt') as source:
+            return source.read()
+
+    def test_sections_and_manifest(self):
+        manifest = sitemaps.build_sitemaps()
+        self.assertEqual([section['count'] for section in manifest['sections']['clubs']], [2, 1])
+        self.assertEqual(sitemaps.load_manifest(), manifest)
+        index = self.read(sitemaps.INDEX_FILE)
+        self.assertIn('/sitemap-clubs-1.xml', index)
+        self.assertIn('/sitemap-clubs-2.xml', index)
+        self.assertIn(self.clubs[2].get_absolute_url(), self.read('sitemap-clubs-2.xml.gz'))
+
+    def test_rebuild_only_renders_changed_sections(self):
+        sitemaps.build_sitemaps()
+        first = (self.root / 'sitemap-clubs-1.xml.gz').stat().st_mtime_ns
+        Club.objects.create(name='club 3', description='map', creator=self.user)
+        manifest = sitemaps.build_sitemaps()
+        self.assertEqual([section['count'] for section in manifest['sections']['clubs']], [2, 2])
+        self.assertEqual((self.root / 'sitemap-clubs-1.xml.gz').stat().st_mtime_ns, first)
+
+    def test_gzip_negotiation_and_conditional_get(self):
+        sitemaps.build_sitemaps()
+        url = reverse('sitemap_section', args=['clubs', 1])
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn(b'<urlset', gzip.decompress(compressed.content))
+        plain = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn(b'<urlset', b''.join(plain.streaming_content))
+        not_modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=compressed['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(self.client.get(reverse('sitemap_section', args=['clubs', 9])).status_code, 404)
+
+    def test_first_request_builds_in_the_background(self):
+        with mock.patch.object(sitemaps.sitemap_queue, 'submit') as submit:
+            response = self.client.get(reverse('sitemap_index'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(sitemaps.SITEMAP_RETRY_AFTER))
+        submit.assert_called_once_with(sitemaps.build_sitemaps)
+
+    def test_accept_encoding_q_values(self):
+        self.assertTrue(sitemaps.accepts_gzip('br, GZIP;q=0.5'))
+        self.assertTrue(sitemaps.accepts_gzip('*'))
+        self.assertFalse(sitemaps.accepts_gzip('gzip;q=0, *;q=1'))
+        self.assertFalse(sitemaps.accepts_gzip('identity'))
+
+
+def use_temporary_media(test):
+    """MEDIA_ROOT et zone de transit dans des dossiers temporaires ; renvoie le stockage de transit."""
+    media_root = tempfile.TemporaryDirectory()
+    staging_root = tempfile.TemporaryDirectory()
+    test.addCleanup(media_root.cleanup)
+    test.addCleanup(staging_root.cleanup)
+    settings_override = override_settings(MEDIA_ROOT=media_root.name)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    staging = FileSystemStorage(location=staging_root.name)
+    for target in ('core.media.staging_storage', 'core.uploads.staging_storage'):
+        patcher = mock.patch(target, staging)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    return staging
+
+
+def jpeg_with_metadata(width=800, height=400):
+    image = Image.new('RGB', (width, height), (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation : rotation de 90°
+    exif[0x8825] = {2: (48.0, 51.0, 24.0)}  # GPS
+    buffer = BytesIO()
+    icc_profile = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+    image.save(buffer, format='JPEG', exif=exif, icc_profile=icc_profile)
+    return buffer.getvalue(), icc_profile
+
+
+@override_settings(BACKGROUND_TASKS_ASYNC=False)
+class MediaPipelineTests(TestCase):
+    def setUp(self):
+        self.staging = use_temporary_media(self)
+        self.user = User.objects.create_user('uploader', password='x')
+        self.client.force_login(self.user)
+
+    def publish(self, name, content, content_type, execute=True):
+        with self.captureOnCommitCallbacks(execute=execute):
+            self.client.post(reverse('publication_create'), {
+                'content': 'avec média', 'file': SimpleUploadedFile(name, content, content_type=content_type),
+            })
+        return Media.objects.get()
+
+    def test_request_only_stages_the_upload(self):
+        content, _ = jpeg_with_metadata()
+        media = self.publish('photo.jpg', content, 'image/jpeg', execute=False)
+        self.assertFalse(media.file)
+        self.assertTrue(self.staging.exists(media.staged_name))
+        publication = publications_for_display(Publication.objects.all(), self.user).get()
+        self.assertEqual(list(publication.medias.all()), [])
+
+    def test_image_is_stripped_with_icc_profile_and_variants(self):
+        content, icc_profile = jpeg_with_metadata()
+        media = self.publish('photo.jpg', content, 'image/jpeg')
+        self.assertEqual(media.status, 'READY')
+        self.assertEqual(media.staged_name, '')
+        self.assertEqual(self.staging.listdir('')[1], [])
+        with media.file.open('rb') as source:
+            original = Image.open(source)
+            original.load()
+        # Orientation appliquée, EXIF et GPS retirés, profil couleur conservé
+        self.assertEqual(original.size, (400, 800))
+        self.assertEqual(dict(original.getexif()), {})
+        self.assertEqual(original.info.get('icc_profile'), icc_profile)
+        self.assertEqual((media.width, media.height), (400, 800))
+        self.assertEqual([variant['width'] for variant in media.variants], [320, 400])
+        with media.file.storage.open(media.variants[0]['name'], 'rb') as source:
+            variant = Image.open(source)
+            variant.load()
+        self.assertEqual(variant.format, 'WEBP')
+        self.assertEqual(variant.info.get('icc_profile'), icc_profile)
+        self.assertIn(media.variants[-1]['name'], media.display_url())
+
+    def test_other_files_are_published_as_is(self):
+        media = self.publish('notes.pdf', b'%PDF-1.4 contenu', 'application/pdf')
+        self.assertEqual(media.status, 'READY')
+        self.assertTrue(media.file.name.startswith('medias/notes'))
+        with media.file.open('rb') as source:
+            self.assertEqual(source.read(), b'%PDF-1.4 contenu')
+        self.assertEqual(self.staging.listdir('')[1], [])
+
+
+@override_settings(BACKGROUND_TASKS_ASYNC=False)
+class ChunkedUploadTests(TestCase):
+    content = bytes(range(256)) * 40
+
+    def setUp(self):
+        use_temporary_media(self)
+        self.user = User.objects.create_user('chunked', password='x')
+        self.publication = Publication.objects.create(user=self.user, content='vidéo')
+        self.client.force_login(self.user)
+
+    def start(self, checksum=None):
+        response = self.client.post(reverse('upload_init'), {
+            'publication': self.publication.pk, 'filename': 'clip.mp4', 'size': len(self.content),
+            'checksum': checksum or hashlib.sha256(self.content).hexdigest(),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def append(self, upload_id, offset, data):
+        return self.client.post(
+            reverse('upload_append', args=[upload_id]) + f'?offset={offset}', data,
+            content_type='application/octet-stream',
+        )
+
+    def test_resume_from_the_recorded_offset(self):
+        upload_id = self.start()
+        self.assertEqual(self.append(upload_id, 0, self.content[:4000]).json()['offset'], 4000)
+        # Morceau rejoué ou décalé : 409 avec l'offset à reprendre
+        conflict = self.append(upload_id, 2000, self.content[2000:6000])
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(conflict.json()['offset'], 4000)
+        self.assertEqual(self.client.get(reverse('upload_status', args=[upload_id])).json()['offset'], 4000)
+        self.assertEqual(self.append(upload_id, 4000, self.content[4000:]).json()['offset'], len(self.content))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('upload_complete', args=[upload_id]))
+        media = Media.objects.get(pk=response.json()['media_id'])
+        self.assertEqual(media.status, 'READY')
+        with media.file.open('rb') as source:
+            self.assertEqual(source.read(), self.content)
+
+    def test_checksum_mismatch_restarts_the_upload(self):
+        upload_id = self.start(checksum='0' * 64)
+        self.append(upload_id, 0, self.content)
+        response = self.client.post(reverse('upload_complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Upload.objects.get(pk=upload_id).offset, 0)
+        self.assertFalse(Media.objects.exists())
+
+    def test_only_raw_bodies_are_accepted(self):
+        upload_id = self.start()
+        response = self.client.post(reverse('upload_append', args=[upload_id]) + '?offset=0', {'data': 'x'})
+        self.assertEqual(response.status_code, 415)
+
+
+@override_settings(BACKGROUND_TASKS_ASYNC=False)
+class MediaTypeTests(TestCase):
+    def setUp(self):
+        use_temporary_media(self)
+        self.user = User.objects.create_user('uploader', password='x')
+        self.client.force_login(self.user)
+
+    def publish(self, name, content, content_type='application/octet-stream'):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('publication_create'), {
+                'content': name, 'file': SimpleUploadedFile(name, content, content_type=content_type),
+            })
+        return Media.objects.get(publication__content=name)
+
+    def test_type_comes_from_content_not_extension(self):
+        content, _ = jpeg_with_metadata()
+        media = self.publish('rapport.pdf', content)
+        self.assertEqual((media.media_type, media.mime_type), ('IMAGE', 'image/jpeg'))
+        self.assertTrue(media.is_image())
+        self.assertTrue(media.variants)
+
+        media = self.publish('photo.jpg', b'%PDF-1.4 contenu')
+        self.assertEqual((media.media_type, media.mime_type), ('PDF', 'application/pdf'))
+        self.assertEqual(media.status, 'READY')
+        self.assertEqual(media.variants, [])
+
+    def test_unknown_content_is_never_rendered_as_video(self):
+        media = self.publish('clip.mp4', b'<script>alert(1)</script>')
+        self.assertEqual((media.media_type, media.mime_type), ('OTHER', 'application/octet-stream'))
+        self.assertFalse(media.is_video())
+        self.assertFalse(media.is_image())
+
+    def test_direct_save_is_classified(self):
+        publication = Publication.objects.create(user=self.user, content='direct')
+        media = Media.objects.create(
+            publication=publication, file=SimpleUploadedFile('clip.bin', b'\x00\x00\x00\x18ftypqt  \x00\x00')
+        )
+        self.assertEqual((media.media_type, media.mime_type), ('VIDEO', 'video/quicktime'))
+
+    def test_feed_filters_by_media_type(self):
+        with_video = Publication.objects.create(user=self.user, content='avec vidéo')
+        Media.objects.create(publication=with_video, media_type='VIDEO', mime_type='video/mp4')
+        with_pdf = Publication.objects.create(user=self.user, content='avec pdf')
+        Media.objects.create(publication=with_pdf, media_type='PDF', mime_type='application/pdf')
+        Publication.objects.create(user=self.user, content='sans média')
+
+        publications, _ = feed_page(self.user, media_type='VIDEO')
+        self.assertEqual([publication.pk for publication in publications], [with_video.pk])
+        response = self.client.get(reverse('feed'), {'media': 'pdf'})
+        self.assertEqual([publication.pk for publication in response.context['publications']], [with_pdf.pk])
+        # Valeur inconnue : filtre ignoré
+        response = self.client.get(reverse('feed_page'), {'media': 'audio'})
+        self.assertIn('sans média', response.json()['html'])
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        (Path(media_root.name) / 'medias').mkdir()
+        (Path(media_root.name) / 'medias' / 'clip.mp4').write_bytes(b'0123456789')
+        self.url = reverse('serve_media', args=['medias/clip.mp4'])
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_response_and_conditional_get(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, b'0123456789'))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        etag = response['ETag']
+        response, _ = self.get(**{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        response, _ = self.get(**{'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        response, body = self.get(Range='bytes=2-5')
+        self.assertEqual((response.status_code, body), (206, b'2345'))
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+        response, body = self.get(Range='bytes=-3')
+        self.assertEqual((response.status_code, body), (206, b'789'))
+        response, _ = self.get(Range='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+        # Plages multiples : tout le fichier
+        response, body = self.get(Range='bytes=0-1,4-5')
+        self.assertEqual((response.status_code, body), (200, b'0123456789'))
+
+    def test_if_range_with_stale_etag_returns_whole_file(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(Range='bytes=2-5', **{'If-Range': etag})
+        self.assertEqual(response.status_code, 206)
+        response, body = self.get(Range='bytes=2-5', **{'If-Range': '"perime"'})
+        self.assertEqual((response.status_code, body), (200, b'0123456789'))
+
+    def test_missing_file_and_traversal(self):
+        self.assertEqual(self.client.get(reverse('serve_media', args=['medias/absent.mp4'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('serve_media', args=['../manage.py'])).status_code, 404)
+
+    def test_sendfile_header_delegates_to_front_server(self):
+        with mock.patch('core.files.MEDIA_SENDFILE_HEADER', 'X-Accel-Redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/medias/clip.mp4')
+        self.assertEqual(response.content, b'')
+
+
+class ThreadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('commenter', password='x')
+        self.publication = Publication.objects.create(user=self.user, content='fil')
+        self.start = timezone.now()
+
+    def react(self, minutes, parent=None, **kwargs):
+        return Reaction.objects.create(
+            user=self.user, publication=self.publication, parent=parent, comment=f'r{minutes}',
+            created_at=self.start + timedelta(minutes=minutes), **kwargs
+        )
+
+    def test_top_level_pages(self):
+        reactions = [self.react(minute) for minute in range(12)]
+        publication = attach_threads([self.publication])[0]
+        self.assertEqual([node.id for node in publication.thread.items], [r.pk for r in reactions[:10]])
+        thread = load_thread(self.publication.pk, cursor=publication.thread.next_cursor)
+        self.assertEqual([node.id for node in thread.items], [r.pk for r in reactions[10:]])
+        self.assertIsNone(thread.next_cursor)
+
+    def test_children_are_previewed_then_paged(self):
+        parent = self.react(0)
+        replies = [Reply.objects.create(reaction=parent, user=self.user, comment=f'reply {n}') for n in range(5)]
+        node = attach_threads([self.publication])[0].thread.items[0]
+        self.assertEqual((len(node.children), node.reply_count, node.has_more), (3, 5, True))
+        thread = load_thread(self.publication.pk, parent_id=parent.pk, cursor=node.more_cursor)
+        self.assertEqual([child.id for child in thread.items], [reply.pk for reply in replies[3:]])
+
+    def test_deep_threads_are_collapsed(self):
+        parent = self.react(0)
+        for minute in range(1, THREAD_MAX_DEPTH + 2):
+            parent = self.react(minute, parent=parent)
+        node = attach_threads([self.publication])[0].thread.items[0]
+        for _ in range(THREAD_MAX_DEPTH - 1):
+            node = node.children[0]
+        self.assertEqual((node.children, node.has_more), ([], True))
+
+    def test_reply_and_reaction_with_same_id_are_not_confused(self):
+        parent = self.react(0)
+        other = self.react(1, pk=5000)
+        nested = self.react(2, parent=other)
+        Reply.objects.create(pk=5000, reaction=parent, user=self.user, comment='réponse')
+        thread = load_thread(self.publication.pk, parent_id=parent.pk)
+        self.assertEqual([(node.kind, node.id) for node in thread.items], [('reply', 5000)])
+        self.assertEqual((thread.items[0].children, thread.items[0].reply_count), ([], 0))
+        # Le sous-fil de la réaction 5000 reste rattaché à elle seule
+        top = {node.id: node for node in attach_threads([self.publication])[0].thread.items}
+        self.assertEqual([child.id for child in top[other.pk].children], [nested.pk])
+
+    def test_only_visible_roots_are_expanded(self):
+        roots = [self.react(minute) for minute in range(11)]
+        # Réaction hors page : son sous-fil n'est pas lu
+        self.react(20, parent=roots[10])
+        with mock.patch('core.threads._descendant_nodes', wraps=threads._descendant_nodes) as descendants:
+            with CaptureQueriesContext(connection) as queries:
+                attach_threads([self.publication])
+        self.assertEqual(descendants.call_args.args[0], [root.pk for root in roots[:10]])
+        self.assertLessEqual(len(queries), 1 + 2 * THREAD_MAX_DEPTH)
+
+    def test_thread_endpoint(self):
+        parent = self.react(0)
+        Reply.objects.create(reaction=parent, user=self.user, comment='réponse')
+        url = reverse('publication_thread', args=[self.publication.pk])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.user)
+        data = self.client.get(url, {'parent': parent.pk}).json()
+        self.assertEqual([item['comment'] for item in data['items']], ['réponse'])
+        self.assertEqual(self.client.get(url, {'cursor': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'parent': 999999}).status_code, 404)
+
+
+class ReactionSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reactor', password='x')
+        self.publication = Publication.objects.create(user=self.user, content='discutée')
+
+    def react(self, publication, reaction_type='THOUGHT'):
+        return Reaction.objects.create(user=self.user, publication=publication, type=reaction_type, comment='!')
+
+    def summaries(self):
+        return dict(ReactionSummary.objects.filter(publication=self.publication).values_list('type', 'count'))
+
+    def test_signals_keep_counts_per_type(self):
+        self.react(self.publication, 'ADHERE')
+        self.react(self.publication, 'ADHERE')
+        alternative = self.react(self.publication, 'ALTERNATIVE')
+        self.assertEqual(self.summaries(), {'ADHERE': 2, 'ALTERNATIVE': 1})
+        self.publication.refresh_from_db()
+        self.assertEqual(self.publication.reaction_count, 3)
+
+        alternative.delete()
+        self.assertEqual(self.summaries(), {'ADHERE': 2, 'ALTERNATIVE': 0})
+        publication = publications_for_display(Publication.objects.all(), self.user).get()
+        self.assertEqual(publication.reaction_count, 2)
+        self.assertEqual(publication.reaction_breakdown(), [("J'adhère", 2)])
+
+    def test_rebuild_counters_rebuilds_summaries(self):
+        self.react(self.publication, 'SUPPORT')
+        ReactionSummary.objects.update(count=9)
+        Publication.objects.update(reaction_count=9)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(self.summaries(), {'SUPPORT': 1})
+        self.publication.refresh_from_db()
+        self.assertEqual(self.publication.reaction_count, 1)
+
+    def test_discussed_sort_pages_by_reaction_count(self):
+        quiet = Publication.objects.create(user=self.user, content='calme')
+        busy = Publication.objects.create(user=self.user, content='animée')
+        for _ in range(3):
+            self.react(busy)
+        self.react(self.publication)
+        seen, cursor = [], None
+        while True:
+            publications, cursor = feed_page(self.user, cursor=cursor, page_size=1, sort=SORT_DISCUSSED)
+            seen += [publication.pk for publication in publications]
+            if not cursor:
+                break
+        self.assertEqual(seen, [busy.pk, self.publication.pk, quiet.pk])
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('feed'), {'sort': SORT_DISCUSSED})
+        self.assertEqual(response.context['publications'][0].pk, busy.pk)
+        self.assertContains(response, '3 Ma pensée')
+
+
+class ClubChatTests(TestCase):
+    def setUp(self):
+        self.member = User.objects.create_user('chatter', password='x')
+        self.club = Club.objects.create(name='Bavards', description='chat', creator=self.member)
+        self.club.members.add(self.member)
+        ClubMessage.objects.bulk_create(
+            ClubMessage(club=self.club, sender=self.member, content=f'message {n}') for n in range(CHAT_PAGE_SIZE + 5)
+        )
+        self.ids = list(ClubMessage.objects.order_by('id').values_list('id', flat=True))
+        self.client.force_login(self.member)
+
+    def poll(self, after_id):
+        return self.client.get(reverse('club_messages_poll', args=[self.club.pk]), {'after_id': after_id})
+
+    def test_page_shows_latest_messages_and_history_pages_back(self):
+        response = self.client.get(reverse('club_messages', args=[self.club.pk]))
+        self.assertEqual([message.pk for message in response.context['messages']], self.ids[5:])
+        self.assertTrue(response.context['has_more'])
+        self.assertEqual(response.context['last_id'], self.ids[-1])
+
+        data = self.client.get(
+            reverse('club_messages_history', args=[self.club.pk]), {'before_id': response.context['oldest_id']}
+        ).json()
+        self.assertEqual((data['oldest_id'], data['has_more']), (self.ids[0], False))
+        self.assertIn('message 4', data['html'])
+
+    def test_poll_returns_304_when_nothing_is_new(self):
+        self.assertEqual(self.poll(self.ids[-1]).status_code, 304)
+
+    def test_poll_returns_new_messages_and_replies(self):
+        message = ClubMessage.objects.create(club=self.club, sender=self.member, content='nouveau')
+        reply = ClubMessage.objects.create(club=self.club, sender=self.member, content='réponse', parent_id=self.ids[0])
+        data = self.poll(self.ids[-1]).json()
+        self.assertEqual([item['id'] for item in data['messages']], [message.pk])
+        self.assertEqual([(item['id'], item['parent_id']) for item in data['replies']], [(reply.pk, self.ids[0])])
+        self.assertEqual((data['last_id'], data['has_more']), (reply.pk, False))
+
+    def test_poll_is_capped_at_one_page(self):
+        data = self.poll(0).json()
+        self.assertEqual(len(data['messages']), CHAT_PAGE_SIZE)
+        self.assertTrue(data['has_more'])
+        data = self.poll(data['last_id']).json()
+        self.assertEqual([item['id'] for item in data['messages']], self.ids[CHAT_PAGE_SIZE:])
+        self.assertFalse(data['has_more'])
+
+    def test_poll_requires_membership_and_valid_id(self):
+        self.assertEqual(self.poll('abc').status_code, 400)
+        self.client.force_login(User.objects.create_user('outsider', password='x'))
+        self.assertEqual(self.poll(0).status_code, 403)
+
+
+class RealtimeTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user('emitter', password='x')
+        self.recipient = User.objects.create_user('receiver', password='x')
+
+    def test_broker_delivers_to_subscribed_channels_only(self):
+        async def scenario():
+            broker = InProcessBroker()
+            subscription = broker.subscribe([user_channel(1), club_channel(7)])
+            broker.publish([user_channel(2)], {'type': 'notification', 'data': {}})
+            broker.publish([club_channel(7)], {'type': 'club_message', 'data': {'id': 3}})
+            stream = event_stream(subscription, keepalive=0.05)
+            chunks = [await stream.__anext__() for _ in range(3)]
+            await stream.aclose()
+            return chunks, broker._subscriptions
+
+        chunks, subscriptions = asyncio.run(scenario())
+        self.assertEqual(chunks, ['retry: 3000\n\n', 'event: club_message\ndata: {"id": 3}\n\n', ': keepalive\n\n'])
+        # Déconnexion : l'abonnement est retiré de tous ses canaux
+        self.assertEqual(dict(subscriptions), {})
+
+    def test_direct_message_is_published_after_commit(self):
+        broker = mock.Mock()
+        with mock.patch('core.realtime.get_broker', return_value=broker):
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                message = Message.objects.create(sender=self.sender, recipient=self.recipient, content='salut')
+            broker.publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+        channels, event = broker.publish.call_args.args
+        self.assertEqual(channels, [user_channel(self.recipient.pk)])
+        self.assertEqual((event['type'], event['data']['id'], event['data']['content']), ('direct_message', message.pk, 'salut'))
+
+    def test_club_fan_out_publishes_one_notification_per_member(self):
+        club = Club.objects.create(name='Direct', description='sse', creator=self.sender)
+        club.members.add(self.sender, self.recipient)
+        message = ClubMessage.objects.create(sender=self.sender, club=club, content='en direct')
+        broker = mock.Mock()
+        with mock.patch('core.realtime.get_broker', return_value=broker):
+            with self.captureOnCommitCallbacks(execute=True):
+                fan_out_club_message(message.pk)
+        published = [call.args for call in broker.publish.call_args_list if call.args[1]['type'] == 'notification']
+        self.assertEqual([channels for channels, _ in published], [[user_channel(self.recipient.pk)]])
+
+    def test_events_endpoint(self):
+        # Sous WSGI : pas de flux, la page garde le polling
+        self.client.force_login(self.recipient)
+        self.assertEqual(self.client.get(reverse('events')).status_code, 204)
+
+        async_client = AsyncClient()
+        self.assertEqual(asyncio.run(async_client.get(reverse('events'))).status_code, 403)
+
+
+class ReadWatermarkTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('watermark_reader', password='x')
+        self.sender = User.objects.create_user('watermark_sender', password='x')
+        self.club = Club.objects.create(name='Chat', description='chat', creator=self.sender)
+        self.club.members.add(self.reader, self.sender)
+
+    def post(self, content):
+        message = ClubMessage.objects.create(sender=self.sender, club=self.club, content=content)
+        record_club_message(message)
+        return message
+
+    def unread(self):
+        participant = ConversationParticipant.objects.get(conversation__key=club_key(self.club.pk), user=self.reader)
+        return participant.unread_count
+
+    def watermark(self, user):
+        return ClubMembership.objects.get(user=user, club=self.club).last_read_message_id
+
+    def test_mark_read_moves_the_watermark(self):
+        self.post('one')
+        latest = self.post('two')
+        self.assertEqual(self.unread(), 2)
+        mark_club_read(self.reader, self.club)
+        self.assertEqual(self.watermark(self.reader), latest.pk)
+        self.assertEqual(self.unread(), 0)
+
+    def test_rebuild_counts_messages_after_the_watermark(self):
+        self.post('one')
+        mark_club_read(self.reader, self.club)
+        self.post('two')
+        self.post('three')
+        rebuild_conversations()
+        self.assertEqual(self.unread(), 2)
+
+    def test_sender_has_read_up_to_their_own_message(self):
+        self.client.force_login(self.sender)
+        self.client.post(reverse('club_messages', args=[self.club.pk]), {'content': 'moi'})
+        self.assertEqual(self.watermark(self.sender), ClubMessage.objects.get().pk)
+        self.assertEqual(self.watermark(self.reader), 0)
+
+
+class CheckCommandTests(TransactionTestCase):
+    # Les commandes créent leur propre base de test : pas de transaction englobante
+
+    def test_hot_views_use_indexes(self):
+        out = StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        self.assertIn('No full table scan in the hot views', out.getvalue())
+
+    def test_replica_routing(self):
+        # Processus séparé : la commande remplace la base par deux fichiers SQLite,
+        # ce que la base de test en mémoire de ce processus ne permet pas
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'check_replica_routing'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('Replica routing and stickiness behave as expected', result.stdout)
+
+
+class TunedSQLiteBackendTests(TestCase):
+    def test_init_command_and_transaction_mode(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = TunedSQLiteWrapper({
+            **connection.settings_dict,
+            'NAME': str(Path(directory.name) / 'tuned.sqlite3'),
+            'OPTIONS': {'init_command': 'PRAGMA journal_mode = WAL;PRAGMA busy_timeout = 1234', 'transaction_mode': 'IMMEDIATE'},
+        }, alias='tuned')
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 1234)
+        # Ouverture de transaction telle que la fait atomic() sous SQLite
+        with CaptureQueriesContext(wrapper) as queries:
+            wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+            wrapper.rollback()
+            wrapper.set_autocommit(True)
+        self.assertIn('BEGIN IMMEDIATE', [query['sql'] for query in queries.captured_queries])
+
+
+@override_settings(FEED_TIMELINE=True, BACKGROUND_TASKS_ASYNC=False)
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader', password='x')
+
+    def create_feed(self):
+        # Fan-out et recalculs partent après le COMMIT
+        with self.captureOnCommitCallbacks(execute=True):
+            create_feed(self.reader)
+
+    def assertSamePages(self, **options):
+        feed_cursor = timeline_cursor = None
+        while True:
+            feed, feed_cursor = feed_page(self.reader, cursor=feed_cursor, page_size=7, **options)
+            timeline, timeline_cursor = timeline_page(self.reader, cursor=timeline_cursor, page_size=7, **options)
+            self.assertEqual([p.pk for p in timeline], [p.pk for p in feed])
+            self.assertEqual([p.tier for p in timeline], [p.tier for p in feed])
+            self.assertEqual(timeline_cursor, feed_cursor)
+            if not feed_cursor:
+                break
+
+    def test_pushed_timeline_matches_feed(self):
+        self.create_feed()
+        # 10 publications du club rejoint + 10 de l'auteur suivi hors de ce club
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 20)
+        self.assertSamePages()
+
+    def test_pulled_timeline_matches_feed(self):
+        # Seuils dépassés : rien n'est poussé, tout est lu à la demande
+        with mock.patch('core.timelines.TIMELINE_MAX_CLUB_MEMBERS', 0), \
+                mock.patch('core.timelines.TIMELINE_MAX_FOLLOWERS', 0):
+            self.create_feed()
+            self.assertFalse(TimelineEntry.objects.exists())
+            self.assertSamePages()
+
+    def test_mixed_timeline_matches_feed(self):
+        with mock.patch('core.timelines.TIMELINE_MAX_CLUB_MEMBERS', 0):
+            self.create_feed()
+            self.assertSamePages()
+
+    def test_leaving_a_club_rebuilds_the_timeline(self):
+        self.create_feed()
+        club = Club.objects.get(name='Joined')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.joined_clubs.remove(club)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader, publication__club=club, tier=TIER_CLUBS).exists())
+        self.assertSamePages()
+
+    def test_rebuild_command(self):
+        self.create_feed()
+        TimelineEntry.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_timelines', stdout=out)
+        self.assertIn('20 entries', out.getvalue())
+        self.assertSamePages()
+
+    def test_feed_view_reads_the_timeline(self):
+        self.create_feed()
+        self.client.force_login(self.reader)
+        with mock.patch('core.views.timeline_page', wraps=timeline_page) as page:
+            data = self.client.get(reverse('feed_page')).json()
+        self.assertTrue(data['success'])
+        page.assert_called_once()
+
+
+class ScoreTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('scorer', password='x')
+        self.now = timezone.now()
+
+    def publish(self, hours_ago=0, **fields):
+        return Publication.objects.create(
+            user=self.user, content='score', created_at=self.now - timedelta(hours=hours_ago), **fields
+        )
+
+    def scores(self):
+        return dict(Publication.objects.values_list('pk', 'score'))
+
+    def test_new_publication_is_scored_by_date(self):
+        older, newer = self.publish(hours_ago=2), self.publish()
+        self.assertGreater(newer.score, older.score)
+        # Sans engagement, update_scores ne réécrit rien
+        self.assertEqual(update_scores(), (2, 0))
+
+    def test_engagement_outweighs_age(self):
+        # Demi-vie de 24 h : doubler l'engagement vaut une journée d'avance
+        popular, recent, clarified = self.publish(hours_ago=24, likes=3), self.publish(), self.publish(hours_ago=30)
+        Reaction.objects.create(user=self.user, publication=clarified, type='CLARIFY', comment='?')
+        self.assertEqual(update_scores(batch_size=2), (3, 2))
+        ranked = list(Publication.objects.order_by('-score').values_list('pk', flat=True))
+        self.assertEqual(ranked, [popular.pk, recent.pk, clarified.pk])
+        self.assertEqual(update_scores(), (3, 0))
+
+    def test_top_sort_pages_by_score(self):
+        publications = [self.publish(hours_ago=number % 4, likes=number % 3) for number in range(12)]
+        update_scores()
+        seen, cursor = [], None
+        while True:
+            page, cursor = feed_page(self.user, cursor=cursor, page_size=5, sort=SORT_TOP)
+            seen += [publication.pk for publication in page]
+            if not cursor:
+                break
+        scores = self.scores()
+        self.assertEqual(seen, sorted(scores, key=lambda pk: (-scores[pk], -pk)))
+        self.assertEqual(len(seen), len(publications))
+
+    def test_feed_view_sort_parameter(self):
+        self.publish()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('feed'), {'sort': SORT_TOP}).context['sort'], SORT_TOP)
+        self.assertFalse(self.client.get(reverse('feed'), {'sort': 'unknown'}).context['sort'])
+        data = self.client.get(reverse('feed_page'), {'sort': SORT_TOP}).json()
+        self.assertTrue(data['success'])
+
+    def test_migration_backfill_matches_update_scores(self):
+        liked = self.publish(hours_ago=5, likes=4, dislikes=1)
+        Reaction.objects.create(user=self.user, publication=liked, type='ALTERNATIVE', comment='!')
+        self.publish(hours_ago=1)
+        update_scores()
+        expected = self.scores()
+        Publication.objects.update(score=0)
+        migration = importlib.import_module('core.migrations.0019_publication_score')
+        migration.fill_scores(apps, mock.Mock(connection=connection))
+        for pk, score in self.scores().items():
+            self.assertAlmostEqual(score, expected[pk], places=6)
+
+
+class AsyncViewTests(TestCase):
+    # Vues async servies par AsyncClient (ASGI) ; les autres tests les appellent aussi sous WSGI
+    def setUp(self):
+        cache.clear()
+        suggestion_service.loaded_at = None
+        self.user = User.objects.create_user('async_user', password='x')
+        self.other = User.objects.create_user('async_other', password='x')
+        self.club = Club.objects.create(name='Asynchrone', description='async', creator=self.other)
+        self.publications = [Publication.objects.create(user=self.other, content=f'async {n}') for n in range(3)]
+
+    def counters(self):
+        return {p.pk: (p.likes, p.dislikes) for p in Publication.objects.all()}
+
+    async def test_login_required(self):
+        response = await self.async_client.post(reverse('like_dislike', args=[self.publications[0].pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, response['Location'])
+
+    async def test_like_dislike(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('like_dislike', args=[self.publications[0].pk])
+        data = (await self.async_client.post(url, {'action': 'like'})).json()
+        self.assertEqual((data['likes'], data['user_liked']), (1, True))
+        data = (await self.async_client.post(url, {'action': 'dislike'})).json()
+        self.assertEqual((data['likes'], data['dislikes'], data['user_disliked']), (0, 1, True))
+        response = await self.async_client.post(url, {'action': 'love'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_like_dislike_batch(self):
+        first, second, third = self.publications
+        toggle_vote(second, self.user, 'dislike')
+        self.client.force_login(self.user)
+        url = reverse('like_dislike_batch')
+        data = self.client.post(url, {'action': 'like', 'publication': [first.pk, second.pk, 999999]}).json()
+        # Publication inconnue absente ; le dislike de la seconde est remplacé par un like
+        self.assertEqual(set(data['publications']), {str(first.pk), str(second.pk)})
+        self.assertTrue(data['publications'][str(second.pk)]['user_liked'])
+        self.assertEqual(self.counters(), {first.pk: (1, 0), second.pk: (1, 0), third.pk: (0, 0)})
+        data = self.client.post(url, {'action': 'like', 'publication': [first.pk]}).json()
+        self.assertEqual(data['publications'][str(first.pk)]['likes'], 0)
+
+        too_many = [str(first.pk)] * (views.BATCH_MAX_PUBLICATIONS + 1)
+        for params in ({'action': 'like'}, {'action': 'like', 'publication': too_many},
+                       {'action': 'like', 'publication': ['x']}):
+            self.assertEqual(self.client.post(url, params).status_code, 400)
+
+    async def test_react_batch(self):
+        await self.async_client.aforce_login(self.user)
+        ids = [publication.pk for publication in self.publications[:2]]
+        data = (await self.async_client.post(
+            reverse('react_batch'), {'publication': ids, 'type': 'SUPPORT', 'comment': 'bravo'}
+        )).json()
+        self.assertEqual(sorted(reaction['publication_id'] for reaction in data['reactions']), ids)
+        # Une réaction à la fois : les signaux tiennent les résumés à jour
+        summaries = ReactionSummary.objects.filter(type='SUPPORT', count=1)
+        self.assertEqual(sorted([summary.publication_id async for summary in summaries]), ids)
+        data = (await self.async_client.post(
+            reverse('react_batch'), {'publication': ids, 'type': 'LOVE', 'comment': 'bravo'}
+        )).json()
+        self.assertFalse(data['success'])
+
+    async def test_club_subscribe_and_unsubscribe(self):
+        await self.async_client.aforce_login(self.user)
+        data = (await self.async_client.post(reverse('club_subscribe', args=[self.club.pk]))).json()
+        self.assertEqual((data['success'], data['members_count']), (True, 1))
+        response = await self.async_client.post(reverse('club_subscribe', args=[self.club.pk]))
+        self.assertEqual(response.status_code, 400)
+        data = (await self.async_client.post(reverse('club_unsubscribe', args=[self.club.pk]))).json()
+        self.assertEqual((data['success'], data['members_count']), (True, 0))
+
+    async def test_search_suggestions(self):
+        await self.club.members.aadd(self.user)
+        await self.async_client.aforce_login(self.user)
+        data = (await self.async_client.get(reverse('search_suggestions'), {'query': 'asyn'})).json()
+        self.assertEqual(data['clubs'], [{'id': self.club.pk, 'name': 'Asynchrone', 'is_member': True}])
+        self.assertEqual({user['username'] for user in data['users']}, {'async_user', 'async_other'})
+        self.assertEqual(await suggestion_service.asuggest('asyn'), suggestion_service.suggest('asyn'))
+
+    def test_reply_to_club_message(self):
+        parent = ClubMessage.objects.create(sender=self.other, club=self.club, content='question')
+        self.client.force_login(self.user)
+        url = reverse('reply_to_club_message', args=[self.club.pk])
+        self.assertEqual(self.client.post(url, {'parent_id': parent.pk, 'content': 'non'}).status_code, 403)
+        self.club.members.add(self.user)
+        data = self.client.post(url, {'parent_id': parent.pk, 'content': 'réponse'}).json()
+        self.assertTrue(data['success'])
+        self.assertEqual(ClubMessage.objects.get(pk=data['message_id']).parent, parent)
+        self.assertEqual(self.client.post(url, {'parent_id': 999999, 'content': 'perdu'}).status_code, 404)
+
+    def test_search_messages_does_not_log_contents(self):
+        self.client.force_login(self.other)
+        self.client.post(reverse('send_message', args=[self.user.pk]), {'content': 'rendez-vous secret'})
+        self.client.force_login(self.user)
+        with self.assertLogs('core.views', level='DEBUG') as logs:
+            data = self.client.get(reverse('search_messages'), {'query': 'rendez'}).json()
+        self.assertEqual([conv['id'] for conv in data['conversations']], [self.other.pk])
+        self.assertFalse([line for line in logs.output if 'secret' in line])
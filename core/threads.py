@@ -0,0 +1,245 @@
+import base64
+import heapq
+import json
+from datetime import datetime
+
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from core.models import Reaction, Reply
+
+THREAD_PAGE_SIZE = 10  # Réactions de premier niveau affichées par publication
+THREAD_REPLY_PREVIEW = 3  # Réponses affichées sous chaque réaction
+THREAD_MAX_DEPTH = 3  # Au-delà, le fil est replié derrière « voir la suite »
+
+REACTION_LABELS = dict(Reaction.REACTION_CHOICES)
+
+
+class InvalidThreadCursor(ValueError):
+    pass
+
+
+class ThreadNode:
+    """Réaction (Reaction) ou réponse (Reply) dans l'arbre d'une publication."""
+
+    __slots__ = (
+        'kind', 'id', 'publication_id', 'parent_id', 'user_id', 'username', 'reaction_type',
+        'comment', 'created_at', 'children', 'reply_count', 'siblings', 'has_more', 'more_cursor',
+    )
+
+    def __init__(self, kind, obj, publication_id, parent_id, reaction_type=None):
+        self.kind = kind
+        self.id = obj.pk
+        self.publication_id = publication_id
+        self.parent_id = parent_id
+        self.user_id = obj.user_id
+        self.username = obj.user.username
+        self.reaction_type = reaction_type
+        self.comment = obj.comment
+        self.created_at = obj.created_at
+        self.children = []
+        self.reply_count = 0
+        # Enfants du même parent et du même type, lignes non chargées comprises
+        self.siblings = getattr(obj, 'siblings', None)
+        self.has_more = False
+        self.more_cursor = None
+
+    @property
+    def is_reaction(self):
+        return self.kind == 'reaction'
+
+    @property
+    def type_label(self):
+        return REACTION_LABELS.get(self.reaction_type, self.reaction_type)
+
+    def sort_key(self):
+        # À date égale, la réaction avant la réponse, puis par id
+        return (self.created_at, self.kind != 'reaction', self.id)
+
+    def as_dict(self):
+        return {
+            'kind': self.kind,
+            'id': self.id,
+            'user_id': self.user_id,
+            'username': self.username,
+            'type': self.reaction_type,
+            'type_label': self.type_label if self.is_reaction else None,
+            'comment': self.comment,
+            'created_at': self.created_at.strftime('%d/%m/%Y %H:%M'),
+            'reply_count': self.reply_count,
+            'has_more': self.has_more,
+            'more_cursor': self.more_cursor,
+            'children': [child.as_dict() for child in self.children],
+        }
+
+
+def encode_cursor(node):
+    created_at, is_reply, pk = node.sort_key()
+    payload = [created_at.isoformat(), int(is_reply), pk]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, is_reply, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), bool(is_reply), int(pk)
+    except (ValueError, TypeError):
+        raise InvalidThreadCursor(cursor)
+
+
+def _reaction_nodes(queryset, limit=None):
+    queryset = queryset.select_related('user').order_by('created_at', 'id')
+    return [
+        ThreadNode('reaction', reaction, reaction.publication_id, reaction.parent_id, reaction.type)
+        for reaction in (queryset[:limit] if limit else queryset)
+    ]
+
+
+def _reply_nodes(queryset, limit=None):
+    queryset = (
+        queryset.select_related('user')
+        .annotate(publication_id=F('reaction__publication_id'))
+        .order_by('created_at', 'id')
+    )
+    return [
+        ThreadNode('reply', reply, reply.publication_id, reply.reaction_id)
+        for reply in (queryset[:limit] if limit else queryset)
+    ]
+
+
+def _after(queryset, after, is_reply):
+    """Lignes d'une table (réactions ou réponses) placées après le curseur dans l'ordre de sort_key()."""
+    if after is None:
+        return queryset
+    created_at, after_reply, pk = after
+    if after_reply == is_reply:
+        return queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+    # À date égale, les réactions précèdent les réponses
+    return queryset.filter(created_at__gte=created_at) if is_reply else queryset.filter(created_at__gt=created_at)
+
+
+def _first_per_parent(queryset, parent_field, limit):
+    # ROW_NUMBER() par parent : seuls les limit premiers enfants sont lus, COUNT() garde le total
+    partition = [F(parent_field)]
+    return queryset.annotate(
+        position=Window(RowNumber(), partition_by=partition, order_by=[F('created_at').asc(), F('id').asc()]),
+        siblings=Window(Count('id'), partition_by=partition),
+    ).filter(position__lte=limit)
+
+
+def _descendant_nodes(parent_ids, limit=THREAD_REPLY_PREVIEW + 1, max_depth=THREAD_MAX_DEPTH):
+    """
+    Descendants des réactions parent_ids, niveau par niveau : réactions imbriquées (Reaction.parent)
+    et réponses (Reply), deux requêtes par niveau et au plus max_depth niveaux.
+    Au plus limit enfants de chaque type par parent ; la suite passe par load_thread.
+    """
+    nodes = []
+    for _ in range(max_depth):
+        if not parent_ids:
+            break
+        reactions = _reaction_nodes(_first_per_parent(
+            Reaction.objects.filter(parent_id__in=parent_ids), 'parent_id', limit,
+        ))
+        replies = _reply_nodes(_first_per_parent(
+            Reply.objects.filter(reaction_id__in=parent_ids), 'reaction_id', limit,
+        ))
+        nodes += heapq.merge(reactions, replies, key=ThreadNode.sort_key)
+        # Les réponses sont des feuilles : seul un niveau de réactions a des enfants
+        parent_ids = [node.id for node in reactions]
+    return nodes
+
+
+def _link(roots, descendants):
+    """Rattache chaque nœud à son parent via un dict des réactions par id : O(n)."""
+    # Réactions seulement : une réponse et une réaction peuvent avoir le même id
+    index = {node.id: node for node in roots if node.is_reaction}
+    counted = set()
+    for node in descendants:
+        parent = index.get(node.parent_id)
+        if parent is None:
+            # Sous-fil d'une réaction hors de la page courante : chargé plus tard à la demande
+            continue
+        parent.children.append(node)
+        if (parent.id, node.kind) not in counted:
+            counted.add((parent.id, node.kind))
+            parent.reply_count += node.siblings
+        if node.is_reaction:
+            index[node.id] = node
+
+
+def _collapse(nodes, depth, limit=THREAD_REPLY_PREVIEW, max_depth=THREAD_MAX_DEPTH):
+    for node in nodes:
+        if not node.children:
+            continue
+        if depth >= max_depth:
+            # Fil trop profond : tout le sous-arbre est chargé à la demande
+            node.children, node.has_more = [], True
+            continue
+        if len(node.children) > limit:
+            node.more_cursor = encode_cursor(node.children[limit - 1])
+            node.children, node.has_more = node.children[:limit], True
+        _collapse(node.children, depth + 1, limit, max_depth)
+
+
+class Thread:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def as_dict(self):
+        return {'items': [item.as_dict() for item in self.items], 'next_cursor': self.next_cursor}
+
+
+def attach_threads(publications, page_size=THREAD_PAGE_SIZE):
+    """publication.thread pour chaque publication de la page, en 1 + 2 × THREAD_MAX_DEPTH requêtes au plus."""
+    publications = list(publications)
+    ids = [publication.pk for publication in publications]
+    if not ids:
+        return publications
+
+    # Premier niveau : page_size + 1 réactions par publication grâce à ROW_NUMBER()
+    top = _reaction_nodes(
+        Reaction.objects.filter(publication_id__in=ids, parent__isnull=True)
+        .annotate(position=Window(
+            RowNumber(), partition_by=[F('publication_id')], order_by=[F('created_at').asc(), F('id').asc()]
+        ))
+        .filter(position__lte=page_size + 1)
+    )
+    roots = {}
+    for node in top:
+        roots.setdefault(node.publication_id, []).append(node)
+    # Sous-fils des seules réactions affichées ; la réaction en plus ne sert qu'au curseur
+    visible = [node for nodes in roots.values() for node in nodes[:page_size]]
+    _link(visible, _descendant_nodes([node.id for node in visible]))
+
+    for publication in publications:
+        nodes = roots.get(publication.pk, [])
+        next_cursor = encode_cursor(nodes[page_size - 1]) if len(nodes) > page_size else None
+        nodes = nodes[:page_size]
+        _collapse(nodes, depth=1)
+        publication.thread = Thread(nodes, next_cursor)
+    return publications
+
+
+def load_thread(publication_id, parent_id=None, cursor=None, page_size=THREAD_PAGE_SIZE):
+    """Suite d'un fil : réactions de premier niveau, ou réponses de parent_id, après cursor."""
+    after = decode_cursor(cursor) if cursor else None
+    if parent_id is None:
+        # Premier niveau : keyset en SQL, seules page_size + 1 réactions sont lues
+        top = Reaction.objects.filter(publication_id=publication_id, parent__isnull=True)
+        candidates = _reaction_nodes(_after(top, after, False), limit=page_size + 1)
+    else:
+        if not Reaction.objects.filter(publication_id=publication_id, pk=parent_id).exists():
+            return None
+        # Enfants directs de parent_id : keyset sur chaque table, page_size + 1 lignes au plus
+        candidates = list(heapq.merge(
+            _reaction_nodes(_after(Reaction.objects.filter(parent_id=parent_id), after, False), limit=page_size + 1),
+            _reply_nodes(_after(Reply.objects.filter(reaction_id=parent_id), after, True), limit=page_size + 1),
+            key=ThreadNode.sort_key,
+        ))[:page_size + 1]
+    _link(candidates, _descendant_nodes([node.id for node in candidates[:page_size] if node.is_reaction]))
+
+    nodes = candidates[:page_size]
+    next_cursor = encode_cursor(nodes[-1]) if len(candidates) > page_size else None
+    _collapse(nodes, depth=1)
+    return Thread(nodes, next_cursor)
@@ -0,0 +1,179 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from core.background import BackgroundQueue
+from core.feed import (
+    FEED_PAGE_SIZE, TIER_CLUBS, TIER_FOLLOWING, TIER_OTHER, after_cursor, decode_cursor, encode_cursor,
+    ranked_publications, tier_publications,
+)
+from core.models import ClubMembership, Media, Publication, TimelineEntry, User
+from core.queries import publications_for_display, with_media_type
+from core.threads import attach_threads
+
+logger = logging.getLogger(__name__)
+
+# Au-delà, pas de fan-out : les publications du club / de l'auteur sont lues à la demande (pull)
+TIMELINE_MAX_CLUB_MEMBERS = getattr(settings, 'TIMELINE_MAX_CLUB_MEMBERS', 5000)
+TIMELINE_MAX_FOLLOWERS = getattr(settings, 'TIMELINE_MAX_FOLLOWERS', 5000)
+TIMELINE_BATCH_SIZE = 500
+
+timeline_queue = BackgroundQueue('timeline-fanout')
+
+Follow = User.followers.through
+
+
+def timeline_enabled():
+    return getattr(settings, 'FEED_TIMELINE', False)
+
+
+def _id_batches(queryset, field, batch_size=TIMELINE_BATCH_SIZE):
+    # Parcours par clé : mémoire bornée par la taille du lot
+    last_id = 0
+    while True:
+        batch = list(
+            queryset.filter(**{f'{field}__gt': last_id}).order_by(field).values_list(field, flat=True)[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1]
+
+
+def _push(publication, tiers):
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, publication_id=publication.pk, tier=tier, created_at=publication.created_at)
+            for user_id, tier in tiers.items()
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_publication(publication_id, batch_size=TIMELINE_BATCH_SIZE):
+    """Pousse la publication dans le fil des membres de son club et des abonnés de son auteur."""
+    publication = Publication.objects.select_related('club', 'user').filter(pk=publication_id).first()
+    if publication is None:
+        return
+    # Idempotent : une publication modifiée (club changé) est repoussée entièrement
+    TimelineEntry.objects.filter(publication_id=publication_id).delete()
+    total = 0
+
+    club = publication.club
+    if club is not None and club.member_count <= TIMELINE_MAX_CLUB_MEMBERS:
+        for user_ids in _id_batches(ClubMembership.objects.filter(club=club), 'user_id', batch_size):
+            with transaction.atomic():
+                _push(publication, dict.fromkeys(user_ids, TIER_CLUBS))
+            total += len(user_ids)
+
+    if publication.user.follower_count <= TIMELINE_MAX_FOLLOWERS:
+        # from_user = l'auteur suivi, to_user = l'abonné
+        for user_ids in _id_batches(Follow.objects.filter(from_user_id=publication.user_id), 'to_user_id', batch_size):
+            members = set()
+            if club is not None:
+                members = set(
+                    ClubMembership.objects.filter(club=club, user_id__in=user_ids).values_list('user_id', flat=True)
+                )
+            with transaction.atomic():
+                _push(publication, {
+                    user_id: TIER_CLUBS if user_id in members else TIER_FOLLOWING for user_id in user_ids
+                })
+            total += len(user_ids)
+
+    logger.info(f"Publication {publication_id} fanned out to {total} timelines")
+
+
+def schedule_fan_out(publication):
+    # Après le COMMIT de la publication, hors de la requête
+    transaction.on_commit(lambda: timeline_queue.submit(fan_out_publication, publication.pk))
+
+
+def pushed_publications(user):
+    """Publications que le fan-out place dans le fil de user, annotées de leur rang."""
+    small_clubs = user.joined_clubs.filter(member_count__lte=TIMELINE_MAX_CLUB_MEMBERS).values('id')
+    pushed_authors = user.following.filter(follower_count__lte=TIMELINE_MAX_FOLLOWERS).values('id')
+    return ranked_publications(user).filter(Q(club__in=small_clubs) | Q(user__in=pushed_authors))
+
+
+def pulled_publications(user):
+    """Publications lues à la demande : gros clubs rejoints et auteurs très suivis."""
+    big_clubs = user.joined_clubs.filter(member_count__gt=TIMELINE_MAX_CLUB_MEMBERS).values('id')
+    celebrities = user.following.filter(follower_count__gt=TIMELINE_MAX_FOLLOWERS).values('id')
+    return ranked_publications(user).filter(Q(club__in=big_clubs) | Q(user__in=celebrities))
+
+
+def rebuild_user_timeline(user, batch_size=1000):
+    rows = pushed_publications(user).values_list('pk', 'tier', 'created_at').iterator(chunk_size=batch_size)
+    total = 0
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user=user).delete()
+        batch = []
+        for pk, tier, created_at in rows:
+            batch.append(TimelineEntry(user_id=user.pk, publication_id=pk, tier=tier, created_at=created_at))
+            if len(batch) == batch_size:
+                TimelineEntry.objects.bulk_create(batch)
+                total, batch = total + len(batch), []
+        TimelineEntry.objects.bulk_create(batch)
+    return total + len(batch)
+
+
+def rebuild_timelines(user_ids):
+    for user in User.objects.filter(pk__in=user_ids):
+        rebuild_user_timeline(user)
+
+
+def schedule_rebuild(user_ids):
+    # Club rejoint ou quitté, abonnement ajouté ou retiré : le fil de ces utilisateurs est recalculé
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: timeline_queue.submit(rebuild_timelines, user_ids))
+
+
+def _page_keys(queryset, cursor, media_type, limit):
+    if media_type:
+        queryset = with_media_type(queryset, media_type)
+    if cursor:
+        queryset = after_cursor(queryset, cursor)
+    return queryset.values_list('tier', 'created_at', 'pk')[:limit]
+
+
+def timeline_page(user, cursor=None, page_size=FEED_PAGE_SIZE, media_type=None):
+    """Même page que core.feed.feed_page (ordre et curseurs identiques), lue dans la timeline matérialisée."""
+    limit = page_size + 1
+
+    # Poussé : un parcours de timeline_user_rank_idx
+    entries = TimelineEntry.objects.filter(user=user)
+    if media_type:
+        entries = entries.filter(
+            Exists(Media.objects.filter(publication_id=OuterRef('publication_id'), media_type=media_type))
+        )
+    if cursor:
+        tier, created_at, pk = decode_cursor(cursor)
+        entries = entries.filter(
+            Q(tier__gt=tier)
+            | Q(tier=tier, created_at__lt=created_at)
+            | Q(tier=tier, created_at=created_at, publication_id__lt=pk)
+        )
+    entries = entries.order_by('tier', '-created_at', '-publication_id')
+    keys = set(entries.values_list('tier', 'created_at', 'publication_id')[:limit])
+    # Tiré : même rang que dans le fil classique, les doublons avec le poussé se confondent
+    keys.update(_page_keys(pulled_publications(user), cursor, media_type, limit))
+    if len(keys) < limit:
+        # Fil personnel épuisé : le reste des publications, comme feed_page
+        keys.update(_page_keys(tier_publications(user, TIER_OTHER), cursor, media_type, limit))
+
+    # (tier ASC, created_at DESC, id DESC)
+    keys = sorted(keys, key=lambda key: (-key[0], key[1], key[2]), reverse=True)[:limit]
+    tiers = {pk: tier for tier, _, pk in keys}
+    by_id = publications_for_display(Publication.objects.filter(pk__in=tiers), user).in_bulk()
+    rows = []
+    for _, _, pk in keys:
+        publication = by_id.get(pk)
+        if publication is not None:
+            publication.tier = tiers[pk]
+            rows.append(publication)
+
+    publications = attach_threads(rows[:page_size])
+    next_cursor = encode_cursor(publications[-1]) if len(rows) > page_size else None
+    return publications, next_cursor
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from core.media import schedule_media_processing, staging_storage
+from core.models import Media, Upload
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = getattr(settings, 'UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+UPLOAD_MAX_SIZE = getattr(settings, 'UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024)
+UPLOAD_EXPIRY_HOURS = getattr(settings, 'UPLOAD_EXPIRY_HOURS', 24)
+# Lecture du corps par blocs : la mémoire utilisée ne dépend pas de la taille du morceau
+STREAM_BLOCK_SIZE = 64 * 1024
+UPLOAD_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.pdf', '.mp4', '.mov', '.avi'}
+CHECKSUM_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def upload_state(upload):
+    return {
+        'success': True,
+        'id': str(upload.id),
+        'offset': upload.offset,
+        'size': upload.size,
+        'status': upload.status,
+        'chunk_size': UPLOAD_CHUNK_SIZE,
+    }
+
+
+def start_upload(user, publication, filename, size, checksum):
+    filename = os.path.basename(filename or '')
+    if os.path.splitext(filename)[1].lower() not in UPLOAD_EXTENSIONS:
+        raise UploadError("Type de fichier non pris en charge")
+    if not 0 < size <= UPLOAD_MAX_SIZE:
+        raise UploadError("Taille de fichier invalide")
+    checksum = (checksum or '').lower()
+    if not CHECKSUM_RE.match(checksum):
+        raise UploadError("Empreinte SHA-256 invalide")
+
+    # Le fichier est créé vide dans la zone de transit, puis rempli morceau par morceau ;
+    # le worker média publiera l'original nettoyé
+    path = staging_storage.save(filename, ContentFile(b''))
+    return Upload.objects.create(
+        user=user, publication=publication, filename=filename, path=path, size=size, checksum=checksum
+    )
+
+
+def append_chunk(upload, offset, stream, length):
+    """Écrit length octets de stream à offset ; renvoie le nouvel offset."""
+    if upload.status != 'ACTIVE':
+        raise UploadError("Téléversement déjà terminé", status=409)
+    if offset != upload.offset:
+        # Le client reprend depuis upload.offset (connexion coupée, morceau rejoué...)
+        raise UploadError("Décalage inattendu", status=409)
+    if not 0 < length <= UPLOAD_CHUNK_SIZE or offset + length > upload.size:
+        raise UploadError("Taille de morceau invalide", status=413)
+
+    remaining = length
+    # Un envoi interrompu a pu écrire au-delà de l'offset enregistré : on tronque avant d'écrire
+    with open(staging_storage.path(upload.path), 'r+b') as out:
+        out.truncate(offset)
+        out.seek(offset)
+        while remaining:
+            block = stream.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            out.write(block)
+            remaining -= len(block)
+    if remaining:
+        raise UploadError("Morceau incomplet", status=400)
+
+    updated = Upload.objects.filter(pk=upload.pk, offset=offset, status='ACTIVE').update(
+        offset=offset + length, updated_at=timezone.now()
+    )
+    if not updated:
+        raise UploadError("Téléversement modifié en parallèle", status=409)
+    upload.offset = offset + length
+    return upload.offset
+
+
+def _file_checksum(path):
+    digest = hashlib.sha256()
+    with staging_storage.open(path, 'rb') as source:
+        while block := source.read(STREAM_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete_upload(upload):
+    if upload.status != 'ACTIVE':
+        raise UploadError("Téléversement déjà terminé", status=409)
+    if upload.offset != upload.size:
+        raise UploadError("Téléversement incomplet")
+    if _file_checksum(upload.path) != upload.checksum:
+        # Contenu corrompu : on repart de zéro plutôt que de garder un fichier faux
+        Upload.objects.filter(pk=upload.pk).update(offset=0)
+        upload.offset = 0
+        raise UploadError("Empreinte SHA-256 différente, téléversement à reprendre", status=422)
+
+    with transaction.atomic():
+        media = Media.objects.create(publication=upload.publication, staged_name=upload.path)
+        upload.media = media
+        upload.status = 'COMPLETE'
+        upload.save(update_fields=['media', 'status', 'updated_at'])
+        schedule_media_processing(media)
+    logger.info(f"Upload {upload.id} completed: {upload.size} bytes attached to media {media.pk}")
+    return media
+
+
+def purge_expired_uploads(hours=UPLOAD_EXPIRY_HOURS):
+    expired = Upload.objects.filter(status='ACTIVE', updated_at__lt=timezone.now() - timedelta(hours=hours))
+    count = 0
+    for upload in expired.iterator():
+        staging_storage.delete(upload.path)
+        upload.delete()
+        count += 1
+    return count
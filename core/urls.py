@@ -1,16 +1,6 @@
 from django.urls import path
 from core import views
 from django.conf import settings
-from django.conf.urls.static import static
-from django.contrib.sitemaps.views import sitemap
-from core.sitemaps import PublicationSitemap, ClubSitemap, ChallengeSitemap, PageSitemap
-
-sitemaps = {
-    'publications': PublicationSitemap,
-    'clubs': ClubSitemap,
-    'challenges': ChallengeSitemap,
-    'pages': PageSitemap,
-}
   
 urlpatterns = [
     path('', views.home, name='home'),
@@ -18,12 +8,20 @@ urlpatterns = [
     path('login/', views.user_login, name='login'),
     path('logout/', views.user_logout, name='logout'),
     path('feed/', views.feed, name='feed'),
+    path('feed/page/', views.feed_page_json, name='feed_page'),
     path('update_profile_picture/', views.update_profile_picture, name='update_profile_picture'),
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
+    path('sitemap.xml', views.sitemap_index, name='sitemap_index'),
+    path('sitemap-<str:section>-<int:number>.xml', views.sitemap_section, name='sitemap_section'),
     path('personalized_feed/', views.personalized_feed, name='personalized_feed'),
     path('publication/create/', views.publication_create, name='publication_create'),
+    path('upload/init/', views.upload_init, name='upload_init'),
+    path('upload/<uuid:upload_id>/', views.upload_status, name='upload_status'),
+    path('upload/<uuid:upload_id>/append/', views.upload_append, name='upload_append'),
+    path('upload/<uuid:upload_id>/complete/', views.upload_complete, name='upload_complete'),
     path('react/<int:pk>/', views.react, name='react'),
+    path('react/batch/', views.react_batch, name='react_batch'),
     path('like_dislike/<int:pk>/', views.like_dislike, name='like_dislike'),
+    path('like_dislike/batch/', views.like_dislike_batch, name='like_dislike_batch'),
     path('clubs/', views.clubs, name='clubs'),
     path('club/<int:pk>/', views.club_detail, name='club_detail'),
     path('club/<int:pk>/subscribe/', views.club_subscribe, name='club_subscribe'),
@@ -31,6 +29,9 @@ urlpatterns = [
     path('club/<int:pk>/manage_admins/', views.club_manage_admins, name='club_manage_admins'),
     path('club/<int:pk>/messages/', views.club_messages, name='club_messages'),
     path('club/<int:pk>/message/reply/', views.reply_to_club_message, name='reply_to_club_message'),
+    path('club/<int:pk>/messages/history/', views.club_messages_history, name='club_messages_history'),
+    path('club/<int:pk>/messages/poll/', views.club_messages_poll, name='club_messages_poll'),
+    path('events/', views.events, name='events'),
     path('report_user/<int:pk>/', views.report_user, name='report_user'),
     path('search/', views.search, name='search'),
     path('search_suggestions/', views.search_suggestions, name='search_suggestions'),
@@ -47,6 +48,7 @@ urlpatterns = [
     path('settings/', views.settings, name='settings'),
     path('notifications/', views.notifications, name='notifications'),
     path('help/', views.help, name='help'),
+    path('cache/metrics/', views.cache_metrics, name='cache_metrics'),
     path('follow/<str:username>/', views.follow_user, name='follow_user'),
     path('club/create/', views.club_create, name='club_create'),
     path('page/create/', views.page_create, name='page_create'),
@@ -59,6 +61,7 @@ urlpatterns = [
     path('page/<int:pk>/unsubscribe/', views.page_unsubscribe, name='page_unsubscribe'),
     path('publication/<int:pk>/edit/', views.publication_edit, name='publication_edit'),
     path('reaction/<int:reaction_id>/reply/', views.reply, name='reply'),
+    path('publication/<int:pk>/thread/', views.publication_thread, name='publication_thread'),
     path('publication/<int:pk>/', views.PublicationDetailView.as_view(), name='publication_detail'),
     path('club/<int:pk>/', views.ClubDetailView.as_view(), name='club_detail'),
     path('challenge/<int:pk>/', views.ChallengeDetailView.as_view(), name='challenge_detail'),
@@ -72,5 +75,6 @@ urlpatterns = [
     path('profile-edit/hobby/remove/<int:index>/', views.remove_hobby, name='remove_hobby'),
     
     path('profile/<str:username>/', views.profile, name='profile'),
-    
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", views.serve_media, name='serve_media'),
+]
\ No newline at end of file
@@ -1,23 +1,71 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 # Au lieu de :
 from django.contrib import messages
 
 # Utilisez un alias :
 from django.contrib import messages as django_messages
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.conf import settings as django_settings  # la vue settings masque le nom
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from pathlib import Path
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseNotModified, StreamingHttpResponse
 from django.utils import timezone
 from django.views.decorators.http import require_POST
-from core.models import User, Reply,Page,Club, Publication, Reaction, Challenge, Project, Notification, Report, Message, ClubMessage, Media
+from core.models import User, Reply,Page,Club, Publication, Reaction, Challenge, Project, Notification, Report, Message, ClubMessage, ClubMembership, Media, Upload
 from core.forms import PageForm,UserRegisterForm,MediaForm, PublicationForm, ReportForm, MessageForm, ClubMessageForm
+from django.db import transaction
 from django.db.models import Q, Max, Count
 import logging
 from .forms import  ProfileDetailsForm, ProfilePictureForm
 from django.views.generic import DetailView
+from django.template.loader import render_to_string
+from core.feed import FEED_SORTS, feed_page, InvalidCursor
+from core.queries import publications_for_display
+from core.threads import InvalidThreadCursor, attach_threads, load_thread
+from core.timelines import timeline_enabled, timeline_page
+from core.votes import toggle_vote, toggle_votes, VOTE_ACTIONS
+from core.notifications import notify_club_message
+from core.club_chat import chat_delta, chat_page, last_message_id
+from core.realtime import club_channel, event_stream, get_broker, user_channel
+from core.media import stage_media
+from core.uploads import UploadError, append_chunk, complete_upload, start_upload, upload_state
+from core.conversations import (
+    INBOX_PAGE_SIZE, club_key, direct_key, inbox_entries, inbox_item, mark_club_read, mark_direct_read,
+    record_club_message, record_direct_message,
+)
+from core.search import get_search_backend
+from core.suggestions import asuggestions_for
+from core.caching import cache_anonymous_page, cached_value, metrics_snapshot
+from core.sitemaps import INDEX_FILE, SITEMAPS, section_filename, sitemap_response
+from core.files import file_response
+from django.core.paginator import Paginator
 # Configure logging
 logger = logging.getLogger(__name__)
 
+SEARCH_RESULTS_LIMIT = 50
+VALID_REACTION_TYPES = ['THOUGHT', 'ADHERE', 'SUPPORT', 'ALTERNATIVE', 'CLARIFY']
+# Variantes par lot (react/batch/, like_dislike/batch/) : publications par requête
+BATCH_MAX_PUBLICATIONS = 50
+
+
+def async_login_required(view_func):
+    # login_required de Django 5.0 n'enveloppe pas les vues async
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        # Utilisateur déjà chargé : request.user ne relit plus la session de façon synchrone
+        request.user = user
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
 
 class ClubDetailView(DetailView):
     model = Club
@@ -39,6 +87,7 @@ class PublicationDetailView(DetailView):
     template_name = 'core/publication_detail.html'  # Adjust to your template name
     context_object_name = 'publication'
     
+@cache_anonymous_page(namespaces=['clubs', 'challenges'])
 def home(request):
     clubs = Club.objects.all()[:5]
     if request.user.is_authenticated:
@@ -86,52 +135,62 @@ def user_logout(request):
 
 
 # core/views.py
+def _feed_media_type(request):
+    # ?media=video|image|pdf : seulement les publications qui ont ce type de média
+    media_type = request.GET.get('media', '').upper()
+    return media_type if media_type in ('IMAGE', 'VIDEO', 'PDF') else None
+
+def _feed_sort(request):
+    # ?sort=discussed : les plus discutées d'abord, ?sort=top : par score, sinon le classement par affinité
+    sort = request.GET.get('sort')
+    return sort if sort in FEED_SORTS else None
+
+def _feed_page(user, cursor, media_type, sort):
+    # FEED_TIMELINE : même fil lu dans la timeline matérialisée (core.timelines)
+    if sort is None and timeline_enabled():
+        return timeline_page(user, cursor=cursor, media_type=media_type)
+    return feed_page(user, cursor=cursor, media_type=media_type, sort=sort)
+
 @login_required
 def feed(request):
-    user = request.user
+    # Fil classé : clubs rejoints, puis abonnements, puis le reste, une page à la fois
+    media_type = _feed_media_type(request)
+    sort = _feed_sort(request)
+    try:
+        publications, next_cursor = _feed_page(request.user, request.GET.get('cursor'), media_type, sort)
+    except InvalidCursor:
+        return HttpResponseBadRequest("Curseur invalide")
 
-    # Récupérer les clubs auxquels l'utilisateur participe
-    joined_clubs = user.joined_clubs.all()
-
-    # Récupérer les utilisateurs que l'utilisateur suit
-    following_users = user.following.all()
-
-    # Publications des clubs auxquels l'utilisateur participe
-    club_publications = Publication.objects.filter(club__in=joined_clubs).order_by('-created_at')
-
-    # Publications des utilisateurs suivis (exclure les doublons avec club_publications)
-    following_publications = Publication.objects.filter(
-        user__in=following_users
-    ).exclude(
-        id__in=club_publications.values_list('id', flat=True)
-    ).order_by('-created_at')
-
-    # Toutes les autres publications (exclure les doublons)
-    other_publications = Publication.objects.exclude(
-        id__in=club_publications.values_list('id', flat=True)
-    ).exclude(
-        id__in=following_publications.values_list('id', flat=True)
-    ).order_by('-created_at')
-
-    # Combiner les publications dans l'ordre demandé
-    publications = list(club_publications) + list(following_publications) + list(other_publications)
-
-    # Définir les choix de réactions
-    reaction_choices = [
-        ('THOUGHT', 'Ma pensée'),
-        ('ADHERE', "J'adhère"),
-        ('SUPPORT', 'Je soutiens'),
-        ('ALTERNATIVE', 'Je propose une alternative'),
-        ('CLARIFY', 'Je demande des précisions'),
-    ]
+    return render(request, 'feed.html', {
+        'publications': publications,
+        'next_cursor': next_cursor,
+        'media_filter': media_type.lower() if media_type else '',
+        'sort': sort or '',
+        'reaction_choices': Reaction.REACTION_CHOICES,
+    })
 
-    # Rendre le template avec les publications et reaction_choices
-    return render(request, 'feed.html', {'publications': publications, 'reaction_choices': reaction_choices})
+@login_required
+def feed_page_json(request):
+    # Page suivante du fil pour le défilement infini
+    try:
+        publications, next_cursor = _feed_page(
+            request.user, request.GET.get('cursor'), _feed_media_type(request), _feed_sort(request)
+        )
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'error': 'Curseur invalide'}, status=400)
+
+    html = render_to_string('publications/publication_list.html', {
+        'publications': publications,
+        'reaction_choices': Reaction.REACTION_CHOICES,
+    }, request=request)
+    return JsonResponse({'success': True, 'html': html, 'next_cursor': next_cursor})
 
 @login_required
 def personalized_feed(request):
     clubs = request.user.joined_clubs.all()
-    publications = Publication.objects.filter(club__in=clubs).order_by('-created_at')
+    publications = publications_for_display(
+        Publication.objects.filter(club__in=clubs).order_by('-created_at'), request.user
+    )
     return render(request, 'personalized_feed.html', {'publications': publications})
 
 
@@ -151,7 +210,7 @@ def publication_create(request):
             # Gestion des fichiers multiples
             files = request.FILES.getlist('file')  # Récupère tous les fichiers
             for file in files:
-                Media.objects.create(publication=publication, file=file)
+                stage_media(publication, file)
             
             logger.info(f"Publication created by {request.user.username} with {len(files)} media files")
             return redirect('feed')
@@ -162,149 +221,230 @@ def publication_create(request):
 
 
 
+# Téléversement par morceaux : init, append (corps brut, ?offset=), complete
+def _upload_error(error):
+    return JsonResponse({'success': False, 'error': error.message}, status=error.status)
+
 @require_POST
 @login_required
-def react(request, pk):
-    publication = get_object_or_404(Publication, pk=pk)
-    reaction_type = request.POST.get('type', 'THOUGHT')  # 'THOUGHT' est déjà la valeur par défaut
-    comment = request.POST.get('comment', '').strip()
+def upload_init(request):
+    publication = get_object_or_404(Publication, pk=request.POST.get('publication') or 0, user=request.user)
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Taille invalide'}, status=400)
+    try:
+        upload = start_upload(request.user, publication, request.POST.get('filename'), size,
+                              request.POST.get('checksum'))
+    except UploadError as error:
+        return _upload_error(error)
+    return JsonResponse(upload_state(upload), status=201)
 
-    valid_reaction_types = ['THOUGHT', 'ADHERE', 'SUPPORT', 'ALTERNATIVE', 'CLARIFY']
-    
-    if reaction_type not in valid_reaction_types:
+@login_required
+def upload_status(request, upload_id):
+    upload = get_object_or_404(Upload, pk=upload_id, user=request.user)
+    return JsonResponse(upload_state(upload))
+
+@require_POST
+@login_required
+def upload_append(request, upload_id):
+    upload = get_object_or_404(Upload, pk=upload_id, user=request.user)
+    # Corps brut uniquement : un multipart serait entièrement analysé par Django avant la vue
+    if request.content_type != 'application/octet-stream':
+        return JsonResponse({'success': False, 'error': 'Content-Type application/octet-stream attendu'}, status=415)
+    try:
+        offset = int(request.GET.get('offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Décalage invalide'}, status=400)
+    try:
+        append_chunk(upload, offset, request, length)
+    except UploadError as error:
+        upload.refresh_from_db(fields=['offset', 'status'])
+        return JsonResponse({**upload_state(upload), 'success': False, 'error': error.message}, status=error.status)
+    return JsonResponse(upload_state(upload))
+
+@require_POST
+@login_required
+def upload_complete(request, upload_id):
+    upload = get_object_or_404(Upload, pk=upload_id, user=request.user)
+    try:
+        media = complete_upload(upload)
+    except UploadError as error:
+        return _upload_error(error)
+    return JsonResponse({**upload_state(upload), 'media_id': media.pk})
+
+
+def _reaction_error(reaction_type, comment):
+    if reaction_type not in VALID_REACTION_TYPES:
         return JsonResponse({'success': False, 'error': 'Type de réaction invalide'})
-    
     if not comment:
         return JsonResponse({'success': False, 'error': 'Le commentaire ne peut pas être vide'})
-    
-    reaction = Reaction(
+    return None
+
+def _reaction_data(reaction):
+    return {
+        'reaction_type_label': reaction.get_type_display(),
+        'comment': reaction.comment,
+        'created_at': reaction.created_at.strftime('%d/%m/%Y %H:%M')
+    }
+
+def _batch_publication_ids(request):
+    # publication=1&publication=2... ; None si la liste est vide, trop longue ou invalide
+    values = request.POST.getlist('publication')
+    if not values or len(values) > BATCH_MAX_PUBLICATIONS or not all(value.isdigit() for value in values):
+        return None
+    return list(dict.fromkeys(int(value) for value in values))
+
+@sync_to_async
+def _create_reactions(user, publications, reaction_type, comment):
+    # Un seul COMMIT pour le lot ; chaque réaction passe par save() pour ses signaux (résumés, compteurs)
+    created_at = timezone.now()
+    with transaction.atomic():
+        return [
+            Reaction.objects.create(
+                user=user, publication=publication, type=reaction_type, comment=comment, created_at=created_at
+            )
+            for publication in publications
+        ]
+
+@require_POST
+@async_login_required
+async def react(request, pk):
+    publication = await aget_object_or_404(Publication, pk=pk)
+    reaction_type = request.POST.get('type', 'THOUGHT')  # 'THOUGHT' est déjà la valeur par défaut
+    comment = request.POST.get('comment', '').strip()
+
+    error = _reaction_error(reaction_type, comment)
+    if error is not None:
+        return error
+
+    reaction = await Reaction.objects.acreate(
         user=request.user,
         publication=publication,
         type=reaction_type,
         comment=comment,
         created_at=timezone.now()
     )
-    reaction.save()
     logger.info(f"Reaction {reaction_type} added by {request.user.username} on publication {pk}")
-    
+
     return JsonResponse({
         'success': True,
         'username': request.user.username,
         'user_id': request.user.id,
-        'reaction_type_label': reaction.get_type_display(),
-        'comment': reaction.comment,
-        'created_at': reaction.created_at.strftime('%d/%m/%Y %H:%M')
+        **_reaction_data(reaction),
     })
 
 @require_POST
-@login_required
+@async_login_required
+async def react_batch(request):
+    publication_ids = _batch_publication_ids(request)
+    if publication_ids is None:
+        return JsonResponse({'success': False, 'error': 'Liste de publications invalide'}, status=400)
+    reaction_type = request.POST.get('type', 'THOUGHT')
+    comment = request.POST.get('comment', '').strip()
 
-def like_dislike(request, pk):
-    publication = get_object_or_404(Publication, pk=pk)
+    error = _reaction_error(reaction_type, comment)
+    if error is not None:
+        return error
+
+    publications = [publication async for publication in Publication.objects.filter(pk__in=publication_ids)]
+    reactions = await _create_reactions(request.user, publications, reaction_type, comment)
+    logger.info(f"Reaction {reaction_type} added by {request.user.username} on {len(reactions)} publications")
+
+    return JsonResponse({
+        'success': True,
+        'username': request.user.username,
+        'user_id': request.user.id,
+        'reactions': [{'publication_id': reaction.publication_id, **_reaction_data(reaction)} for reaction in reactions],
+    })
+
+@require_POST
+@async_login_required
+async def like_dislike(request, pk):
+    publication = await aget_object_or_404(Publication.objects.only('id', 'likes', 'dislikes'), pk=pk)
     action = request.POST.get('action')
-    user = request.user
 
-    if action not in ['like', 'dislike']:
+    if action not in VOTE_ACTIONS:
         return JsonResponse({'success': False, 'error': 'Action invalide'}, status=400)
 
-    # Initialiser les compteurs si nécessaire
-    if publication.likes is None:
-        publication.likes = 0
-    if publication.dislikes is None:
-        publication.dislikes = 0
+    # Une écriture sur la table de liaison + mise à jour atomique des compteurs ;
+    # la transaction n'a pas d'équivalent async : un seul passage par un thread
+    result = await sync_to_async(toggle_vote)(publication, request.user, action)
 
-    liked = user in publication.liked_by.all()
-    disliked = user in publication.disliked_by.all()
+    return JsonResponse({'success': True, **result})
 
-    if action == 'like':
-        if liked:
-            publication.liked_by.remove(user)
-            publication.likes -= 1
-        else:
-            publication.liked_by.add(user)
-            publication.likes += 1
-            if disliked:
-                publication.disliked_by.remove(user)
-                publication.dislikes -= 1
-    elif action == 'dislike':
-        if disliked:
-            publication.disliked_by.remove(user)
-            publication.dislikes -= 1
-        else:
-            publication.disliked_by.add(user)
-            publication.dislikes += 1
-            if liked:
-                publication.liked_by.remove(user)
-                publication.likes -= 1
+@require_POST
+@async_login_required
+async def like_dislike_batch(request):
+    publication_ids = _batch_publication_ids(request)
+    if publication_ids is None:
+        return JsonResponse({'success': False, 'error': 'Liste de publications invalide'}, status=400)
+    action = request.POST.get('action')
 
-    publication.save()
+    if action not in VOTE_ACTIONS:
+        return JsonResponse({'success': False, 'error': 'Action invalide'}, status=400)
 
-    return JsonResponse({
-        'success': True,
-        'likes': publication.likes,
-        'dislikes': publication.dislikes,
-        'user_liked': user in publication.liked_by.all(),
-        'user_disliked': user in publication.disliked_by.all()
-    })
+    # Les publications inconnues sont absentes de la réponse
+    results = await sync_to_async(toggle_votes)(publication_ids, request.user, action)
+
+    return JsonResponse({'success': True, 'publications': results})
 
 
 @login_required
 def clubs(request):
-    clubs = Club.objects.all()
+    clubs = cached_value('clubs_list', ['clubs'], lambda: list(Club.objects.all()))
     return render(request, 'clubs.html', {'clubs': clubs})
 
 # core/views.py
 @login_required
 def club_detail(request, pk):
     club = get_object_or_404(Club, pk=pk)
-    publications = Publication.objects.filter(club=club).order_by('-created_at')
-    reaction_choices = [
-        ('THOUGHT', "Ma pensée"),
-        ('ADHERE', "J'adhère"),
-        ('SUPPORT', 'Je soutiens'),
-        ('ALTERNATIVE', 'Je propose une alternative'),
-        ('CLARIFY', 'Je demande des précisions'),
-    ]
-    return render(request, 'club_detail.html', {'club': club, 'publications': publications, 'reaction_choices': reaction_choices})
+    publications = attach_threads(publications_for_display(
+        Publication.objects.filter(club=club).order_by('-created_at'), request.user
+    ))
+    return render(request, 'club_detail.html', {'club': club, 'publications': publications, 'reaction_choices': Reaction.REACTION_CHOICES})
 
 
 # views.py
 @require_POST
-@login_required
-def club_subscribe(request, pk):
-    club = get_object_or_404(Club, pk=pk)
-    if request.user not in club.members.all():
-        club.members.add(request.user)
+@async_login_required
+async def club_subscribe(request, pk):
+    club = await aget_object_or_404(Club, pk=pk)
+    if not await club.members.filter(pk=request.user.pk).aexists():
+        await club.members.aadd(request.user)
+        await club.arefresh_from_db(fields=['member_count'])
         return JsonResponse({
             'success': True,
             'message': f"Vous avez rejoint le club {club.name}",
             'is_member': True,
-            'members_count': club.members.count()
+            'members_count': club.member_count
         })
     return JsonResponse({
         'success': False,
         'message': "Vous êtes déjà membre de ce club",
         'is_member': True,
-        'members_count': club.members.count()
+        'members_count': club.member_count
     }, status=400)
 
 @require_POST
-@login_required
-def club_unsubscribe(request, pk):
-    club = get_object_or_404(Club, pk=pk)
-    if request.user in club.members.all():
-        club.members.remove(request.user)
+@async_login_required
+async def club_unsubscribe(request, pk):
+    club = await aget_object_or_404(Club, pk=pk)
+    if await club.members.filter(pk=request.user.pk).aexists():
+        await club.members.aremove(request.user)
+        await club.arefresh_from_db(fields=['member_count'])
         return JsonResponse({
             'success': True,
             'message': 'Désabonnement réussi !',
             'is_member': False,
-            'members_count': club.members.count()
+            'members_count': club.member_count
         })
     return JsonResponse({
         'success': False,
         'message': "Vous n'êtes pas membre de ce club",
         'is_member': False,
-        'members_count': club.members.count()
+        'members_count': club.member_count
     }, status=400)
 
 @require_POST
@@ -468,22 +608,18 @@ def report_user(request, pk):
 @login_required
 def search(request):
     query = request.GET.get('query', '')
-    users = User.objects.filter(username__icontains=query) if query else User.objects.none()
-    clubs = Club.objects.filter(name__icontains=query) if query else Club.objects.none()
-    return render(request, 'search.html', {'users': users, 'clubs': clubs, 'query': query})
-
-@login_required
-def search_suggestions(request):
+    backend = get_search_backend()
+    users = backend.search_objects('user', query, limit=SEARCH_RESULTS_LIMIT, prefix=True) if query else []
+    clubs = backend.search_objects('club', query, limit=SEARCH_RESULTS_LIMIT, prefix=True) if query else []
+    user_club_ids = set(request.user.joined_clubs.values_list('id', flat=True))
+    return render(request, 'search.html', {'users': users, 'clubs': clubs, 'query': query, 'user_club_ids': user_club_ids})
+
+@async_login_required
+async def search_suggestions(request):
     query = request.GET.get('query', '')
-    logger.info(f"Search suggestions query: {query}")
-    users = User.objects.filter(username__icontains=query)[:5]
-    clubs = Club.objects.filter(name__icontains=query)[:5]
-    data = {
-        'users': [{'id': user.id, 'username': user.username} for user in users],
-        'clubs': [{'id': club.id, 'name': club.name, 'is_member': request.user in club.members.all()} for club in clubs]
-    }
-    logger.info(f"Search suggestions response: {data}")
-    return JsonResponse(data)
+    logger.debug(f"Search suggestions query: {query}")
+    # Index préfixe en mémoire + cache court ; l'appartenance aux clubs en une requête
+    return JsonResponse(await asuggestions_for(request.user, query))
 
 @login_required
 def send_message(request, pk):
@@ -498,6 +634,7 @@ def send_message(request, pk):
             message.sender = request.user
             message.recipient = recipient
             message.save()
+            record_direct_message(message)
             Notification.objects.create(
                 user=recipient,
                 message=f"Nouveau message de {request.user.username}"
@@ -511,6 +648,8 @@ def send_message(request, pk):
     else:
         form = MessageForm()
 
+    mark_direct_read(request.user, recipient)
+
     # Récupérer l'historique des messages
     messages = Message.objects.filter(
         (Q(sender=request.user) & Q(recipient=recipient)) |
@@ -525,68 +664,19 @@ def send_message(request, pk):
 
 @login_required
 def messages(request):
-    # Conversations avec les utilisateurs
-    user_conversations = Message.objects.filter(
-        Q(sender=request.user) | Q(recipient=request.user)
-    ).values('sender', 'recipient').annotate(
-        last_message_time=Max('created_at'),
-        unread_count=Count('id', filter=Q(is_read=False, recipient=request.user))
-    ).order_by('-last_message_time')
-
-    # Conversations dans les clubs
-    club_conversations = Club.objects.filter(
-        members=request.user
-    ).annotate(
-        last_message_time=Max('clubmessage__created_at'),
-        unread_count=Count('clubmessage__id', 
-            filter=Q(clubmessage__is_read=False) & ~Q(clubmessage__sender=request.user))
-    ).order_by('-last_message_time')
-
-    conversations = []
-    
-    # Ajouter les conversations utilisateur
-    for conv in user_conversations:
-        other_user_id = conv['recipient'] if conv['sender'] == request.user.id else conv['sender']
-        other_user = User.objects.get(id=other_user_id)
-        last_message = Message.objects.filter(
-            Q(sender=request.user, recipient=other_user) | 
-            Q(sender=other_user, recipient=request.user)
-        ).order_by('-created_at').first()
-        
-        conversations.append({
-            'type': 'user',
-            'id': other_user.id,
-            'name': other_user.username,
-            'last_message': last_message.content if last_message else '',
-            'last_message_time': conv['last_message_time'],
-            'unread_count': conv['unread_count'],
-            'avatar_url': f"https://ui-avatars.com/api/?name={other_user.username}&background=random"
-        })
-
-    # Ajouter les conversations club
-    for club in club_conversations:
-        last_message = ClubMessage.objects.filter(club=club).order_by('-created_at').first()
-        
-        conversations.append({
-            'type': 'club',
-            'id': club.id,
-            'name': club.name,
-            'last_message': last_message.content if last_message else '',
-            'last_message_time': club.last_message_time,
-            'unread_count': club.unread_count,
-            'avatar_url': f"https://ui-avatars.com/api/?name=C&background=random"
-        })
+    # Index des conversations : une ligne par conversation, déjà triée et comptée
+    paginator = Paginator(inbox_entries(request.user), INBOX_PAGE_SIZE)
+    page = paginator.get_page(request.GET.get('page'))
+    conversations = [inbox_item(entry) for entry in page]
 
-    # Trier toutes les conversations par date
-    conversations.sort(key=lambda x: x['last_message_time'] or datetime.min, reverse=True)
-
-    return render(request, 'messages.html', {'conversations': conversations})
+    return render(request, 'messages.html', {'conversations': conversations, 'page_obj': page})
 
 @require_POST
-@login_required
-def reply_to_club_message(request, pk):
-    club = get_object_or_404(Club, pk=pk)
-    if request.user not in club.members.all():
+@async_login_required
+async def reply_to_club_message(request, pk):
+    club = await aget_object_or_404(Club, pk=pk)
+    # Appartenance : un EXISTS plutôt que la liste des membres
+    if not await ClubMembership.objects.filter(club=club, user=request.user).aexists():
         return JsonResponse({'success': False, 'error': 'Accès non autorisé'}, status=403)
 
     parent_id = request.POST.get('parent_id')
@@ -596,19 +686,20 @@ def reply_to_club_message(request, pk):
         return JsonResponse({'success': False, 'error': 'Le message ne peut pas être vide'}, status=400)
 
     try:
-        parent_message = ClubMessage.objects.get(id=parent_id, club=club)
+        parent_message = await ClubMessage.objects.aget(id=parent_id, club=club)
     except ClubMessage.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Message parent introuvable'}, status=404)
     
-    message = ClubMessage.objects.create(
+    message = await ClubMessage.objects.acreate(
         sender=request.user,
         club=club,
         content=content,
         parent=parent_message
     )
 
-    # Marquer comme lu par l'expéditeur
-    message.is_read.add(request.user)
+    # L'expéditeur a lu le fil jusqu'à son propre message
+    await sync_to_async(mark_club_read)(request.user, club)
+    await sync_to_async(record_club_message)(message)
 
     return JsonResponse({
         'success': True,
@@ -618,65 +709,40 @@ def reply_to_club_message(request, pk):
         'message_id': message.id
     })
 
-@login_required
-def search_messages(request):
+@async_login_required
+async def search_messages(request):
     query = request.GET.get('query', '')
     logger.info(f"Search messages query: {query}")
-    user_convs = Message.objects.filter(
-        Q(sender=request.user) | Q(recipient=request.user),
-        Q(content__icontains=query)
+    backend = get_search_backend()
+
+    # Messages trouvés par l'index plein texte, restreints aux conversations de l'utilisateur
+    user_convs = [conv async for conv in backend.filter(
+        Message.objects.filter(Q(sender=request.user) | Q(recipient=request.user)), 'message', query, prefix=True
     ).values('sender', 'recipient').annotate(
-        last_message_time=Max('created_at'),
-        unread_count=Count('id', filter=Q(is_read=False, recipient=request.user))
-    ).order_by('-last_message_time')[:10]
-    
-    club_convs = ClubMessage.objects.filter(
-        club__members=request.user,
-        content__icontains=query
+        last_message_time=Max('created_at')
+    ).order_by('-last_message_time')[:10]]
+
+    club_convs = [conv async for conv in backend.filter(
+        ClubMessage.objects.filter(club__members=request.user), 'club_message', query, prefix=True
     ).values('club').annotate(
-        last_message_time=Max('created_at'),
-        unread_count=Count('id', filter=Q(club__members=request.user))
-    ).order_by('-last_message_time')[:10]
-    
-    conversations = []
-    for conv in user_convs:
-        other_user_id = conv['recipient'] if conv['sender'] == request.user.id else conv['sender']
-        try:
-            other_user = User.objects.get(id=other_user_id)
-            last_message = Message.objects.filter(
-                Q(sender=request.user, recipient=other_user) | Q(sender=other_user, recipient=request.user)
-            ).order_by('-created_at').first()
-            conversations.append({
-                'type': 'user',
-                'id': other_user.id,
-                'name': other_user.username,
-                'last_message': last_message.content if last_message else '',
-                'last_message_time': conv['last_message_time'].strftime('%d/%m/%Y %H:%M') if conv['last_message_time'] else '',
-                'unread_count': conv['unread_count']
-            })
-        except User.DoesNotExist:
-            logger.warning(f"User ID {other_user_id} not found")
-    
-    for conv in club_convs:
-        try:
-            club = Club.objects.get(id=conv['club'])
-            last_message = ClubMessage.objects.filter(club=club).order_by('-created_at').first()
-            conversations.append({
-                'type': 'club',
-                'id': club.id,
-                'name': club.name,
-                'last_message': last_message.content if last_message else '',
-                'last_message_time': conv['last_message_time'].strftime('%d/%m/%Y %H:%M') if conv['last_message_time'] else '',
-                'unread_count': conv['unread_count']
-            })
-        except Club.DoesNotExist:
-            logger.warning(f"Club ID {conv['club']} not found")
-    
-    conversations.sort(key=lambda x: x['last_message_time'] or '', reverse=True)
+        last_message_time=Max('created_at')
+    ).order_by('-last_message_time')[:10]]
+
+    keys = [
+        direct_key(conv['sender'], conv['recipient']) for conv in user_convs
+    ] + [club_key(conv['club']) for conv in club_convs]
+
+    # Dernier message et non lus : lus dans l'index des conversations
+    conversations = [
+        inbox_item(entry)
+        async for entry in inbox_entries(request.user).filter(conversation__key__in=keys)
+    ]
+    for conv in conversations:
+        conv['last_message_time'] = conv['last_message_time'].strftime('%d/%m/%Y %H:%M') if conv['last_message_time'] else ''
     
-    response_data = {'conversations': conversations}
-    logger.info(f"Search messages response: {response_data}")
-    return JsonResponse(response_data)
+    # Pas de contenu de message dans les logs : seulement le nombre de résultats
+    logger.debug(f"Search messages: {len(conversations)} conversation(s) found")
+    return JsonResponse({'conversations': conversations})
 
 @login_required
 def club_messages(request, pk):
@@ -692,15 +758,13 @@ def club_messages(request, pk):
             message.club = club
             message.save()
             
-            # Marquer comme lu par l'expéditeur
-            message.is_read.add(request.user)
+            # L'expéditeur a lu le fil jusqu'à son propre message
+            mark_club_read(request.user, club)
             
-            # Créer des notifications pour les membres
-            for member in club.members.exclude(id=request.user.id):
-                Notification.objects.create(
-                    user=member,
-                    message=f"Nouveau message dans {club.name}: {message.content[:50]}..."
-                )
+            record_club_message(message)
+
+            # Notifications des membres : en lots, en tâche de fond après le COMMIT
+            notify_club_message(message)
             return JsonResponse({
                 'success': True,
                 'sender': request.user.username,
@@ -710,47 +774,104 @@ def club_messages(request, pk):
                 'message_id': message.id
             })
 
-    # Récupérer tous les messages du club avec leurs réponses
-    messages = ClubMessage.objects.filter(club=club, parent__isnull=True).order_by('created_at')
-    
+    mark_club_read(request.user, club)
+
+    # Derniers messages seulement, réponses chargées en une requête ; le reste via l'historique
+    messages, has_more = chat_page(club)
+
     return render(request, 'club_messages.html', {
         'club': club,
         'messages': messages,
+        'has_more': has_more,
+        'oldest_id': messages[0].pk if messages else 0,
+        'last_id': last_message_id(messages),
         'form': ClubMessageForm()
     })
 
 
+def _chat_id_param(request, name):
+    value = request.GET.get(name, '')
+    return int(value) if value.isdigit() else None
+
+@login_required
+def club_messages_history(request, pk):
+    # Défilement vers le haut : la page de messages précédant before_id
+    club = get_object_or_404(Club, pk=pk)
+    if not club.members.filter(pk=request.user.pk).exists():
+        return JsonResponse({'success': False, 'error': 'Accès non autorisé'}, status=403)
+    before_id = _chat_id_param(request, 'before_id')
+    if before_id is None:
+        return JsonResponse({'success': False, 'error': 'Paramètre before_id invalide'}, status=400)
+
+    messages, has_more = chat_page(club, before_id=before_id)
+    html = ''.join(
+        render_to_string('club_message.html', {'message': message}, request=request) for message in messages
+    )
+    return JsonResponse({
+        'success': True,
+        'html': html,
+        'has_more': has_more,
+        'oldest_id': messages[0].pk if messages else before_id,
+    })
+
+@login_required
+def club_messages_poll(request, pk):
+    # Polling : seulement ce qui a été posté après after_id, 304 s'il n'y a rien
+    club = get_object_or_404(Club, pk=pk)
+    if not club.members.filter(pk=request.user.pk).exists():
+        return JsonResponse({'success': False, 'error': 'Accès non autorisé'}, status=403)
+    after_id = _chat_id_param(request, 'after_id')
+    if after_id is None:
+        return JsonResponse({'success': False, 'error': 'Paramètre after_id invalide'}, status=400)
+
+    messages, replies, has_more = chat_delta(club, after_id)
+    if not messages and not replies:
+        return HttpResponseNotModified()
+    return JsonResponse({
+        'success': True,
+        'messages': [
+            {'id': message.pk, 'html': render_to_string('club_message.html', {'message': message}, request=request)}
+            for message in messages
+        ],
+        'replies': [
+            {
+                'id': reply.pk,
+                'parent_id': reply.parent_id,
+                'html': render_to_string('club_message_reply.html', {'reply': reply}, request=request),
+            }
+            for reply in replies
+        ],
+        'last_id': last_message_id(messages + replies),
+        'has_more': has_more,
+    })
+
+
 @login_required
 def challenges(request):
-    challenges = Challenge.objects.all()
+    challenges = cached_value('challenges_list', ['challenges'], lambda: list(Challenge.objects.all()))
     return render(request, 'challenges.html', {'challenges': challenges})
 
 def profile(request, username):
     profile_user = get_object_or_404(User, username=username)
     
-    publications = Publication.objects.filter(user=profile_user)
-    followers_count = profile_user.followers.count()
-    following_count = profile_user.following.count()
-    publications_count = publications.count()
-    clubs_created_count = Club.objects.filter(creator=profile_user).count()
-    clubs_joined_count = Club.objects.filter(members=profile_user).count()
-    pages_created_count = Page.objects.filter(creator=profile_user).count()
-    pages_followed_count = Page.objects.filter(subscribers=profile_user).count()
-
+    publications = publications_for_display(
+        Publication.objects.filter(user=profile_user).order_by('-created_at'), request.user
+    )
     is_following = False
     if request.user.is_authenticated:
-        is_following = request.user in profile_user.followers.all()
+        is_following = profile_user.followers.filter(pk=request.user.pk).exists()
 
     context = {
         'profile_user': profile_user,
         'publications': publications,
-        'followers_count': followers_count,
-        'following_count': following_count,
-        'publications_count': publications_count,
-        'clubs_created_count': clubs_created_count,
-        'clubs_joined_count': clubs_joined_count,
-        'pages_created_count': pages_created_count,
-        'pages_followed_count': pages_followed_count,
+        # Compteurs dénormalisés : aucune requête COUNT(*)
+        'followers_count': profile_user.follower_count,
+        'following_count': profile_user.following_count,
+        'publications_count': profile_user.publication_count,
+        'clubs_created_count': profile_user.clubs_created_count,
+        'clubs_joined_count': profile_user.clubs_joined_count,
+        'pages_created_count': profile_user.pages_created_count,
+        'pages_followed_count': profile_user.pages_followed_count,
         'is_following': is_following,
         'is_subscribed': is_following  # Fusionner is_subscribed avec is_following
     }
@@ -787,7 +908,7 @@ def publication_edit(request, pk):
 
 @login_required
 def mentorship(request):
-    mentors = User.objects.filter(is_mentor=True)
+    mentors = cached_value('mentors_list', ['mentors'], lambda: list(User.objects.filter(is_mentor=True)))
     return render(request, 'mentorship.html', {'mentors': mentors})
 
 @login_required
@@ -844,9 +965,32 @@ def reply(request, reaction_id):
         })
     except Reaction.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Réaction introuvable.'})
+
+@login_required
+def publication_thread(request, pk):
+    # Suite d'un fil replié : ?cursor= pour le premier niveau, ?parent=<réaction> pour ses réponses
+    parent_id = request.GET.get('parent')
+    if parent_id is not None and not parent_id.isdigit():
+        return JsonResponse({'success': False, 'error': 'Réaction invalide'}, status=400)
+    try:
+        thread = load_thread(pk, parent_id=int(parent_id) if parent_id else None, cursor=request.GET.get('cursor'))
+    except InvalidThreadCursor:
+        return JsonResponse({'success': False, 'error': 'Curseur invalide'}, status=400)
+    if thread is None:
+        return JsonResponse({'success': False, 'error': 'Réaction introuvable.'}, status=404)
+
+    html = render_to_string('publications/thread.html', {
+        'thread': thread,
+        'publication_id': pk,
+        'parent_id': parent_id,
+    }, request=request)
+    return JsonResponse({'success': True, 'html': html, **thread.as_dict()})
+
 @login_required
 def history(request):
-    publications = Publication.objects.filter(user=request.user)
+    publications = publications_for_display(
+        Publication.objects.filter(user=request.user).order_by('-created_at'), request.user
+    )
     return render(request, 'history.html', {'publications': publications})
 
 @login_required
@@ -855,12 +999,61 @@ def settings(request):
 
 @login_required
 def notifications(request):
-    notifications = Notification.objects.filter(user=request.user)
+    notifications = list(Notification.objects.filter(user=request.user).order_by('-created_at'))
+    # Les résumés lus repartent de zéro au prochain message
+    Notification.objects.filter(user=request.user, read=False).update(read=True)
     return render(request, 'notifications.html', {'notifications': notifications})
 
+@cache_anonymous_page()
 def help(request):
     return render(request, 'help.html')
 
+async def events(request):
+    # Flux Server-Sent Events : messages privés, notifications et, avec ?club=<id>, la messagerie du club
+    if not isinstance(request, ASGIRequest):
+        # Sous WSGI un flux ouvert bloquerait un worker ; 204 arrête EventSource, la page garde le polling
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Authentification requise'}, status=403)
+
+    channels = [user_channel(user.pk)]
+    club_id = request.GET.get('club')
+    if club_id is not None:
+        if not club_id.isdigit():
+            return JsonResponse({'success': False, 'error': 'Club invalide'}, status=400)
+        if not await ClubMembership.objects.filter(club_id=club_id, user_id=user.pk).aexists():
+            return JsonResponse({'success': False, 'error': 'Accès non autorisé'}, status=403)
+        channels.append(club_channel(club_id))
+
+    response = StreamingHttpResponse(event_stream(get_broker().subscribe(channels)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx : pas de mise en tampon, chaque événement part aussitôt
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def sitemap_index(request):
+    return sitemap_response(request, INDEX_FILE)
+
+def sitemap_section(request, section, number):
+    if section not in SITEMAPS:
+        raise Http404
+    return sitemap_response(request, section_filename(section, number))
+
+def serve_media(request, path):
+    # Médias servis aussi hors DEBUG : Range, ETag et envoi délégué au frontal (core.files)
+    try:
+        full_path = Path(safe_join(django_settings.MEDIA_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404
+    return file_response(request, full_path, sendfile_name=path)
+
+@login_required
+def cache_metrics(request):
+    if not request.user.is_staff:
+        return redirect('home')
+    return JsonResponse(metrics_snapshot())
+
 @login_required
 def follow_user(request, username):
     target_user = get_object_or_404(User, username=username)
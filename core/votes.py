@@ -0,0 +1,121 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core.models import Publication
+
+LikeVote = Publication.liked_by.through
+DislikeVote = Publication.disliked_by.through
+
+VOTE_ACTIONS = ('like', 'dislike')
+
+
+def _add_vote(model, publication_id, user_id):
+    # INSERT sur la table de liaison ; un doublon concurrent ne compte pas deux fois
+    try:
+        with transaction.atomic():
+            model.objects.create(publication_id=publication_id, user_id=user_id)
+    except IntegrityError:
+        return 0
+    return 1
+
+
+def _remove_vote(model, publication_id, user_id):
+    deleted, _ = model.objects.filter(publication_id=publication_id, user_id=user_id).delete()
+    return -deleted
+
+
+def toggle_vote(publication, user, action):
+    """Bascule le like/dislike de user et met à jour les compteurs sans course."""
+    if action not in VOTE_ACTIONS:
+        raise ValueError(action)
+
+    same, other = (LikeVote, DislikeVote) if action == 'like' else (DislikeVote, LikeVote)
+
+    with transaction.atomic():
+        delta_same = _remove_vote(same, publication.pk, user.pk)
+        active = delta_same == 0
+        delta_other = 0
+        if active:
+            delta_same = _add_vote(same, publication.pk, user.pk)
+            delta_other = _remove_vote(other, publication.pk, user.pk)
+
+        likes_delta, dislikes_delta = (
+            (delta_same, delta_other) if action == 'like' else (delta_other, delta_same)
+        )
+        if likes_delta or dislikes_delta:
+            # Expressions F() : l'incrément est fait par la base, pas en Python
+            publication.likes = F('likes') + likes_delta
+            publication.dislikes = F('dislikes') + dislikes_delta
+            publication.save(update_fields=['likes', 'dislikes'])
+            publication.refresh_from_db(fields=['likes', 'dislikes'])
+
+    return {
+        'likes': publication.likes,
+        'dislikes': publication.dislikes,
+        'user_liked': action == 'like' and active,
+        'user_disliked': action == 'dislike' and active,
+    }
+
+
+def toggle_votes(publication_ids, user, action):
+    """toggle_vote sur un lot de publications : une transaction et un nombre de requêtes fixe."""
+    if action not in VOTE_ACTIONS:
+        raise ValueError(action)
+
+    same, other = (LikeVote, DislikeVote) if action == 'like' else (DislikeVote, LikeVote)
+
+    with transaction.atomic():
+        ids = set(Publication.objects.filter(pk__in=publication_ids).values_list('pk', flat=True))
+        votes = same.objects.filter(user_id=user.pk, publication_id__in=ids)
+        # Déjà votées : le vote est retiré ; les autres le reçoivent et perdent le vote opposé
+        removed = set(votes.values_list('publication_id', flat=True))
+        votes.delete()
+        added = ids - removed
+        same.objects.bulk_create(
+            [same(publication_id=pk, user_id=user.pk) for pk in added], ignore_conflicts=True
+        )
+        other.objects.filter(user_id=user.pk, publication_id__in=added).delete()
+
+        # Compteurs recomptés depuis les tables de liaison : un doublon concurrent ignoré ne compte pas
+        publications = Publication.objects.filter(pk__in=ids)
+        publications.update(likes=vote_count_subquery(LikeVote), dislikes=vote_count_subquery(DislikeVote))
+        counters = list(publications.values_list('pk', 'likes', 'dislikes'))
+    return {
+        pk: {
+            'likes': likes,
+            'dislikes': dislikes,
+            'user_liked': action == 'like' and pk in added,
+            'user_disliked': action == 'dislike' and pk in added,
+        }
+        for pk, likes, dislikes in counters
+    }
+
+
+def vote_count_subquery(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(publication_id=OuterRef('pk'))
+            .order_by()
+            .values('publication_id')
+            .annotate(total=Count('id'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def drifted_publications():
+    return Publication.objects.annotate(
+        real_likes=vote_count_subquery(LikeVote),
+        real_dislikes=vote_count_subquery(DislikeVote),
+    ).exclude(likes=F('real_likes'), dislikes=F('real_dislikes'))
+
+
+def reconcile_vote_counters():
+    """Recalcule likes/dislikes depuis les tables de liaison, en un seul UPDATE."""
+    return Publication.objects.filter(pk__in=drifted_publications().values('pk')).update(
+        likes=vote_count_subquery(LikeVote),
+        dislikes=vote_count_subquery(DislikeVote),
+    )
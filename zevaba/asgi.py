@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zevaba.settings')
+# Sous ASGI, l'ORM d'une requête tourne dans un thread propre à cette requête : une connexion
+# persistante y serait abandonnée à la fin. Connexion par requête, sauf DB_CONN_MAX_AGE explicite.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()